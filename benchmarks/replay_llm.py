@@ -0,0 +1,123 @@
+import json
+import logging
+import threading
+import uuid
+from pathlib import Path
+from typing import Any, Optional
+
+import litellm
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIPTS_DIR = Path(__file__).parent / "transcripts"
+
+
+def _first_content(messages: list) -> str:
+    for message in messages:
+        content = message.get("content") if isinstance(message, dict) else getattr(message, "content", None)
+        if content:
+            return str(content)
+    return ""
+
+
+def _turn_index(messages: list) -> int:
+    """Position in the conversation: the number of assistant replies already in it."""
+    return sum(1 for m in messages if (m.get("role") if isinstance(m, dict) else getattr(m, "role", None)) == "assistant")
+
+
+def build_response(model: str, turn: dict, messages: list) -> litellm.ModelResponse:
+    """Turns one transcript entry ({"content", "tool_calls": [{"name", "arguments"}]}) into a LiteLLM response."""
+    tool_calls = [
+        {
+            "id": f"call_{uuid.uuid4().hex[:12]}",
+            "type": "function",
+            "function": {"name": call["name"], "arguments": json.dumps(call.get("arguments", {}))}
+        }
+        for call in turn.get("tool_calls", [])
+    ]
+    message = {"role": "assistant", "content": turn.get("content")}
+    if tool_calls:
+        message["tool_calls"] = tool_calls
+    # Rough, deterministic token counts so budgets, traces and metrics behave like a real run
+    prompt_tokens = sum(len(str(m.get("content") or "")) for m in messages if isinstance(m, dict)) // 4
+    completion_tokens = len(json.dumps(turn)) // 4
+    return litellm.ModelResponse(
+        model=model,
+        choices=[{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_calls else "stop"}],
+        usage={"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+    )
+
+
+class ReplayLLM:
+    """
+    Deterministic stand-in for LiteLLM that replays a recorded transcript.
+    A transcript lists conversations; the first whose "match" substring occurs in the call's first
+    message answers it, with the turn picked by how many assistant replies the conversation already has
+    (the last turn repeats once the recording runs out). Install it with
+    `src.llm.async_provider.set_completion_backend(ReplayLLM.load("crew_edit"))`.
+    """
+    def __init__(self, transcript: dict):
+        self.transcript = transcript
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, name_or_path: str) -> "ReplayLLM":
+        path = Path(name_or_path)
+        if not path.suffix:
+            path = TRANSCRIPTS_DIR / f"{name_or_path}.json"
+        return cls(json.loads(path.read_text(encoding="utf-8")))
+
+    def _select(self, messages: list) -> list[dict]:
+        first = _first_content(messages)
+        for conversation in self.transcript["conversations"]:
+            if conversation.get("match", "") in first:
+                return conversation["turns"]
+        raise LookupError(f"No transcript conversation matches prompt: {first[:80]!r}")
+
+    async def __call__(self, model: str, messages: list, **kwargs) -> litellm.ModelResponse:
+        with self._lock:
+            self.calls += 1
+        turns = self._select(messages)
+        turn = turns[min(_turn_index(messages), len(turns) - 1)]
+        return build_response(model, turn, messages)
+
+
+class RecordingLLM:
+    """
+    Passes calls through to LiteLLM and appends every reply to a transcript file that ReplayLLM can
+    replay later. Each conversation is keyed by the first 60 characters of its first message.
+    """
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._conversations: dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    async def __call__(self, **kwargs) -> Any:
+        response = await litellm.acompletion(**kwargs)
+        message = response.choices[0].message
+        turn: dict[str, Any] = {"content": message.content}
+        if getattr(message, "tool_calls", None):
+            turn["tool_calls"] = [
+                {"name": tc.function.name, "arguments": _loads(tc.function.arguments)}
+                for tc in message.tool_calls
+            ]
+        key = _first_content(kwargs["messages"])[:60]
+        with self._lock:
+            self._conversations.setdefault(key, []).append(turn)
+            self._save()
+        return response
+
+    def _save(self):
+        transcript = {
+            "description": "Recorded with benchmarks.replay_llm.RecordingLLM",
+            "conversations": [{"match": key, "turns": turns} for key, turns in self._conversations.items()]
+        }
+        self.path.write_text(json.dumps(transcript, indent=2), encoding="utf-8")
+
+
+def _loads(arguments: Optional[str]) -> Any:
+    try:
+        return json.loads(arguments or "{}")
+    except json.JSONDecodeError:
+        return arguments
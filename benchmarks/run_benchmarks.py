@@ -0,0 +1,309 @@
+"""
+Offline benchmark suite for nexus-mcp.
+
+Builds a synthetic git repository, replaces the LLM with a deterministic replay of a recorded
+transcript, and times the server's hot paths stage by stage: SandboxedFS tools, GitSandbox
+isolation/handoff (alone and with the read tools run inside the task worktree), affected-test selection (with a correctness check of relative imports),
+a full `build_graph().invoke`, and a `call_tool` delegation round trip.
+
+    python -m benchmarks.run_benchmarks --files 200 --iterations 10
+    python -m benchmarks.run_benchmarks --json after.json --baseline before.json
+
+Latency is measured without tracemalloc; peak memory comes from one extra traced run per stage.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.replay_llm import ReplayLLM
+from benchmarks.synthetic_repo import make_repo
+
+TASK = "Add a memoizing wrapper around Service0.handle in a new module and check that it runs."
+
+
+class SubprocessCounter:
+    """Counts every subprocess.Popen started (git, bash, ...) while installed."""
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+        self._original = subprocess.Popen.__init__
+
+    def __enter__(self):
+        counter = self
+        original = self._original
+
+        def counting_init(popen_self, *args, **kwargs):
+            with counter._lock:
+                counter.count += 1
+            original(popen_self, *args, **kwargs)
+
+        subprocess.Popen.__init__ = counting_init
+        return self
+
+    def __exit__(self, *exc):
+        subprocess.Popen.__init__ = self._original
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    if len(ordered) == 1:
+        return ordered[0]
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def run_stage(name: str, func: Callable[[int], None], iterations: int,
+              setup: Optional[Callable[[int], None]] = None) -> dict:
+    """Times `func(i)` over the iterations (`setup(i)` runs untimed before each), then once more under tracemalloc."""
+    samples = []
+    with SubprocessCounter() as counter:
+        for i in range(iterations):
+            if setup:
+                setup(i)
+            start = time.perf_counter()
+            func(i)
+            samples.append(time.perf_counter() - start)
+    subprocesses = counter.count
+
+    if setup:
+        setup(iterations)
+    tracemalloc.start()
+    try:
+        func(iterations)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    warm = samples[1:] or samples
+    result = {
+        "stage": name,
+        "iterations": iterations,
+        "cold_ms": samples[0] * 1000,
+        "p50_ms": percentile(warm, 50) * 1000,
+        "p95_ms": percentile(warm, 95) * 1000,
+        "mean_ms": statistics.fmean(warm) * 1000,
+        "peak_mem_kb": peak / 1024,
+        "subprocesses_per_iter": subprocesses / iterations
+    }
+    print(
+        f"{name:<28} cold {result['cold_ms']:9.1f}ms  p50 {result['p50_ms']:9.1f}ms  p95 {result['p95_ms']:9.1f}ms"
+        f"  peak {result['peak_mem_kb']:9.0f}KB  procs/iter {result['subprocesses_per_iter']:5.1f}",
+        flush=True
+    )
+    return result
+
+
+def bench_fs(repo: Path, iterations: int) -> list[dict]:
+    from src.nexus.tools.fs import SandboxedFS
+    fs = SandboxedFS(str(repo))
+    return [
+        run_stage("fs.list_files", lambda i: fs.list_files("."), iterations),
+        run_stage("fs.read_codebase_outline", lambda i: fs.read_codebase_outline("."), iterations),
+        run_stage("fs.find_definition", lambda i: fs.find_definition(f"Service{i}.handle"), iterations),
+        run_stage("fs.find_references", lambda i: fs.find_references(f"helper_{i}"), iterations),
+        run_stage("fs.grep_codebase.bm25", lambda i: fs.grep_codebase("validate payload bounds"), iterations),
+        run_stage("fs.grep_codebase.regex", lambda i: fs.grep_codebase(r"def filler_\d+_1\b", regex=True), iterations),
+        run_stage("fs.read_file_chunk", lambda i: fs.read_file_chunk(f"pkg/module_{i}.py", 10, 60), iterations),
+        run_stage("fs.write_file", lambda i: fs.write_file(f"scratch/out_{i}.py", "x = 1\n" * 200), iterations),
+    ]
+
+
+def bench_git_sandbox(repo: Path, iterations: int) -> list[dict]:
+    from src.core.git_sandbox import GitSandbox
+
+    def cycle(i: int):
+        sandbox = GitSandbox(str(repo), isolation_mode="worktree")
+        sandbox.enter_sandbox(f"bench-git-{i}", isolate=True)
+        (Path(sandbox.work_dir) / f"change_{i}.txt").write_text("benchmark change\n", encoding="utf-8")
+        sandbox.prepare_pr_handoff()
+        sandbox.cleanup_sandbox()
+
+    return [run_stage("git_sandbox.cycle", cycle, iterations)]
+
+
+def bench_worktree_fs(repo: Path, iterations: int) -> list[dict]:
+    """
+    A sandbox cycle with the read tools a delegation starts with, run against the task worktree.
+    The main checkout's caches are warmed first: a new worktree should reuse them, not re-parse
+    and re-tokenize the whole repository.
+    """
+    from src.core.git_sandbox import GitSandbox
+    from src.nexus.tools.fs import SandboxedFS
+    main = SandboxedFS(str(repo))
+    main.read_codebase_outline(".")
+    main.grep_codebase("validate payload bounds")
+
+    def cycle(i: int):
+        sandbox = GitSandbox(str(repo), isolation_mode="worktree")
+        sandbox.enter_sandbox(f"bench-worktree-{i}", isolate=True)
+        fs = SandboxedFS(str(sandbox.work_dir))
+        fs.read_codebase_outline(".")
+        fs.find_definition(f"Service{i}.handle")
+        fs.grep_codebase("validate payload bounds")
+        sandbox.cleanup_sandbox()
+
+    return [run_stage("git_sandbox.cycle+fs", cycle, iterations)]
+
+
+# (import line in pkg/tests/test_a.py, changed file, tests expected to be selected)
+IMPACT_CASES = [
+    ("from . import helpers", "pkg/tests/helpers.py", ["pkg/tests/test_a.py"]),
+    ("from . import helpers", "pkg/helpers.py", []),
+    ("from .. import helpers", "pkg/helpers.py", ["pkg/tests/test_a.py"]),
+    ("from .helpers import run", "pkg/tests/helpers.py", ["pkg/tests/test_a.py"]),
+    ("from pkg.tests import helpers", "pkg/tests/helpers.py", ["pkg/tests/test_a.py"]),
+]
+
+
+def check_impact_selection(workdir: Path):
+    """Regression check: test selection must follow relative-only imports to the right module."""
+    from src.nexus.tools.verification import ImportGraph
+    for index, (import_line, changed, expected) in enumerate(IMPACT_CASES):
+        root = workdir / f"impact-{index}"
+        (root / "pkg" / "tests").mkdir(parents=True)
+        for rel in ("pkg/__init__.py", "pkg/helpers.py", "pkg/tests/__init__.py", "pkg/tests/helpers.py"):
+            (root / rel).write_text("def run():\n    return 1\n", encoding="utf-8")
+        (root / "pkg" / "tests" / "test_a.py").write_text(f"{import_line}\n\n\ndef test_a():\n    pass\n", encoding="utf-8")
+        selected = ImportGraph(str(root)).affected_tests([changed])
+        if selected != expected:
+            raise RuntimeError(f"Test selection for '{import_line}' changing {changed}: expected {expected}, got {selected}")
+
+
+def bench_impact(repo: Path, iterations: int) -> list[dict]:
+    from src.nexus.tools.verification import ImportGraph
+    check_impact_selection(repo.parent)
+    return [run_stage("verify.affected_tests", lambda i: ImportGraph(str(repo)).affected_tests([f"pkg/module_{i}.py"]), iterations)]
+
+
+def bench_graph(repo: Path, iterations: int) -> list[dict]:
+    from src.core.git_sandbox import GitSandbox
+    from src.nexus.graph import build_graph
+    sandboxes: dict[int, GitSandbox] = {}
+
+    def setup(i: int):
+        sandbox = GitSandbox(str(repo), isolation_mode="worktree")
+        sandbox.enter_sandbox(f"bench-graph-{i}", isolate=True)
+        sandboxes[i] = sandbox
+
+    def invoke(i: int):
+        state = build_graph().invoke({
+            "task_description": TASK,
+            "target_dir": str(sandboxes[i].work_dir),
+            "retries": 0,
+            "status": "started",
+            "plan": "",
+            "crew_result": "",
+            "verification_errors": ""
+        })
+        if state.get("status") != "verification_passed":
+            raise RuntimeError(f"Graph run ended with status {state.get('status')}")
+
+    try:
+        return [run_stage("graph.invoke", invoke, iterations, setup=setup)]
+    finally:
+        for sandbox in sandboxes.values():
+            sandbox.cleanup_sandbox()
+
+
+def bench_call_tool(repo: Path, iterations: int) -> list[dict]:
+    from src.server import call_tool
+
+    async def delegate(i: int):
+        accepted = await call_tool("delegate_to_nexus", {"task": TASK, "target_dir": str(repo), "task_id": f"bench-tool-{i}"})
+        job_id = accepted[0].text.split("job_id: ")[1].split()[0]
+        result = await call_tool("get_task_result", {"job_id": job_id, "wait_seconds": 300})
+        if "Task Complete" not in result[0].text:
+            raise RuntimeError(f"Delegation failed: {result[0].text[:300]}")
+
+    return [run_stage("call_tool.delegate_to_nexus", lambda i: asyncio.run(delegate(i)), iterations)]
+
+
+def compare(results: list[dict], baseline_path: str, tolerance: float) -> bool:
+    """Prints stages whose p50 got slower than the baseline by more than `tolerance`. Returns True if none did."""
+    baseline = {r["stage"]: r for r in json.loads(Path(baseline_path).read_text(encoding="utf-8"))["results"]}
+    ok = True
+    for result in results:
+        before = baseline.get(result["stage"])
+        if not before or before["p50_ms"] <= 0:
+            continue
+        change = result["p50_ms"] / before["p50_ms"] - 1
+        if change > tolerance:
+            ok = False
+            print(f"REGRESSION {result['stage']}: p50 {before['p50_ms']:.1f}ms -> {result['p50_ms']:.1f}ms ({change:+.0%})")
+    return ok
+
+
+STAGES = {
+    "fs": bench_fs, "impact": bench_impact, "git": bench_git_sandbox, "worktree": bench_worktree_fs,
+    "graph": bench_graph, "call_tool": bench_call_tool
+}
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline nexus-mcp benchmarks against a synthetic repository.")
+    parser.add_argument("--files", type=int, default=200, help="Python modules in the synthetic repo")
+    parser.add_argument("--lines", type=int, default=100, help="Filler lines per module")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Comma-separated subset of {', '.join(STAGES)}")
+    parser.add_argument("--transcript", default="crew_edit", help="Transcript name in benchmarks/transcripts or a JSON path")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--baseline", help="Results JSON of an earlier run to compare p50 latencies against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p50 slowdown vs. the baseline (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    workdir = Path(tempfile.mkdtemp(prefix="nexus-bench-"))
+    # Isolate every cache and disable the LLM response cache so runs are comparable
+    os.environ["NEXUS_CACHE_DIR"] = str(workdir / "cache")
+    os.environ["NEXUS_LLM_CACHE"] = "0"
+    os.environ["SWARM_MODEL"] = "replay/benchmark"
+    for role in ("PLANNER", "CODER", "VERIFIER"):
+        os.environ.pop(f"SWARM_ROUTE_{role}", None)
+
+    from src.llm.async_provider import set_completion_backend
+    replay = ReplayLLM.load(args.transcript)
+    set_completion_backend(replay)
+
+    # The server starts its parse workers at startup (src/index.py); they are not part of any stage
+    from src.nexus.tools.outline import warm_parse_pool
+    warm_parse_pool().join()
+
+    repo = make_repo(workdir / "repo", files=args.files, filler_lines=args.lines)
+    print(f"Synthetic repo: {args.files} modules x ~{args.lines} filler lines at {repo}")
+
+    results = []
+    for stage in args.stages.split(","):
+        results.extend(STAGES[stage.strip()](repo, args.iterations))
+    print(f"Replayed {replay.calls} LLM calls.")
+
+    report = {
+        "files": args.files,
+        "lines": args.lines,
+        "iterations": args.iterations,
+        "transcript": args.transcript,
+        "python": sys.version.split()[0],
+        "cpus": os.cpu_count(),
+        "results": results
+    }
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    if args.baseline and not compare(results, args.baseline, args.tolerance):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
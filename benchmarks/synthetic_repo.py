@@ -0,0 +1,53 @@
+import subprocess
+from pathlib import Path
+
+MODULE_TEMPLATE = '''"""Synthetic module {index} generated for benchmarks."""
+{imports}
+
+
+class Service{index}:
+    """Handles payloads for shard {index}."""
+
+    def __init__(self, factor: int = {factor}):
+        self.factor = factor
+
+    def validate(self, payload: int) -> bool:
+        # validate payload bounds before handling
+        return 0 <= payload < 10_000
+
+    def handle(self, payload: int) -> int:
+        if not self.validate(payload):
+            raise ValueError("payload out of range")
+        return helper_{index}(payload) * self.factor
+
+
+def helper_{index}(value: int) -> int:
+    return value + {index}
+
+'''
+
+
+def make_repo(root: Path, files: int = 200, filler_lines: int = 100) -> Path:
+    """
+    Writes a git repository of `files` inter-importing Python modules under pkg/, each padded with
+    `filler_lines` small functions, and commits it. Deterministic, so LLM transcripts can refer to its symbols.
+    """
+    root = Path(root)
+    package = root / "pkg"
+    package.mkdir(parents=True, exist_ok=True)
+    for index in range(files):
+        # Each module imports its predecessor, giving find_references and the import graph real edges
+        imports = f"from pkg.module_{index - 1} import helper_{index - 1}\n" if index else ""
+        source = MODULE_TEMPLATE.format(index=index, imports=imports, factor=index % 7 + 1)
+        source += "".join(
+            f"\ndef filler_{index}_{n}(value: int) -> int:\n    return value * {n} + helper_{index}(value)\n"
+            for n in range(filler_lines // 3)
+        )
+        (package / f"module_{index}.py").write_text(source, encoding="utf-8")
+    (root / "README.md").write_text(f"# Synthetic repo\n\n{files} modules for nexus-mcp benchmarks.\n", encoding="utf-8")
+
+    git = ["git", "-c", "user.name=nexus-bench", "-c", "user.email=bench@nexus.local"]
+    subprocess.run(["git", "init", "-q", "-b", "main"], cwd=root, check=True)
+    subprocess.run(["git", "add", "-A"], cwd=root, check=True)
+    subprocess.run([*git, "commit", "-q", "-m", "Synthetic benchmark repo"], cwd=root, check=True)
+    return root
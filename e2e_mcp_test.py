@@ -6,7 +6,10 @@ import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from src.server import call_tool
-from src.core.lightning_optim import optimizer
+
+# Project the live agent works on: first CLI argument or NEXUS_E2E_TARGET_DIR. There is deliberately
+# no default: the delegation below edits files, so the target must be chosen explicitly.
+TARGET_DIR = sys.argv[1] if len(sys.argv) > 1 else os.getenv("NEXUS_E2E_TARGET_DIR", "")
 
 async def run_e2e_test():
     print("========================================")
@@ -17,9 +20,10 @@ async def run_e2e_test():
     tool_name = "delegate_to_nexus"
     arguments = {
         "task": "Perform a final open-source polish. 1. Use 'run_bash' to delete: 'hello_world.py', 'e2e_success.py', 'test_graph.py', 'plan.md', and 'mcp-swarm.log'. 2. Create a standard MIT 'LICENSE' file with current year and user 'Mabasha'. 3. Create a robust '.gitignore' that ignores '.venv/', '.env', '__pycache__/', and '.pytest_cache/'. 4. Verify that 'e2e_mcp_test.py' still runs correctly after the cleanup.",
-        "target_dir": "C:/Multi-agent-orchestation",
+        "target_dir": TARGET_DIR,
         "task_id": "opensource-cleanup-final",
-        "isolate": False
+        # Changes land on a nexus-feature-* branch in a worktree, never on the target's current branch
+        "isolate": True
     }
     
     print(f"\n[Client] Sending Tool Request: {tool_name}")
@@ -27,7 +31,12 @@ async def run_e2e_test():
     
     try:
         # Trigger the actual MCP exposed function
-        results = await call_tool(name=tool_name, arguments=arguments)
+        accepted = await call_tool(name=tool_name, arguments=arguments)
+        print(accepted[0].text)
+        
+        # Delegations run in the background; block on the result like an IDE client would
+        job_id = accepted[0].text.split("job_id: ")[1].split()[0]
+        results = await call_tool(name="get_task_result", arguments={"job_id": job_id, "wait_seconds": 300})
         
         print("\n========================================")
         print("✅ E2E TEST COMPLETED SUCCESSFULLY")
@@ -49,4 +58,7 @@ async def run_e2e_test():
         traceback.print_exc()
 
 if __name__ == "__main__":
+    if not TARGET_DIR:
+        sys.exit("Usage: python e2e_mcp_test.py <target_dir>  (or set NEXUS_E2E_TARGET_DIR)\n"
+                 "The live agent edits files in that repository (on an isolated branch).")
     asyncio.run(run_e2e_test())
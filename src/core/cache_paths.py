@@ -0,0 +1,97 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Callable, Generic, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Evict a directory's in-memory per-root singletons (indexes, listers, git sessions, ...) when it goes away
+_release_hooks: list[Callable[[Path], None]] = []
+
+
+def get_cache_root() -> Path:
+    """
+    Root directory for everything Nexus persists between runs (worktrees, indexes, caches).
+    Override with NEXUS_CACHE_DIR; defaults to ~/.cache/nexus-mcp.
+    """
+    root = os.getenv("NEXUS_CACHE_DIR") or str(Path.home() / ".cache" / "nexus-mcp")
+    return Path(root).expanduser().resolve()
+
+
+def repo_key(repo_dir: str | Path) -> str:
+    """Stable, filesystem-safe key for a repository: its folder name plus a short hash of the absolute path."""
+    resolved = Path(repo_dir).resolve()
+    digest = hashlib.sha256(str(resolved).encode("utf-8")).hexdigest()[:12]
+    return f"{resolved.name or 'root'}-{digest}"
+
+
+def repo_cache_dir(repo_dir: str | Path, kind: str) -> Path:
+    """Per-repository cache directory for one kind of artifact, created on demand."""
+    path = get_cache_root() / kind / repo_key(repo_dir)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def on_repo_released(hook: Callable[[Path], None]) -> Callable[[Path], None]:
+    """Registers `hook(resolved_dir)` to run when a working directory is released (see release_repo_caches)."""
+    _release_hooks.append(hook)
+    return hook
+
+
+class RootRegistry(Generic[T]):
+    """
+    One long-lived object per resolved root directory (an index, a lister, a store...), built by
+    `factory(root)` on first use and forgotten when the directory is released. `on_release(obj)`
+    runs for a forgotten object, e.g. to stop a process it owns.
+    """
+    def __init__(self, factory: Callable[[Path], T], on_release: Optional[Callable[[T], None]] = None):
+        self._factory = factory
+        self._on_release = on_release
+        self._items: dict[str, T] = {}
+        self._lock = threading.Lock()
+        on_repo_released(self.release)
+
+    def get(self, root_dir: str | Path) -> T:
+        key = str(Path(root_dir).resolve())
+        with self._lock:
+            if key not in self._items:
+                self._items[key] = self._factory(Path(key))
+            return self._items[key]
+
+    def release(self, root_dir: str | Path):
+        with self._lock:
+            item = self._items.pop(str(Path(root_dir).resolve()), None)
+        if item is not None and self._on_release is not None:
+            self._on_release(item)
+
+    def release_all(self):
+        with self._lock:
+            items = list(self._items.values())
+            self._items.clear()
+        if self._on_release is not None:
+            for item in items:
+                self._on_release(item)
+
+
+def release_repo_caches(repo_dir: str | Path):
+    """
+    Forgets everything cached for a working directory that no longer exists (e.g. a removed task
+    worktree): its per-root objects held in memory, and its cache directory of every kind.
+    """
+    resolved = Path(repo_dir).resolve()
+    for hook in list(_release_hooks):
+        try:
+            hook(resolved)
+        except Exception as e:
+            logger.warning(f"[Cache] Could not release {resolved} from {getattr(hook, '__module__', hook)}: {e}")
+    root = get_cache_root()
+    if root.is_dir():
+        key = repo_key(resolved)
+        for kind_dir in root.iterdir():
+            if (kind_dir / key).is_dir():
+                shutil.rmtree(kind_dir / key, ignore_errors=True)
@@ -1,42 +1,86 @@
 import os
+import re
+import shutil
 import subprocess
+import tempfile
+import threading
 from pathlib import Path
+from typing import Optional
 import logging
 
+from src.core.cache_paths import release_repo_caches, repo_cache_dir
+from src.core.git_session import GitSession, close_git_session, get_git_session
+from src.core.lightning_optim import optimizer
+
 logger = logging.getLogger(__name__)
 
+# "worktree": every task gets its own `git worktree` in the cache dir (parallel-safe, IDE checkout untouched).
+# "branch": legacy stash + checkout of a feature branch in the user's working tree.
+ISOLATION_MODES = ("worktree", "branch")
+DEFAULT_ISOLATION_MODE = os.getenv("NEXUS_ISOLATION_MODE", "worktree")
+
+# Worktree bookkeeping lives in the shared .git directory, so mutations are serialized per repository
+# (keyed on that directory, so a linked worktree and its main checkout share the lock).
+_repo_locks: dict[str, threading.Lock] = {}
+_repo_locks_guard = threading.Lock()
+
+def _repo_lock(repo_dir: Path) -> threading.Lock:
+    with _repo_locks_guard:
+        return _repo_locks.setdefault(str(repo_dir), threading.Lock())
+
 class GitSandbox:
     """
     Ensures that the Swarm never edits the user's active working branch
-    by forcing a git checkout into a temporary nexus feature branch.
+    by giving each task its own git worktree (or, in legacy mode, forcing a
+    git checkout into a temporary nexus feature branch).
     """
-    def __init__(self, target_dir: str):
+    def __init__(self, target_dir: str, isolation_mode: Optional[str] = None):
         self.target_dir = Path(target_dir).resolve()
         if not self.target_dir.exists() or not self.target_dir.is_dir():
             raise ValueError(f"Target directory {self.target_dir} does not exist.")
+
+        self.isolation_mode = isolation_mode or DEFAULT_ISOLATION_MODE
+        if self.isolation_mode not in ISOLATION_MODES:
+            raise ValueError(f"Unknown isolation mode '{self.isolation_mode}'. Expected one of {ISOLATION_MODES}.")
+
+        # Directory the nexus actually edits; differs from target_dir once a worktree is entered.
+        self.work_dir = self.target_dir
+        self.worktree_path: Optional[Path] = None
+        self.task_id: Optional[str] = None
+        self._common_dir: Optional[Path] = None
             
-    def run_cmd(self, cmd: list[str]) -> str:
-        """Run a subprocess command inside the target directory."""
-        try:
-            result = subprocess.run(
-                cmd,
-                cwd=str(self.target_dir),
-                check=True,
-                capture_output=True,
-                text=True
-            )
-            return result.stdout.strip()
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Git Sandbox Command Failed: {cmd} -> {e.stderr}")
-            raise RuntimeError(f"Git constraint error: {e.stderr}")
+    def run_cmd(self, cmd: list[str], cwd: Optional[Path] = None, env: Optional[dict] = None,
+                input_text: Optional[str] = None) -> str:
+        """Run a subprocess command inside the target directory (or the given cwd). `env` adds to the inherited environment."""
+        with optimizer.span("subprocess.git", kind="subprocess", command=" ".join(cmd)[:200]):
+            try:
+                result = subprocess.run(
+                    cmd,
+                    cwd=str(cwd or self.target_dir),
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                    env={**os.environ, **env} if env else None,
+                    input=input_text
+                )
+                return result.stdout.strip()
+            except subprocess.CalledProcessError as e:
+                logger.error(f"Git Sandbox Command Failed: {cmd} -> {e.stderr}")
+                raise RuntimeError(f"Git constraint error: {e.stderr}")
+
+    def session(self, work_dir: Optional[Path] = None) -> GitSession:
+        """Shared long-lived git session (cat-file process, cached refs) of the target or the given directory."""
+        return get_git_session(work_dir or self.target_dir)
 
     def enter_sandbox(self, task_id: str, isolate: bool = True) -> str:
         """
-        If isolate=True (default), creates and pushes the Nexus to an isolated branch.
+        If isolate=True (default), creates and pushes the Nexus to an isolated branch,
+        checked out in a dedicated worktree when isolation_mode is "worktree".
         If isolate=False, applies changes directly to the current branch.
-        Returns the name of the active branch.
+        Returns the name of the active branch; the directory to edit is `self.work_dir`.
         """
-        current_branch = self.run_cmd(["git", "branch", "--show-current"])
+        self.task_id = task_id
+        current_branch = self.session().current_branch()
         
         if not isolate:
             logger.info(f"Direct Mode enabled. Nexus will operate on the current branch: {current_branch}")
@@ -48,6 +92,9 @@ class GitSandbox:
         if not (self.target_dir / ".git").exists():
              raise ValueError("The target directory is not a Git repository. To protect your file system, the Nexus MCP requires Git initialized projects.")
 
+        if self.isolation_mode == "worktree":
+            return self._enter_worktree(task_id, branch_name)
+
         logger.info(f"Host IDE is on branch: {current_branch}")
         try:
             # Stash any current uncommitted work to prevent bleeding into the nexus branch
@@ -56,11 +103,7 @@ class GitSandbox:
             logger.warning(f"Git stash threw a warning/error (often safe if nothing to stash): {e}")
 
         try:
-            # Check if branch exists reliably
-            branches_raw = self.run_cmd(["git", "branch"])
-            existing_branches = [b.strip().replace("* ", "") for b in branches_raw.split("\n") if b.strip()]
-            
-            if branch_name in existing_branches:
+            if self.session().branch_exists(branch_name):
                  self.run_cmd(["git", "checkout", branch_name])
                  logger.info(f"Nexus resumed on existing branch: {branch_name}")
             else:
@@ -71,9 +114,126 @@ class GitSandbox:
             logger.error(f"Failed to isolate or resume branch: {e}")
             return current_branch
             
+    def _enter_worktree(self, task_id: str, branch_name: str) -> str:
+        """
+        Checks the task branch out into its own worktree under the cache directory.
+        An existing worktree for the same task_id is reused as-is so resumed tasks keep their files.
+        """
+        safe_id = re.sub(r"[^A-Za-z0-9._-]", "-", task_id)
+        worktree_path = repo_cache_dir(self.target_dir, "worktrees") / safe_id
+
+        session = self.session()
+        with _repo_lock(self.common_dir()):
+            registered = session.worktrees()
+            if worktree_path.exists() and registered.get(str(worktree_path)):
+                logger.info(f"Nexus resumed existing worktree for {branch_name}: {worktree_path}")
+            else:
+                # Drop registrations whose directories vanished (only when there are any), and any stale unregistered directory
+                if str(worktree_path) in registered or not all(registered.values()):
+                    self.run_cmd(["git", "worktree", "prune"])
+                if worktree_path.exists():
+                    shutil.rmtree(worktree_path)
+
+                if session.branch_exists(branch_name):
+                    self.run_cmd(["git", "worktree", "add", str(worktree_path), branch_name])
+                else:
+                    self.run_cmd(["git", "worktree", "add", "-b", branch_name, str(worktree_path), "HEAD"])
+                logger.info(f"Nexus isolated to worktree {worktree_path} on branch: {branch_name}")
+
+        self.worktree_path = worktree_path
+        self.work_dir = worktree_path
+        return branch_name
+
+    def snapshot_tree(self, work_dir: Optional[Path] = None) -> str:
+        """
+        Writes a working directory as it is now (tracked changes and untracked files) as a git tree
+        object, using a throwaway index so the sandbox's own index is left untouched.
+        """
+        work_dir = work_dir or self.work_dir
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {"GIT_INDEX_FILE": os.path.join(tmp, "index")}
+            self.run_cmd(["git", "read-tree", "HEAD"], cwd=work_dir, env=env)
+            self.run_cmd(["git", "add", "-A"], cwd=work_dir, env=env)
+            return self.run_cmd(["git", "write-tree"], cwd=work_dir, env=env)
+
+    def commit_handoff(self) -> tuple[str, str]:
+        """
+        Freezes what the nexus achieved as two git object ids whose diff is the result, so it can be
+        served later without keeping the diff (or the worktree) around. In worktree mode the changes
+        are committed to the task branch, so they survive the worktree being pruned and can be merged
+        or pushed directly; otherwise the working directory is snapshotted as a tree.
+        """
+        session = self.session(self.work_dir)
+        base = session.resolve("HEAD")
+        if base is None:
+            raise RuntimeError(f"Git constraint error: HEAD of {self.work_dir} does not point to a commit")
+        if self.worktree_path is None:
+            return base, self.snapshot_tree(self.work_dir)
+
+        # Plumbing instead of `git commit`: the staged tree is compared with HEAD's by object id
+        self.run_cmd(["git", "add", "-A"], cwd=self.worktree_path)
+        tree = self.run_cmd(["git", "write-tree"], cwd=self.worktree_path)
+        if tree == session.resolve("HEAD^{tree}"):
+            return base, base
+        message = f"[Nexus-MCP] {self.task_id}"
+        commit_cmd = ["git", "commit-tree", tree, "-p", base, "-m", message]
+        result = subprocess.run(commit_cmd, cwd=str(self.worktree_path), capture_output=True, text=True)
+        if result.returncode == 0:
+            head = result.stdout.strip()
+        else:
+            # No committer identity configured for this repository
+            identity = ["-c", "user.name=Nexus-MCP", "-c", "user.email=nexus-mcp@localhost"]
+            head = self.run_cmd([commit_cmd[0], *identity, *commit_cmd[1:]], cwd=self.worktree_path)
+        self.run_cmd(["git", "update-ref", "-m", f"commit: {message}", "HEAD", head, base], cwd=self.worktree_path)
+        session.invalidate()
+        return base, head
+
     def prepare_pr_handoff(self) -> str:
+        """Gathers the full diff of what the nexus achieved (see commit_handoff)."""
+        base, head = self.commit_handoff()
+        return self.run_cmd(["git", "diff", base, head], cwd=self.work_dir)
+
+    def common_dir(self) -> Path:
         """
-        Gathers the diff of what the nexus achieved to send back to the MCP Client
+        The repository's shared .git directory, remembered on first use: the target may be a linked
+        worktree that is removed while this sandbox still has worktrees of its own to clean up.
         """
-        diff = self.run_cmd(["git", "diff", "HEAD"])
-        return diff
+        if self._common_dir is None:
+            self._common_dir = self.session().common_dir
+        return self._common_dir
+
+    def add_detached_worktree(self, path: Path, tree: str):
+        """Adds a detached worktree of this repository at `path` and fills it with the given tree object."""
+        with _repo_lock(self.common_dir()):
+            self.run_cmd(["git", "worktree", "add", "--detach", str(path), "HEAD"])
+        self.run_cmd(["git", "read-tree", "-u", "--reset", tree], cwd=path)
+
+    def remove_worktrees(self, paths: list[Path]):
+        """Removes linked worktrees of this repository (deleting leftovers git refuses to remove) and prunes their registrations."""
+        for path in paths:
+            close_git_session(path)
+        # Run from the main checkout: the target itself may be a worktree that is gone by now
+        main_checkout = self.common_dir().parent
+        with _repo_lock(self.common_dir()):
+            for path in paths:
+                try:
+                    self.run_cmd(["git", "worktree", "remove", "--force", str(path)], cwd=main_checkout)
+                except RuntimeError:
+                    shutil.rmtree(path, ignore_errors=True)
+            self.run_cmd(["git", "worktree", "prune"], cwd=main_checkout)
+        for path in paths:
+            release_repo_caches(path)
+
+    def cleanup_sandbox(self):
+        """Removes the task worktree after a successful handoff. The task branch itself is kept."""
+        if self.worktree_path is None:
+            return
+        close_git_session(self.worktree_path)
+        with _repo_lock(self.common_dir()):
+            # Also deletes the worktree's registration, so no prune is needed
+            self.run_cmd(["git", "worktree", "remove", "--force", str(self.worktree_path)])
+        # Indexes, listings and snapshots of the worktree are keyed on its path and would never be used again
+        release_repo_caches(self.worktree_path)
+        logger.info(f"Pruned worktree {self.worktree_path}")
+        self.worktree_path = None
+        self.work_dir = self.target_dir
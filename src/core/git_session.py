@@ -0,0 +1,227 @@
+import atexit
+import logging
+import os
+import subprocess
+import threading
+from pathlib import Path
+from typing import Optional
+
+from src.core.cache_paths import RootRegistry
+from src.core.lightning_optim import optimizer
+
+logger = logging.getLogger(__name__)
+
+
+def _locate_git_dirs(work_dir: Path) -> tuple[Path, Path]:
+    """
+    (git dir, common dir) of a working directory, read from its .git entry without starting git:
+    a directory for a main checkout, a "gitdir:" file for a linked worktree. Falls back to rev-parse
+    for anything else (e.g. a subdirectory of the repository).
+    """
+    dot_git = work_dir / ".git"
+    if dot_git.is_dir():
+        return dot_git, dot_git
+    if dot_git.is_file():
+        text = dot_git.read_text(encoding="utf-8", errors="replace").strip()
+        if text.startswith("gitdir:"):
+            git_dir = (work_dir / text[len("gitdir:"):].strip()).resolve()
+            commondir = git_dir / "commondir"
+            common = (git_dir / commondir.read_text(encoding="utf-8").strip()).resolve() if commondir.exists() else git_dir
+            return git_dir, common
+    out = subprocess.run(["git", "rev-parse", "--absolute-git-dir", "--git-common-dir"], cwd=str(work_dir),
+                         capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(f"Git constraint error: {out.stderr.strip()}")
+    git_dir, common = out.stdout.splitlines()[:2]
+    # --git-common-dir is printed relative to the cwd (absolute paths are kept by the join)
+    return Path(git_dir), (work_dir / common).resolve()
+
+
+def cache_owner(work_dir: str | Path) -> Path:
+    """
+    Directory whose content caches (parsed outlines, tokens, embeddings) serve `work_dir`: the main
+    checkout for a linked worktree, which holds mostly the same files under the same paths, otherwise
+    `work_dir` itself. Entries are validated by content hash, so sharing them is always safe.
+    """
+    resolved = Path(work_dir).resolve()
+    if not (resolved / ".git").is_file():
+        return resolved
+    try:
+        common = _locate_git_dirs(resolved)[1]
+    except (OSError, RuntimeError):
+        return resolved
+    return common.parent if common.name == ".git" else common
+
+
+class GitSession:
+    """
+    Long-lived view of one git working directory. Object lookups and revision resolution go
+    through a single persistent `git cat-file --batch` process instead of one process per query,
+    and HEAD, the branch list and the registered worktrees are cached until the files git keeps
+    them in change (HEAD, packed-refs, the refs/heads directories, the worktrees directory).
+    """
+    def __init__(self, work_dir: Path):
+        self.work_dir = Path(work_dir).resolve()
+        self.git_dir, self.common_dir = _locate_git_dirs(self.work_dir)
+        self._lock = threading.Lock()
+        self._batch: Optional[subprocess.Popen] = None
+        self._signature = None
+        self._resolved: dict[str, str] = {}
+        self._branches: Optional[dict[str, str]] = None
+        self._worktrees: Optional[tuple[int, set[str]]] = None
+        self._ref_dirs: dict[str, tuple[int, list[str]]] = {}
+
+    def _state_signature(self) -> tuple:
+        """Changes whenever HEAD or any branch moves: git updates refs by renaming lock files into place."""
+        signature = []
+        for path in (self.git_dir / "HEAD", self.common_dir / "packed-refs"):
+            try:
+                st = os.stat(path)
+                signature.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                signature.append(None)
+        pending = [str(self.common_dir / "refs" / "heads")]
+        while pending:
+            path = pending.pop()
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+            signature.append(mtime)
+            # Subdirectory names (for branches like feature/x) are re-listed only when the directory changes
+            cached = self._ref_dirs.get(path)
+            if cached is None or cached[0] != mtime:
+                with os.scandir(path) as it:
+                    cached = (mtime, [entry.path for entry in it if entry.is_dir(follow_symlinks=False)])
+                self._ref_dirs[path] = cached
+            pending.extend(cached[1])
+        return tuple(signature)
+
+    def _refresh(self):
+        signature = self._state_signature()
+        if signature != self._signature:
+            self._signature = signature
+            self._resolved.clear()
+            self._branches = None
+
+    def invalidate(self):
+        """Forgets cached repository state (called after commands that move refs)."""
+        with self._lock:
+            self._signature = None
+
+    def _query(self, name: str) -> Optional[tuple[str, str, bytes]]:
+        """(object id, type, content) of a revision from the cat-file process, or None if it does not resolve."""
+        if "\n" in name:
+            return None
+        for attempt in range(2):
+            if self._batch is None or self._batch.poll() is not None:
+                self._batch = subprocess.Popen(["git", "cat-file", "--batch"], cwd=str(self.work_dir),
+                                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            try:
+                self._batch.stdin.write(name.encode("utf-8") + b"\n")
+                self._batch.stdin.flush()
+                header = self._batch.stdout.readline().decode("utf-8", errors="replace").rstrip("\n")
+                if not header:
+                    raise BrokenPipeError("git cat-file exited")
+                if header.endswith((" missing", " ambiguous")):
+                    return None
+                oid, kind, size = header.rsplit(" ", 2)
+                data = self._batch.stdout.read(int(size) + 1)[:-1]
+                return oid, kind, data
+            except (BrokenPipeError, OSError, ValueError) as e:
+                self._stop_batch()
+                if attempt:
+                    raise RuntimeError(f"Git constraint error: cat-file failed on {name}: {e}")
+        return None
+
+    def _stop_batch(self):
+        if self._batch is not None:
+            if self._batch.poll() is None:
+                self._batch.kill()
+            self._batch.stdin.close()
+            self._batch.stdout.close()
+            self._batch.wait()
+            self._batch = None
+
+    def resolve(self, rev: str) -> Optional[str]:
+        """Object id of a revision (like `git rev-parse --verify`), or None if it does not exist."""
+        with self._lock:
+            self._refresh()
+            if rev not in self._resolved:
+                with optimizer.span("subprocess.git", kind="subprocess", command=f"git cat-file --batch ({rev})"[:200]):
+                    found = self._query(rev)
+                if found is None:
+                    # Misses are not cached: the object may be written later without any ref moving
+                    return None
+                self._resolved[rev] = found[0]
+            return self._resolved[rev]
+
+    def read_object(self, rev: str) -> Optional[tuple[str, bytes]]:
+        """(type, content) of an object, e.g. read_object("HEAD:src/app.py"), or None if it does not exist."""
+        with self._lock:
+            with optimizer.span("subprocess.git", kind="subprocess", command=f"git cat-file --batch ({rev})"[:200]):
+                found = self._query(rev)
+        return (found[1], found[2]) if found else None
+
+    def current_branch(self) -> str:
+        """Checked-out branch name, read from HEAD; "" when HEAD is detached (like `git branch --show-current`)."""
+        head = (self.git_dir / "HEAD").read_text(encoding="utf-8").strip()
+        return head[len("ref: refs/heads/"):] if head.startswith("ref: refs/heads/") else ""
+
+    def branches(self) -> dict[str, str]:
+        """Local branch name -> commit id."""
+        with self._lock:
+            self._refresh()
+            if self._branches is None:
+                with optimizer.span("subprocess.git", kind="subprocess", command="git for-each-ref refs/heads"):
+                    out = subprocess.run(
+                        ["git", "for-each-ref", "--format=%(objectname) %(refname:strip=2)", "refs/heads"],
+                        cwd=str(self.work_dir), capture_output=True, text=True, check=True
+                    ).stdout
+                self._branches = {}
+                for line in out.splitlines():
+                    oid, _, name = line.partition(" ")
+                    self._branches[name] = oid
+            return self._branches
+
+    def branch_exists(self, name: str) -> bool:
+        # One cat-file round trip; listing every branch is only worth it when the list is wanted
+        return self.resolve(f"refs/heads/{name}") is not None
+
+    def worktrees(self) -> dict[str, bool]:
+        """Registered linked worktree paths -> whether the directory still exists (False means prunable)."""
+        admin = self.common_dir / "worktrees"
+        try:
+            mtime = os.stat(admin).st_mtime_ns
+        except OSError:
+            return {}
+        with self._lock:
+            if self._worktrees is None or self._worktrees[0] != mtime:
+                paths = set()
+                for entry in os.scandir(admin):
+                    try:
+                        gitdir = Path((Path(entry.path) / "gitdir").read_text(encoding="utf-8").strip())
+                    except OSError:
+                        continue
+                    paths.add(str(gitdir.parent.resolve()))
+                self._worktrees = (mtime, paths)
+            paths = self._worktrees[1]
+        return {path: os.path.isdir(path) for path in paths}
+
+    def close(self):
+        with self._lock:
+            self._stop_batch()
+
+
+# A released session stops its cat-file process, e.g. before its worktree is removed
+_sessions: RootRegistry[GitSession] = RootRegistry(GitSession, on_release=GitSession.close)
+atexit.register(_sessions.release_all)
+
+
+def get_git_session(work_dir: str | Path) -> GitSession:
+    return _sessions.get(work_dir)
+
+
+def close_git_session(work_dir: str | Path):
+    """Stops the session's cat-file process, e.g. before its worktree is removed."""
+    _sessions.release(work_dir)
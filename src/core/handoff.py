@@ -0,0 +1,203 @@
+import logging
+import os
+import subprocess
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterator, Optional
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+from src.core.lightning_optim import optimizer
+
+logger = logging.getLogger(__name__)
+
+# Characters of the diff inlined into the delegation report; the rest is only served as resources
+EXCERPT_CHARS = int(os.getenv("NEXUS_HANDOFF_EXCERPT_CHARS", "8000"))
+# Characters per page of a diff resource (pages break on line boundaries)
+PAGE_CHARS = int(os.getenv("NEXUS_HANDOFF_PAGE_CHARS", "50000"))
+# Handoffs whose diffs stay readable (oldest are forgotten first; their git objects remain)
+MAX_HANDOFFS = int(os.getenv("NEXUS_HANDOFF_RETAINED", "100"))
+
+URI_PREFIX = "nexus://handoff/"
+MIME_TYPE = "text/x-diff"
+
+
+class Handoff:
+    """
+    The result of one delegation, frozen as two git object ids (base, head). Only the --stat summary
+    and the list of changed files are kept in memory; diffs are streamed from git page by page.
+    """
+    def __init__(self, handoff_id: str, repo_dir: Path, base: str, head: str):
+        self.handoff_id = handoff_id
+        self.repo_dir = repo_dir
+        self.base = base
+        self.head = head
+        self.stat = self._git_output(["diff", "--stat=120", base, head]).rstrip()
+        self.files = self._changed_files()
+
+    @property
+    def uri(self) -> str:
+        return f"{URI_PREFIX}{quote(self.handoff_id, safe='')}"
+
+    def diff_uri(self, page: int = 1) -> str:
+        return f"{self.uri}/diff" + (f"?page={page}" if page > 1 else "")
+
+    def file_uri(self, path: str, page: int = 1) -> str:
+        return f"{self.uri}/file/{quote(path, safe='')}" + (f"?page={page}" if page > 1 else "")
+
+    def _git_output(self, args: list[str]) -> str:
+        with optimizer.span("subprocess.git", kind="subprocess", command=" ".join(["git", *args])[:200]):
+            result = subprocess.run(["git", *args], cwd=str(self.repo_dir), capture_output=True, text=True,
+                                    encoding="utf-8", errors="replace")
+        if result.returncode != 0:
+            raise RuntimeError(f"git {args[0]} failed: {result.stderr.strip()}")
+        return result.stdout
+
+    def _changed_files(self) -> list[tuple[str, str, str]]:
+        """(path, lines added, lines deleted) per changed file; "-" counts for binary files."""
+        out = self._git_output(["diff", "--numstat", "-z", "--no-renames", self.base, self.head])
+        files = []
+        for record in out.split("\0"):
+            parts = record.split("\t", 2)
+            if len(parts) == 3:
+                files.append((parts[2], parts[0], parts[1]))
+        return files
+
+    def stream_diff(self, path: Optional[str] = None) -> Iterator[str]:
+        """Lines of the full diff (or of one file's diff), read from git as they are consumed."""
+        cmd = ["git", "diff", "--no-renames", self.base, self.head]
+        if path is not None:
+            cmd += ["--", f":(literal){path}"]
+        proc = subprocess.Popen(cmd, cwd=str(self.repo_dir), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                text=True, encoding="utf-8", errors="replace")
+        try:
+            yield from proc.stdout
+        finally:
+            # Stop git as soon as the reader has what it needs (later pages are never produced)
+            if proc.poll() is None:
+                proc.kill()
+            proc.stdout.close()
+            proc.wait()
+
+    def page(self, page: int, path: Optional[str] = None, page_chars: int = PAGE_CHARS) -> tuple[str, bool]:
+        """(text of the 1-indexed page, whether another page follows). Pages break between lines."""
+        current = 1
+        size = 0
+        lines: list[str] = []
+        with optimizer.span("subprocess.git", kind="subprocess", command=f"git diff (page {page} of {path or 'all files'})"):
+            stream = self.stream_diff(path)
+            try:
+                for line in stream:
+                    if size and size + len(line) > page_chars:
+                        if current == page:
+                            return "".join(lines), True
+                        current += 1
+                        size = 0
+                        lines = []
+                    size += len(line)
+                    if current == page:
+                        lines.append(line)
+            finally:
+                stream.close()
+        return "".join(lines), False
+
+    def excerpt(self, max_chars: int = EXCERPT_CHARS) -> tuple[str, bool]:
+        """The beginning of the full diff, up to max_chars; True if it was cut."""
+        size = 0
+        lines = []
+        with optimizer.span("subprocess.git", kind="subprocess", command="git diff (excerpt)"):
+            stream = self.stream_diff()
+            try:
+                for line in stream:
+                    if size + len(line) > max_chars:
+                        return "".join(lines), True
+                    size += len(line)
+                    lines.append(line)
+            finally:
+                stream.close()
+        return "".join(lines), False
+
+    def index(self) -> str:
+        """Resource listing of the handoff: stat summary and one diff resource per changed file."""
+        out = [f"Handoff {self.handoff_id}: {self.base[:12]}..{self.head[:12]} in {self.repo_dir}", "", self.stat or "(no changes)", ""]
+        out.append(f"Full diff: {self.diff_uri()}")
+        out.extend(f"  {path} (+{added} -{deleted}): {self.file_uri(path)}" for path, added, deleted in self.files)
+        return "\n".join(out)
+
+
+class HandoffRegistry:
+    """Recent handoffs by id, resolved from nexus://handoff/... resource URIs."""
+    def __init__(self, max_entries: int = MAX_HANDOFFS):
+        self.max_entries = max_entries
+        self._handoffs: OrderedDict[str, Handoff] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, handoff: Handoff) -> Handoff:
+        with self._lock:
+            self._handoffs[handoff.handoff_id] = handoff
+            self._handoffs.move_to_end(handoff.handoff_id)
+            while len(self._handoffs) > self.max_entries:
+                self._handoffs.popitem(last=False)
+        return handoff
+
+    def get(self, handoff_id: str) -> Optional[Handoff]:
+        with self._lock:
+            return self._handoffs.get(handoff_id)
+
+    def list(self) -> list[Handoff]:
+        with self._lock:
+            return list(reversed(self._handoffs.values()))
+
+    def read(self, uri: str) -> str:
+        """
+        Serves nexus://handoff/<id> (index), nexus://handoff/<id>/diff[?page=N] (full diff) and
+        nexus://handoff/<id>/file/<path>[?page=N] (one file's diff). Raises ValueError for unknown URIs.
+        """
+        parts = urlsplit(uri)
+        segments = parts.path.lstrip("/").split("/", 2)
+        handoff = None
+        if uri.startswith(URI_PREFIX) and segments[0]:
+            handoff_id = unquote(segments[0])
+            handoff = self.get(handoff_id)
+        if handoff is None:
+            raise ValueError(f"Unknown handoff resource {uri}")
+        try:
+            page = max(1, int(parse_qs(parts.query).get("page", ["1"])[0]))
+        except ValueError:
+            raise ValueError(f"Invalid page in {uri}")
+
+        if len(segments) == 1:
+            return handoff.index()
+        if segments[1] == "diff" and len(segments) == 2:
+            path = None
+            next_uri = handoff.diff_uri(page + 1)
+        elif segments[1] == "file" and len(segments) == 3:
+            path = unquote(segments[2])
+            if path not in {f[0] for f in handoff.files}:
+                raise ValueError(f"{path} is not changed in handoff {handoff_id}")
+            next_uri = handoff.file_uri(path, page + 1)
+        else:
+            raise ValueError(f"Unknown handoff resource {uri}")
+
+        text, more = handoff.page(page, path)
+        if not text and page > 1:
+            raise ValueError(f"Page {page} is past the end of {uri.split('?')[0]}")
+        if more:
+            text += f"\n[Page {page}; continued at {next_uri}]\n"
+        return text
+
+
+handoffs = HandoffRegistry()
+
+
+def summarize_handoff(handoff: Handoff) -> str:
+    """Delegation report section: stat summary, a capped diff excerpt and the resource URIs of the full diff."""
+    if not handoff.files:
+        return "No codebase changes detected upon verification."
+    excerpt, truncated = handoff.excerpt()
+    out = [handoff.stat, "", excerpt.rstrip("\n")]
+    if truncated:
+        out.append(f"\n... [diff excerpt truncated at {EXCERPT_CHARS} characters]")
+    out.append(f"\nFull diff as MCP resources (paginated): {handoff.diff_uri()}")
+    out.append(f"Per-file diffs are listed at {handoff.uri}")
+    return "\n".join(out)
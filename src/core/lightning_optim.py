@@ -1,42 +1,253 @@
+import atexit
+import contextvars
+import functools
+import json
 import logging
+import os
+import queue
+import threading
 import time
 import uuid
-from typing import Callable, Any
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Any, Optional
 
 logger = logging.getLogger(__name__)
 
+# Finished spans kept in memory (oldest are dropped first)
+MAX_TRACE_SPANS = int(os.getenv("NEXUS_TRACE_BUFFER", "2000"))
+# When set, finished spans are also appended to this file by a background thread
+TRACE_FILE = os.getenv("NEXUS_TRACE_FILE", "")
+# "jsonl" writes one flat span per line, "otlp" writes OTLP/JSON ResourceSpans batches
+TRACE_FORMAT = os.getenv("NEXUS_TRACE_FORMAT", "jsonl").lower()
+EXPORT_QUEUE_SIZE = 10_000
+EXPORT_BATCH_SIZE = 256
+SERVICE_NAME = "nexus-mcp"
+
+# Counters rolled up from every span into its parent when it finishes
+ROLLUP_KEYS = ("prompt_tokens", "completion_tokens", "cost_usd", "cache_hits", "cache_misses")
+
+# Span currently executing in this context (thread, asyncio task or copied worker context)
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed unit of work (graph node, LLM call, tool call, subprocess) inside a trace."""
+    def __init__(self, name: str, kind: str, parent: Optional["Span"], attributes: dict):
+        self.name = name
+        self.kind = kind
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.attributes = dict(attributes)
+        self.totals = {key: 0 for key in ROLLUP_KEYS}
+        # Counters are added from the threads of concurrent children (tool calls, rollups)
+        self._lock = threading.Lock()
+        self.status = "ok"
+        self.start_ns = time.time_ns()
+        self._start = time.perf_counter()
+        self.duration = 0.0
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, **counters):
+        with self._lock:
+            for key, value in counters.items():
+                self.totals[key] = self.totals.get(key, 0) + (value or 0)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            totals = dict(self.totals)
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "name": self.name,
+            "kind": self.kind,
+            "start_unix_ns": self.start_ns,
+            "duration_ms": round(self.duration * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+            "totals": totals
+        }
+
+
+class _SpanExporter:
+    """Appends finished spans to TRACE_FILE from a daemon thread so tracing never blocks the work it measures."""
+    def __init__(self, path: str, fmt: str):
+        self.path = path
+        self.fmt = fmt
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=EXPORT_QUEUE_SIZE)
+        self._thread = threading.Thread(target=self._run, name="nexus-trace-export", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def submit(self, span: dict):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout: float = 5.0):
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < EXPORT_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    if self.fmt == "otlp":
+                        f.write(json.dumps(_to_otlp(batch), default=str) + "\n")
+                    else:
+                        f.writelines(json.dumps(span, default=str) + "\n" for span in batch)
+            except OSError as e:
+                logger.warning(f"[Lightning Trace] Failed to export {len(batch)} spans to {self.path}: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _to_otlp(batch: list[dict]) -> dict:
+    """OTLP/JSON encoding (as written by the OpenTelemetry file exporter) of a batch of spans."""
+    spans = []
+    for span in batch:
+        attributes = {"nexus.kind": span["kind"], **span["attributes"]}
+        attributes.update({f"nexus.{key}": value for key, value in span["totals"].items() if value})
+        ok = span["status"] == "ok"
+        spans.append({
+            "traceId": span["trace_id"],
+            "spanId": span["span_id"],
+            "parentSpanId": span["parent_id"] or "",
+            "name": span["name"],
+            "kind": 3 if span["kind"] in ("llm", "subprocess") else 1,  # CLIENT / INTERNAL
+            "startTimeUnixNano": str(span["start_unix_ns"]),
+            "endTimeUnixNano": str(span["start_unix_ns"] + int(span["duration_ms"] * 1_000_000)),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()],
+            "status": {"code": 1} if ok else {"code": 2, "message": span["status"]}
+        })
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+        "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": spans}]
+    }]}
+
+
 class AgentLightningOptimizer:
     """
     Wraps CrewAI and LangGraph nodes to capture traces for long-term optimization.
-    In a full production scale, this intercepts tool calls/LLM outputs and computes efficiency scores.
+    Work is recorded as nested spans (task > graph node > LLM call / tool call > subprocess) with
+    perf_counter timings, token, cost and cache counters, kept in a bounded ring buffer.
     """
     def __init__(self):
         self.session_id = str(uuid.uuid4())
-        self.traces = []
+        self.traces: deque[dict] = deque(maxlen=MAX_TRACE_SPANS)
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._lock = threading.Lock()
+        self._exporter = _SpanExporter(TRACE_FILE, TRACE_FORMAT) if TRACE_FILE else None
+        self._listeners: list[Callable[[dict], None]] = []
+
+    @contextmanager
+    def span(self, name: str, kind: str = "internal", **attributes):
+        """Times the enclosed block as a child of the current span (or as a new trace)."""
+        span = Span(name, kind, _current_span.get(), attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = f"error: {type(e).__name__}: {e}"[:500]
+            raise
+        finally:
+            _current_span.reset(token)
+            self._finish(span)
+
+    def traced(self, name: str, kind: str = "internal"):
+        """Decorator running the function inside a span."""
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name, kind):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def current_span() -> Optional[Span]:
+        return _current_span.get()
 
     def trace_execution(self, agent_name: str, task_name: str, func: Callable, *args, **kwargs) -> Any:
-        start_time = time.time()
         logger.info(f"[Lightning Trace Start] Agent: {agent_name} | Task: {task_name}")
-        
-        try:
+        with self.span(f"agent.{agent_name}", kind="agent", agent=agent_name, task=task_name) as span:
             result = func(*args, **kwargs)
-            duration = time.time() - start_time
-            self._record_trace(agent_name, task_name, duration, "SUCCESS")
-            return result
-        except Exception as e:
-            duration = time.time() - start_time
-            self._record_trace(agent_name, task_name, duration, f"FAILED: {str(e)}")
-            raise e
-
-    def _record_trace(self, agent_name: str, task_name: str, duration: float, status: str):
-        trace = {
-            "session_id": self.session_id,
-            "agent": agent_name,
-            "task": task_name,
-            "duration": duration,
-            "status": status
-        }
-        self.traces.append(trace)
-        logger.info(f"[Lightning Trace Saved] {trace}")
-        
+        logger.info(
+            f"[Lightning Trace Saved] {agent_name} | {task_name} | {span.duration:.2f}s | "
+            f"tokens={span.totals['prompt_tokens'] + span.totals['completion_tokens']} "
+            f"cost=${span.totals['cost_usd']:.4f} cache={span.totals['cache_hits']}/{span.totals['cache_misses']}"
+        )
+        return result
+
+    def record_cache_event(self, hit: bool, model: str):
+        """Counts an LLM response cache lookup, for the session and for the enclosing span."""
+        with self._lock:
+            if hit:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+        span = _current_span.get()
+        if span is not None:
+            span.add(**{"cache_hits" if hit else "cache_misses": 1})
+        logger.debug(f"[Lightning Cache] {'HIT' if hit else 'MISS'} for {model}")
+
+    def record_usage(self, prompt_tokens: int = 0, completion_tokens: int = 0, cost_usd: float = 0.0):
+        """Adds LLM token usage and cost to the current span; it rolls up to every ancestor."""
+        span = _current_span.get()
+        if span is not None:
+            span.add(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, cost_usd=cost_usd)
+
+    def add_listener(self, listener: Callable[[dict], None]):
+        """Calls `listener(span_record)` for every finished span (e.g. to derive metrics)."""
+        self._listeners.append(listener)
+
+    def flush(self, timeout: float = 5.0):
+        """Waits (up to `timeout`) until queued spans are written to the trace file."""
+        if self._exporter is not None:
+            self._exporter.flush(timeout)
+
+    def _finish(self, span: Span):
+        span.duration = time.perf_counter() - span._start
+        record = span.to_dict()
+        record["session_id"] = self.session_id
+        if span.parent is not None:
+            # Parallel children (concurrent tool calls) finish on different threads; add() takes the parent's lock
+            span.parent.add(**record["totals"])
+        with self._lock:
+            self.traces.append(record)
+        if self._exporter is not None:
+            self._exporter.submit(record)
+        for listener in self._listeners:
+            try:
+                listener(record)
+            except Exception as e:
+                logger.warning(f"[Lightning Trace] Span listener failed: {e}")
+        logger.debug(f"[Lightning Span] {span.name} ({span.kind}) {span.duration * 1000:.1f}ms {span.status}")
+
+
 optimizer = AgentLightningOptimizer()
@@ -0,0 +1,276 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+from src.core.lightning_optim import optimizer
+
+logger = logging.getLogger(__name__)
+
+# Optional exports besides the nexus://metrics MCP resource
+METRICS_FILE = os.getenv("NEXUS_METRICS_FILE", "")
+METRICS_FILE_INTERVAL = float(os.getenv("NEXUS_METRICS_INTERVAL", "15"))
+METRICS_PORT = int(os.getenv("NEXUS_METRICS_PORT", "0") or 0)
+METRICS_HOST = "127.0.0.1"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds; spans sub-second tool calls up to multi-minute delegations
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """A settable value, or one read on every scrape from `callback` (returning {label values: value})."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (),
+                 callback: Optional[Callable[[], dict[tuple, float]]] = None):
+        super().__init__(name, help_text, labelnames)
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self) -> list[str]:
+        if self.callback is not None:
+            try:
+                values = self.callback()
+            except Exception as e:
+                logger.warning(f"[Metrics] Gauge {self.name} callback failed: {e}")
+                values = {}
+            with self._lock:
+                self._values = {tuple(str(v) for v in key): value for key, value in values.items()}
+        return super().render()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted((key, ([*state[0]], state[1], state[2])) for key, state in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float("inf")), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_number(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Process-wide set of metrics rendered in the Prometheus text exposition format."""
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: tuple = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: tuple = (), callback=None) -> Gauge:
+        return self.register(Gauge(name, help_text, labelnames, callback))
+
+    def histogram(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def _queue_depth() -> dict[tuple, float]:
+    from src.core.task_queue import task_queue
+    stats = task_queue.stats()
+    return {("queued",): stats["queued"], ("running",): stats["running"]}
+
+
+DELEGATIONS = registry.counter("nexus_delegations_total", "Delegations by final status (completed/failed/cancelled/rejected).", ("status",))
+DELEGATION_SECONDS = registry.histogram("nexus_delegation_duration_seconds", "Wall-clock time of finished delegations.", ("status",))
+QUEUE_JOBS = registry.gauge("nexus_queue_jobs", "Delegations currently queued or running.", ("state",), callback=_queue_depth)
+NODE_SECONDS = registry.histogram("nexus_node_duration_seconds", "Latency of LangGraph nodes.", ("node", "outcome"))
+VERIFY_OUTCOMES = registry.counter("nexus_verify_routes_total", "verify_router decisions: passed, retry (back to crew) or escalate.", ("route",))
+LLM_SECONDS = registry.histogram("nexus_llm_request_duration_seconds", "Latency of LLM completions (including cache hits).", ("model", "outcome"))
+LLM_TOKENS = registry.counter("nexus_llm_tokens_total", "LLM tokens by model and direction (prompt/completion).", ("model", "type"))
+LLM_COST = registry.counter("nexus_llm_cost_usd_total", "Estimated LLM spend by model.", ("model",))
+LLM_CACHE = registry.counter("nexus_llm_cache_lookups_total", "LLM response cache lookups by result (hit/miss).", ("result",))
+LLM_TIER_ESCALATIONS = registry.counter("nexus_llm_tier_escalations_total", "Tiers a routed call escalated past its starting tier (rejected answers or a fully failing tier).", ("role",))
+TOOL_SECONDS = registry.histogram("nexus_tool_duration_seconds", "Latency of crew tool calls.", ("tool", "outcome"))
+SUBPROCESS_SECONDS = registry.histogram("nexus_subprocess_duration_seconds", "Latency of bash and git subprocesses.", ("kind", "outcome"))
+
+
+def _observe_span(span: dict):
+    """Derives latency/token metrics from finished trace spans, so instrumentation lives in one place."""
+    kind = span["kind"]
+    seconds = span["duration_ms"] / 1000
+    outcome = "ok" if span["status"] == "ok" else "error"
+    if kind == "node":
+        NODE_SECONDS.observe(seconds, node=span["name"].removeprefix("node."), outcome=outcome)
+    elif kind == "llm":
+        model = span["attributes"].get("model", "unknown")
+        totals = span["totals"]
+        LLM_SECONDS.observe(seconds, model=model, outcome=outcome)
+        LLM_TOKENS.inc(totals.get("prompt_tokens", 0), model=model, type="prompt")
+        LLM_TOKENS.inc(totals.get("completion_tokens", 0), model=model, type="completion")
+        LLM_COST.inc(totals.get("cost_usd", 0), model=model)
+        if totals.get("cache_hits"):
+            LLM_CACHE.inc(totals["cache_hits"], result="hit")
+        if totals.get("cache_misses"):
+            LLM_CACHE.inc(totals["cache_misses"], result="miss")
+    elif kind == "router":
+        if span["attributes"].get("escalations"):
+            LLM_TIER_ESCALATIONS.inc(span["attributes"]["escalations"], role=span["attributes"].get("role", "default"))
+    elif kind == "tool":
+        if span["attributes"].get("failed"):
+            outcome = "error"
+        TOOL_SECONDS.observe(seconds, tool=span["name"].removeprefix("tool."), outcome=outcome)
+    elif kind == "subprocess":
+        SUBPROCESS_SECONDS.observe(seconds, kind=span["name"].removeprefix("subprocess."), outcome=outcome)
+
+
+optimizer.add_listener(_observe_span)
+
+
+def render_metrics() -> str:
+    return registry.render()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = render_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"[Metrics] {self.address_string()} {format % args}")
+
+
+def _write_metrics_file(path: str):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(render_metrics())
+    os.replace(tmp, path)  # scrapers (e.g. node_exporter textfile collector) never see a partial file
+
+
+def _file_writer(path: str, interval: float):
+    while True:
+        try:
+            _write_metrics_file(path)
+        except OSError as e:
+            logger.warning(f"[Metrics] Failed to write {path}: {e}")
+        time.sleep(interval)
+
+
+_exporters_started = False
+
+
+def start_metrics_exporters():
+    """Starts the optional text-file writer (NEXUS_METRICS_FILE) and localhost HTTP endpoint (NEXUS_METRICS_PORT)."""
+    global _exporters_started
+    if _exporters_started:
+        return
+    _exporters_started = True
+
+    if METRICS_FILE:
+        threading.Thread(target=_file_writer, args=(METRICS_FILE, METRICS_FILE_INTERVAL),
+                         name="nexus-metrics-file", daemon=True).start()
+        logger.info(f"[Metrics] Writing metrics to {METRICS_FILE} every {METRICS_FILE_INTERVAL}s")
+    if METRICS_PORT:
+        try:
+            httpd = ThreadingHTTPServer((METRICS_HOST, METRICS_PORT), _MetricsHandler)
+        except OSError as e:
+            logger.error(f"[Metrics] Could not listen on {METRICS_HOST}:{METRICS_PORT}: {e}")
+            return
+        threading.Thread(target=httpd.serve_forever, name="nexus-metrics-http", daemon=True).start()
+        logger.info(f"[Metrics] Serving http://{METRICS_HOST}:{METRICS_PORT}/metrics")
@@ -0,0 +1,253 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Optional
+
+from src.core.metrics import DELEGATIONS, DELEGATION_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Bounded worker pool: how many delegations run at once, and how many may wait behind them.
+MAX_WORKERS = int(os.getenv("NEXUS_MAX_WORKERS", "4"))
+MAX_PENDING = int(os.getenv("NEXUS_MAX_PENDING", "16"))
+# Finished jobs are kept around so their results can still be polled.
+MAX_FINISHED_JOBS = int(os.getenv("NEXUS_MAX_FINISHED_JOBS", "100"))
+
+FINISHED_STATES = ("completed", "failed", "cancelled")
+
+# The job executing on the current worker thread (None outside of a delegation).
+current_job: contextvars.ContextVar[Optional["TaskJob"]] = contextvars.ContextVar("current_job", default=None)
+# Extra cancellation signal for one branch of work inside a job (e.g. a speculative attempt that lost).
+_cancel_scope: contextvars.ContextVar[Optional[threading.Event]] = contextvars.ContextVar("cancel_scope", default=None)
+
+
+class TaskCancelled(Exception):
+    """Raised inside a worker once its job has been cancelled by the client."""
+
+
+class TaskJob:
+    """
+    A single delegation submitted to the TaskQueue.
+    Holds the status, progress and final result that the MCP polling tools report back.
+    """
+    def __init__(self, task_id: str, description: str):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.task_id = task_id
+        self.description = description
+        self.status = "queued"
+        self.progress = 0.0
+        self.total: Optional[float] = None
+        self.message = "Waiting for a free worker."
+        self.result: Optional[str] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.future = None
+        self._cancel_event = threading.Event()
+        self._done_event = threading.Event()
+        self._listeners: list[Callable[["TaskJob"], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def check_cancelled(self):
+        """Cooperative cancellation point for long-running work inside the job."""
+        if self._cancel_event.is_set():
+            raise TaskCancelled(f"Task {self.task_id} was cancelled.")
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until the job finishes or the timeout expires. Returns True if finished."""
+        return self._done_event.wait(timeout)
+
+    def subscribe(self, listener: Callable[["TaskJob"], None]):
+        with self._lock:
+            self._listeners.append(listener)
+
+    def unsubscribe(self, listener: Callable[["TaskJob"], None]):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def report_progress(self, message: str = "", progress: Optional[float] = None, total: Optional[float] = None):
+        """
+        Records a progress step and forwards it to subscribed listeners (e.g. MCP progress notifications).
+        Without an explicit progress value, each call advances the counter by one step.
+        """
+        with self._lock:
+            self.progress = progress if progress is not None else self.progress + 1
+            if total is not None:
+                self.total = total
+            if message:
+                self.message = message
+            listeners = list(self._listeners)
+
+        for listener in listeners:
+            try:
+                listener(self)
+            except Exception as e:
+                logger.warning(f"[Task Queue] Progress listener failed for job {self.job_id}: {e}")
+
+    def _finish(self, status: str, result: Optional[str] = None, error: Optional[str] = None):
+        with self._lock:
+            self.status = status
+            self.result = result
+            self.error = error
+            self.finished_at = time.time()
+        self._done_event.set()
+        DELEGATIONS.inc(status=status)
+        DELEGATION_SECONDS.observe(self.finished_at - (self.started_at or self.created_at), status=status)
+
+    def to_dict(self) -> dict[str, Any]:
+        now = self.finished_at or time.time()
+        return {
+            "job_id": self.job_id,
+            "task_id": self.task_id,
+            "status": self.status,
+            "progress": self.progress,
+            "total": self.total,
+            "message": self.message,
+            "error": self.error,
+            "elapsed_seconds": round(now - (self.started_at or self.created_at), 2)
+        }
+
+
+class TaskQueue:
+    """
+    Runs delegations on a bounded thread pool so the asyncio event loop of the MCP server
+    never blocks on a long LangGraph invocation.
+    """
+    def __init__(self, max_workers: int = MAX_WORKERS, max_pending: int = MAX_PENDING):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="nexus-task")
+        self._jobs: "OrderedDict[str, TaskJob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, task_id: str, description: str, func: Callable[[TaskJob], str]) -> TaskJob:
+        """
+        Queues `func(job)` on the worker pool and returns immediately.
+        Refuses new work when the queue is full or the same task_id is already active.
+        """
+        with self._lock:
+            active = [j for j in self._jobs.values() if not j.done]
+            if len(active) >= self.max_workers + self.max_pending:
+                DELEGATIONS.inc(status="rejected")
+                raise RuntimeError(
+                    f"Task queue is full ({len(active)} active delegations). Try again once a task finishes."
+                )
+            for existing in active:
+                if existing.task_id == task_id:
+                    raise ValueError(f"Task '{task_id}' is already active as job {existing.job_id}.")
+
+            job = TaskJob(task_id, description)
+            self._jobs[job.job_id] = job
+            self._evict_finished()
+
+        job.future = self._executor.submit(self._run, job, func)
+        logger.info(f"[Task Queue] Queued job {job.job_id} for task {task_id}")
+        return job
+
+    def get(self, job_id: str) -> Optional[TaskJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Requests cancellation. Queued jobs are dropped before they start; running jobs
+        stop at their next cancellation point.
+        """
+        job = self.get(job_id)
+        if job is None or job.done:
+            return False
+
+        job._cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            job._finish("cancelled", error="Cancelled before it started.")
+            logger.info(f"[Task Queue] Job {job_id} cancelled while queued")
+        else:
+            job.report_progress(message="Cancellation requested.", progress=job.progress)
+            logger.info(f"[Task Queue] Cancellation requested for running job {job_id}")
+        return True
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            statuses = [j.status for j in self._jobs.values()]
+        return {
+            "queued": statuses.count("queued"),
+            "running": statuses.count("running"),
+            "max_workers": self.max_workers
+        }
+
+    def _run(self, job: TaskJob, func: Callable[[TaskJob], str]):
+        token = current_job.set(job)
+        job.started_at = time.time()
+        job.status = "running"
+        job.report_progress(message="Started.", progress=0)
+        try:
+            job.check_cancelled()
+            result = func(job)
+            job._finish("completed", result=result)
+            logger.info(f"[Task Queue] Job {job.job_id} completed")
+        except TaskCancelled as e:
+            job._finish("cancelled", error=str(e))
+            logger.info(f"[Task Queue] Job {job.job_id} cancelled")
+        except Exception as e:
+            logger.exception(f"[Task Queue] Job {job.job_id} failed")
+            job._finish("failed", error=str(e))
+        finally:
+            current_job.reset(token)
+
+    def _evict_finished(self):
+        finished = [job_id for job_id, j in self._jobs.items() if j.done]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+
+def report_progress(message: str = "", progress: Optional[float] = None, total: Optional[float] = None):
+    """Reports progress for the job running on this thread. A no-op outside of a delegation."""
+    job = current_job.get()
+    if job is not None:
+        job.report_progress(message=message, progress=progress, total=total)
+
+
+def cancel_requested() -> bool:
+    """True once the job running on this thread, or the enclosing cancel_scope, has been cancelled."""
+    job = current_job.get()
+    scope = _cancel_scope.get()
+    return (job is not None and job.cancel_requested) or (scope is not None and scope.is_set())
+
+
+def check_cancelled():
+    """Raises TaskCancelled if the job running on this thread (or its enclosing cancel_scope) has been cancelled."""
+    job = current_job.get()
+    if job is not None:
+        job.check_cancelled()
+    scope = _cancel_scope.get()
+    if scope is not None and scope.is_set():
+        raise TaskCancelled("Work was cancelled by its cancel scope.")
+
+
+@contextmanager
+def cancel_scope(event: threading.Event):
+    """Runs the enclosed block so that setting `event` cancels it like a job cancellation would."""
+    token = _cancel_scope.set(event)
+    try:
+        yield event
+    finally:
+        _cancel_scope.reset(token)
+
+
+task_queue = TaskQueue()
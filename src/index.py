@@ -1,6 +1,8 @@
 import asyncio
 import logging
 from src.server import server
+from src.core.metrics import start_metrics_exporters
+from src.nexus.tools.outline import warm_parse_pool
 import mcp.server.stdio
 from mcp.server.models import InitializationOptions
 from mcp.server import NotificationOptions
@@ -13,6 +15,8 @@ logging.basicConfig(
 )
 
 async def run():
+    start_metrics_exporters()
+    warm_parse_pool()
     async with mcp.server.stdio.stdio_server() as (read_stream, write_stream):
         await server.run(
             read_stream,
@@ -0,0 +1,204 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import logging
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+import litellm
+
+from src.core.lightning_optim import optimizer
+from src.core.task_queue import report_progress, check_cancelled
+from src.llm.cache import get_response_cache
+from src.llm.provider import get_api_base
+
+logger = logging.getLogger(__name__)
+
+# Per-call timeout in seconds (covers the whole streamed response)
+LLM_TIMEOUT = float(os.getenv("NEXUS_LLM_TIMEOUT", "180"))
+# Stream tokens so progress (and time-to-first-token) is visible while the model is generating
+STREAM_ENABLED = os.getenv("NEXUS_LLM_STREAM", "1").lower() in ("1", "true", "yes")
+MAX_CONNECTIONS = int(os.getenv("NEXUS_LLM_MAX_CONNECTIONS", "32"))
+# Minimum seconds between two streaming progress notifications
+STREAM_PROGRESS_INTERVAL = 1.0
+
+
+class _SharedLoop:
+    """
+    One long-lived event loop on a daemon thread, shared by every node of every task.
+    Synchronous LangGraph nodes submit coroutines to it, so concurrent tasks overlap their
+    network waits on a single pooled HTTP client instead of each blocking a thread on I/O.
+    """
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+
+                threading.Thread(target=run, name="nexus-llm-loop", daemon=True).start()
+                ready.wait()
+                asyncio.run_coroutine_threadsafe(_init_http_client(), loop).result()
+                self._loop = loop
+            return self._loop
+
+
+_shared_loop = _SharedLoop()
+# Replaces litellm.acompletion when set (see set_completion_backend)
+_completion_backend: Optional[Callable[..., Awaitable[Any]]] = None
+
+
+async def _init_http_client():
+    """Keep-alive connection pool reused by LiteLLM for every async request."""
+    import httpx
+    if litellm.aclient_session is None:
+        litellm.aclient_session = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+            timeout=httpx.Timeout(LLM_TIMEOUT, connect=10.0)
+        )
+        logger.info(f"[LLM Async] Pooled HTTP client ready (max {MAX_CONNECTIONS} connections)")
+
+
+def set_completion_backend(backend: Optional[Callable[..., Awaitable[Any]]]):
+    """
+    Routes every completion to `backend(**litellm_kwargs)` instead of LiteLLM, e.g. a deterministic
+    replay of recorded transcripts for offline benchmarks. Responses are not streamed. None restores LiteLLM.
+    """
+    global _completion_backend
+    _completion_backend = backend
+
+
+def run_sync(coro) -> Any:
+    """
+    Runs a coroutine on the shared LLM loop and blocks the calling (worker) thread for its result.
+    The caller's context travels with it, so progress and traces land on the right task.
+    """
+    loop = _shared_loop.get()
+    ctx = contextvars.copy_context()
+    result: concurrent.futures.Future = concurrent.futures.Future()
+
+    def start():
+        task = loop.create_task(coro, context=ctx)
+
+        def relay(t: asyncio.Task):
+            if t.cancelled():
+                result.cancel()
+            elif t.exception() is not None:
+                result.set_exception(t.exception())
+            else:
+                result.set_result(t.result())
+        task.add_done_callback(relay)
+
+    loop.call_soon_threadsafe(start)
+    return result.result()
+
+
+async def acomplete(model: str, messages: list, *, tools: Optional[list] = None, tool_choice: Any = None,
+                    temperature: Optional[float] = None, stream: Optional[bool] = None,
+                    timeout: Optional[float] = None, **kwargs) -> Any:
+    """
+    Async completion shared by the planner, crew and verifier nodes.
+    Consults the response cache, streams tokens as task progress, and enforces a per-call timeout.
+    A streamed answer is cached once assembled, and a cache hit is returned whole, without streaming.
+    The SQLite cache is read and written off the shared loop's thread.
+    """
+    use_stream = STREAM_ENABLED if stream is None else stream
+    with optimizer.span("llm.completion", kind="llm", model=model, stream=use_stream) as span:
+        cache = get_response_cache()
+        key = None
+        if cache is not None:
+            key = cache.make_key(model, messages, tools, tool_choice, temperature)
+            hit = await asyncio.to_thread(cache.get, key)
+            optimizer.record_cache_event(hit is not None, model)
+            if hit is not None:
+                logger.info(f"[LLM Cache] Hit for {model} ({key[:12]})")
+                span.set(cache_hit=True)
+                return litellm.ModelResponse(**hit)
+
+        call_kwargs = {"model": model, "messages": messages, **kwargs}
+        if tools:
+            call_kwargs["tools"] = tools
+            call_kwargs["tool_choice"] = tool_choice or "auto"
+        if temperature is not None:
+            call_kwargs["temperature"] = temperature
+        api_base = get_api_base()
+        if api_base:
+            call_kwargs["api_base"] = api_base
+
+        start = time.perf_counter()
+        if _completion_backend is not None:
+            response = await asyncio.wait_for(_completion_backend(**call_kwargs), timeout or LLM_TIMEOUT)
+        elif use_stream:
+            response = await asyncio.wait_for(_astream(call_kwargs, start), timeout or LLM_TIMEOUT)
+        else:
+            response = await asyncio.wait_for(litellm.acompletion(**call_kwargs), timeout or LLM_TIMEOUT)
+        logger.info(f"[LLM Async] {model} answered in {time.perf_counter() - start:.2f}s")
+        _record_usage(model, response)
+
+        if cache is not None and response is not None:
+            try:
+                await asyncio.to_thread(cache.put, key, model, response.model_dump())
+            except Exception as e:
+                logger.warning(f"[LLM Cache] Failed to store response: {e}")
+        return response
+
+
+def _record_usage(model: str, response: Any):
+    """Token counts and (when LiteLLM knows the model's pricing) cost of one call, for the trace."""
+    usage = getattr(response, "usage", None)
+    try:
+        cost = litellm.completion_cost(completion_response=response, model=model)
+    except Exception:
+        cost = 0.0  # unknown pricing (local or custom model)
+    optimizer.record_usage(
+        prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+        completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+        cost_usd=cost or 0.0
+    )
+
+
+async def _astream(call_kwargs: dict, start: float) -> Any:
+    stream = await litellm.acompletion(**call_kwargs, stream=True)
+    chunks = []
+    produced = 0
+    last_report = 0.0
+    async for chunk in stream:
+        check_cancelled()
+        if not chunks:
+            ttft = time.perf_counter() - start
+            logger.info(f"[LLM Async] {call_kwargs['model']} first token after {ttft:.2f}s")
+            span = optimizer.current_span()
+            if span is not None:
+                span.set(ttft_ms=round(ttft * 1000, 1))
+        chunks.append(chunk)
+        delta = chunk.choices[0].delta if chunk.choices else None
+        text = getattr(delta, "content", None) or ""
+        produced += len(text)
+
+        now = time.monotonic()
+        if now - last_report >= STREAM_PROGRESS_INTERVAL:
+            last_report = now
+            report_progress(message=f"[LLM {call_kwargs['model']}] streaming ({produced} chars): ...{text[-80:]}")
+
+    return litellm.stream_chunk_builder(chunks, messages=call_kwargs["messages"])
+
+
+def complete(model: str, messages: list, **kwargs) -> Any:
+    """Blocking wrapper around `acomplete` for the synchronous LangGraph nodes."""
+    return run_sync(acomplete(model, messages, **kwargs))
+
+
+def complete_for_role(role: str, messages: list, **kwargs) -> Any:
+    """Blocking completion routed by the ModelRouter for a node role (planner, coder, verifier)."""
+    from src.llm.router import router
+    return run_sync(router.acomplete(role, messages, **kwargs))
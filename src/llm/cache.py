@@ -0,0 +1,105 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+from src.core.cache_paths import get_cache_root
+
+logger = logging.getLogger(__name__)
+
+# Opt-in: identical prompts are only answered from disk when NEXUS_LLM_CACHE is enabled
+CACHE_ENABLED = os.getenv("NEXUS_LLM_CACHE", "").lower() in ("1", "true", "yes")
+MAX_CACHE_BYTES = int(os.getenv("NEXUS_LLM_CACHE_MAX_MB", "256")) * 1024 * 1024
+CACHE_TTL_SECONDS = int(os.getenv("NEXUS_LLM_CACHE_TTL", str(7 * 24 * 3600)))
+
+
+class LLMResponseCache:
+    """
+    Content-addressed, disk-backed cache of LiteLLM completion responses.
+    Entries are keyed by a hash of (model, messages, tools, tool_choice, temperature), expire
+    after a TTL, and are evicted least-recently-used once the database exceeds its size budget.
+    """
+    def __init__(self, path: Path, max_bytes: int = MAX_CACHE_BYTES, ttl: int = CACHE_TTL_SECONDS):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, model TEXT, payload TEXT, size INTEGER,"
+            " created_at REAL, last_access REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses(last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, messages: list, tools: Optional[list] = None,
+                 tool_choice: Any = None, temperature: Optional[float] = None) -> str:
+        material = json.dumps(
+            {"model": model, "messages": messages, "tools": tools, "tool_choice": tool_choice, "temperature": temperature},
+            sort_keys=True, default=str
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT payload, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            payload, created_at = row
+            if now - created_at > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return json.loads(payload)
+
+    def put(self, key: str, model: str, response: dict):
+        payload = json.dumps(response, default=str)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, payload, size, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, payload, len(payload), now, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Least recently used first, until back under budget
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+        logger.info(f"[LLM Cache] Evicted entries down to {total} bytes")
+
+
+_cache: Optional[LLMResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[LLMResponseCache]:
+    """The shared cache, or None when caching is not enabled."""
+    global _cache
+    if not CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMResponseCache(get_cache_root() / "llm_cache.sqlite3")
+        return _cache
+
@@ -0,0 +1,165 @@
+import hashlib
+import logging
+import os
+import re
+from functools import lru_cache
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Explicit token budget for packed context; 0 derives it from the model's context window
+CONTEXT_BUDGET = int(os.getenv("NEXUS_CONTEXT_BUDGET", "0") or 0)
+# Share of the model's input window packed material may take (the rest is left for the conversation)
+CONTEXT_FRACTION = float(os.getenv("NEXUS_CONTEXT_FRACTION", "0.25"))
+# Used when the model's window is unknown to LiteLLM
+DEFAULT_CONTEXT_WINDOW = 32_000
+# Items that would be compacted below this many tokens are dropped instead
+MIN_ITEM_TOKENS = 48
+CHARS_PER_TOKEN = 4
+
+# Higher ranks are packed first; errors and the task itself matter more than bulk code context
+PRIORITY = {"task": 100, "errors": 90, "plan": 70, "file": 60, "diff": 60, "search": 50, "outline": 30, "tree": 10}
+
+
+@lru_cache(maxsize=32)
+def get_tokenizer(model: str) -> Callable[[str], int]:
+    """
+    Token counter for a model, cached per model: the model's own tiktoken encoding if available,
+    else LiteLLM's bundled cl100k encoding (works offline), else a characters-per-token estimate.
+    """
+    try:
+        import tiktoken
+        encoding = tiktoken.encoding_for_model(model.split("/")[-1])
+    except Exception:
+        try:
+            from litellm.litellm_core_utils.default_encoding import encoding
+        except Exception:
+            logger.info(f"[Context] No tokenizer for {model}; estimating {CHARS_PER_TOKEN} chars per token")
+            return lambda text: (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    from src.llm.provider import get_llm
+    return get_tokenizer(model or get_llm())(text)
+
+
+@lru_cache(maxsize=64)
+def _model_window(model: str) -> int:
+    import litellm
+    # Looked up in the cost map directly: get_model_info prints provider help for unknown models
+    info = litellm.model_cost.get(model) or litellm.model_cost.get(model.split("/", 1)[-1]) or {}
+    return int(info.get("max_input_tokens") or info.get("max_tokens") or DEFAULT_CONTEXT_WINDOW)
+
+
+def budget_for_role(role: Optional[str] = None) -> tuple[str, int]:
+    """
+    (tokenizer model, token budget) for prompts of a node role. The budget fits the smallest context
+    window among the role's routed models, so the packed prompt is valid on every escalation tier.
+    """
+    from src.llm.router import router
+    models = [model for tier in router.tiers(role) for model in tier]
+    if CONTEXT_BUDGET:
+        return models[0], CONTEXT_BUDGET
+    return models[0], int(min(_model_window(model) for model in models) * CONTEXT_FRACTION)
+
+
+def normalize_whitespace(text: str) -> str:
+    """Cheap lossless-enough compaction: trailing spaces stripped, blank-line runs collapsed."""
+    text = re.sub(r"[ \t]+\n", "\n", text)
+    return re.sub(r"\n{3,}", "\n\n", text).strip("\n").rstrip()
+
+
+def compact(text: str, max_tokens: int, count: Callable[[str], int]) -> str:
+    """Shrinks text to max_tokens by keeping its head and tail lines around an omission marker."""
+    if count(text) <= max_tokens:
+        return text
+    lines = text.splitlines()
+    # Binary search for how many lines fit, split 2:1 between head and tail
+    low, high = 1, len(lines)
+    best = ""
+    while low <= high:
+        keep = (low + high) // 2
+        head, tail = lines[:(keep * 2 + 2) // 3], lines[len(lines) - keep // 3:] if keep // 3 else []
+        candidate = "\n".join(head + [f"... [{len(lines) - len(head) - len(tail)} lines omitted] ..."] + tail)
+        if count(candidate) <= max_tokens:
+            best, low = candidate, keep + 1
+        else:
+            high = keep - 1
+    if not best and lines:
+        # A single huge line: cut by characters instead
+        cut = max_tokens * CHARS_PER_TOKEN
+        best = text[:cut] + "\n... [truncated] ..."
+        while cut and count(best) > max_tokens:
+            cut //= 2
+            best = text[:cut] + "\n... [truncated] ..."
+    return best
+
+
+class ContextPacker:
+    """
+    Collects candidate prompt material (task, errors, plan, files, search hits, outline, ...),
+    drops duplicates, and fills a token budget in priority order. Items that don't fit whole are
+    compacted to the remaining space; required items are always kept, compacted if need be.
+    """
+    def __init__(self, model: str, budget: int):
+        self.model = model
+        self.budget = budget
+        self.count = get_tokenizer(model)
+        self._items: list[dict] = []
+        self._seen: set[str] = set()
+        self.stats = {"candidates": 0, "duplicates": 0, "compacted": 0, "dropped": 0, "tokens": 0}
+
+    @classmethod
+    def for_role(cls, role: Optional[str] = None, budget: Optional[int] = None) -> "ContextPacker":
+        model, role_budget = budget_for_role(role)
+        return cls(model, budget or role_budget)
+
+    def add(self, kind: str, text: str, title: str = "", priority: Optional[int] = None,
+            key: Optional[str] = None, required: bool = False) -> bool:
+        """Queues one item; returns False if it was empty or a duplicate (same key or same content)."""
+        self.stats["candidates"] += 1
+        text = normalize_whitespace(text or "")
+        if not text:
+            return False
+        fingerprint = key or hashlib.sha1(text.encode("utf-8")).hexdigest()
+        if fingerprint in self._seen:
+            self.stats["duplicates"] += 1
+            return False
+        self._seen.add(fingerprint)
+        rank = PRIORITY.get(kind, 40) if priority is None else priority
+        self._items.append({"kind": kind, "title": title, "text": text, "rank": rank, "required": required,
+                            "order": len(self._items)})
+        return True
+
+    def pack(self, separator: str = "\n\n") -> str:
+        """Renders the selected items in the order they were added."""
+        remaining = self.budget
+        chosen = []
+        ranked = sorted(self._items, key=lambda item: (not item["required"], -item["rank"], item["order"]))
+        for item in ranked:
+            header = f"{item['title']}:\n" if item["title"] else ""
+            overhead = self.count(header + separator) if header else self.count(separator)
+            tokens = self.count(item["text"]) + overhead
+            if tokens <= remaining:
+                text = item["text"]
+            elif item["required"] or remaining - overhead >= MIN_ITEM_TOKENS:
+                text = compact(item["text"], max(MIN_ITEM_TOKENS, remaining - overhead), self.count)
+                tokens = self.count(text) + overhead
+                self.stats["compacted"] += 1
+            else:
+                self.stats["dropped"] += 1
+                continue
+            remaining -= tokens
+            chosen.append((item["order"], header + text))
+        self.stats["tokens"] = self.budget - remaining
+        if self.stats["compacted"] or self.stats["dropped"]:
+            logger.info(
+                f"[Context] Packed {len(chosen)}/{len(self._items)} items into {self.stats['tokens']}/{self.budget} tokens "
+                f"({self.stats['compacted']} compacted, {self.stats['dropped']} dropped, {self.stats['duplicates']} duplicates)"
+            )
+        from src.core.lightning_optim import optimizer
+        span = optimizer.current_span()
+        if span is not None:
+            span.add(context_tokens=self.stats["tokens"], context_dropped=self.stats["dropped"])
+        return separator.join(text for _, text in sorted(chosen))
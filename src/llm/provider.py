@@ -1,7 +1,6 @@
 import os
 import sys
 import logging
-import litellm
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +11,20 @@ try:
 except ImportError:
     pass
 
+_api_base_logged = False
+
+def get_api_base() -> str | None:
+    """
+    Local Model / WebUI Support (e.g., LM Studio, Ollama, vLLM).
+    Passed with each request instead of mutating the global `litellm.api_base` on every call.
+    """
+    global _api_base_logged
+    custom_base = os.getenv("CUSTOM_API_BASE") or None
+    if custom_base and not _api_base_logged:
+        _api_base_logged = True
+        logger.info(f"[LLM Router] Detected CUSTOM_API_BASE: {custom_base}. Overriding standard Litellm routing.")
+    return custom_base
+
 def get_llm() -> str:
     """
     Returns a model identifier optimized for LiteLLM compatibility out of the box.
@@ -22,13 +35,7 @@ def get_llm() -> str:
     # 1. Primary Model String
     model_string = os.getenv("SWARM_MODEL", "openai/gpt-4o")
     
-    # 2. Local Model / WebUI Support (e.g., LM Studio, Ollama, vLLM)
-    custom_base = os.getenv("CUSTOM_API_BASE")
-    if custom_base:
-        litellm.api_base = custom_base
-        logger.info(f"[LLM Router] Detected CUSTOM_API_BASE: {custom_base}. Overriding standard Litellm routing.")
-        
-    # 3. Simple Validation
+    # 2. Simple Validation (a custom api_base is applied per request, see get_api_base)
     if model_string.startswith("anthropic/") and not os.getenv("ANTHROPIC_API_KEY"):
         logger.warning("SWARM_MODEL is Anthropic, but ANTHROPIC_API_KEY is not set.")
     elif model_string.startswith("openai/") and not os.getenv("OPENAI_API_KEY"):
@@ -39,3 +46,19 @@ def get_llm() -> str:
     # LiteLLM parses things like "ollama/llama3" and "openrouter/claude" automatically
     # returned directly to the CrewAI LLM param
     return model_string
+
+def generate_swarm_response(system_prompt: str, user_prompt: str, role: str = "coder", validate=None,
+                            start_tier: int = 0) -> str:
+    """
+    Single-shot system + user prompt through the shared async LLM layer, routed for the given node role.
+    `validate(text)` rejecting the reply escalates to the role's next model tier; `start_tier` skips
+    cheaper tiers up front (e.g. on a retry). Returns the text reply.
+    """
+    from src.llm.async_provider import complete_for_role
+    response = complete_for_role(
+        role,
+        [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}],
+        validate=(lambda r: validate(r.choices[0].message.content or "")) if validate else None,
+        start_tier=start_tier
+    )
+    return response.choices[0].message.content or ""
@@ -0,0 +1,118 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from src.core.lightning_optim import optimizer
+from src.core.task_queue import TaskCancelled
+
+logger = logging.getLogger(__name__)
+
+ROLES = ("planner", "coder", "verifier")
+# Weight of the newest sample in the exponentially weighted latency average
+LATENCY_ALPHA = 0.3
+# A failed call counts as this many seconds, so flaky providers sink to the back of their tier
+FAILURE_PENALTY_SECONDS = 60.0
+
+
+def parse_route(spec: str) -> list[list[str]]:
+    """
+    Parses a route spec into tiers of interchangeable models.
+    ">" separates tiers (cheap/fast first, escalating to strong), "|" separates
+    alternatives within a tier, e.g. "groq/llama-3.1-8b-instant|openai/gpt-4o-mini > openai/gpt-4o".
+    """
+    tiers = []
+    for tier in spec.split(">"):
+        models = [m.strip() for m in tier.split("|") if m.strip()]
+        if models:
+            tiers.append(models)
+    return tiers
+
+
+class ModelRouter:
+    """
+    Picks models per node role from SWARM_ROUTE_<ROLE> (falling back to SWARM_MODEL).
+    Within a tier, models are tried fastest-first by observed latency and fall back to the
+    next one on errors; a response rejected by the caller's validator escalates to the next tier.
+    """
+    def __init__(self):
+        self._latency: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def tiers(self, role: Optional[str]) -> list[list[str]]:
+        from src.llm.provider import get_llm
+        spec = os.getenv(f"SWARM_ROUTE_{role.upper()}", "") if role else ""
+        return parse_route(spec) or [[get_llm()]]
+
+    def ordered_tiers(self, role: Optional[str]) -> list[list[str]]:
+        with self._lock:
+            # Models never measured sort first so every alternative gets sampled
+            return [sorted(tier, key=lambda m: self._latency.get(m, 0.0)) for tier in self.tiers(role)]
+
+    def preferred_model(self, role: Optional[str] = None) -> str:
+        return self.ordered_tiers(role)[0][0]
+
+    def record(self, model: str, seconds: float, ok: bool):
+        sample = seconds if ok else max(seconds, FAILURE_PENALTY_SECONDS)
+        with self._lock:
+            previous = self._latency.get(model)
+            self._latency[model] = sample if previous is None else (1 - LATENCY_ALPHA) * previous + LATENCY_ALPHA * sample
+
+    def latency_snapshot(self) -> dict[str, float]:
+        with self._lock:
+            return dict(self._latency)
+
+    async def acomplete(self, role: Optional[str], messages: list, *, validate: Optional[Callable[[Any], bool]] = None,
+                        start_tier: int = 0, **kwargs) -> Any:
+        """
+        Routes one completion for `role`. `start_tier` skips cheaper tiers (e.g. on a retry after
+        failed verification). Responses failing `validate` escalate to the next tier; the last
+        tier's response is returned as-is.
+        """
+        from src.llm.async_provider import acomplete
+
+        tiers = self.ordered_tiers(role)
+        tiers = tiers[min(start_tier, len(tiers) - 1):]
+        last_error: Optional[Exception] = None
+        rejected = None
+
+        with optimizer.span("llm.route", kind="router", role=role or "default", start_tier=start_tier) as span:
+            attempts = 0
+            for tier_index, tier in enumerate(tiers):
+                is_last_tier = tier_index == len(tiers) - 1
+                for model in tier:
+                    attempts += 1
+                    span.set(attempts=attempts, escalations=tier_index, model=model)
+                    start = time.perf_counter()
+                    try:
+                        response = await acomplete(model, messages, **kwargs)
+                    except TaskCancelled:
+                        raise
+                    except Exception as e:
+                        self.record(model, time.perf_counter() - start, ok=False)
+                        logger.warning(f"[LLM Router] {role or 'default'} call to {model} failed, falling back: {e}")
+                        last_error = e
+                        continue
+                    self.record(model, time.perf_counter() - start, ok=True)
+
+                    if validate is None or is_last_tier or _is_valid(validate, response):
+                        return response
+                    logger.info(f"[LLM Router] {model} response rejected for role {role}; escalating to the next tier")
+                    rejected = response
+                    break
+
+            if rejected is not None:
+                # Stronger tiers all errored: a rejected answer still beats none
+                return rejected
+            raise RuntimeError(f"All models routed for role '{role}' failed. Last error: {last_error}")
+
+
+def _is_valid(validate: Callable[[Any], bool], response: Any) -> bool:
+    try:
+        return bool(validate(response))
+    except Exception:
+        return False
+
+
+router = ModelRouter()
@@ -1,30 +1,45 @@
+import logging
+import os
+import sqlite3
+import threading
 from langgraph.graph import StateGraph, START, END
+from src.core.cache_paths import get_cache_root
+from src.core.lightning_optim import optimizer
+from src.core.metrics import VERIFY_OUTCOMES
 from src.nexus.state import SwarmState
 from src.nexus.nodes.macro import plan_node, crew_node, verify_node, escalate_node
 
+logger = logging.getLogger(__name__)
+
 MAX_RETRIES = 3
+# "sqlite" (durable across restarts), "memory" (resume within this process) or "off"
+CHECKPOINT_MODE = os.getenv("NEXUS_CHECKPOINTS", "sqlite").lower()
 
 def verify_router(state: SwarmState) -> str:
     """Routing logic after Verification."""
     if state.get("status") == "verification_passed":
+        VERIFY_OUTCOMES.inc(route="passed")
         return END
         
     if state.get("retries", 0) >= MAX_RETRIES:
+        VERIFY_OUTCOMES.inc(route="escalate")
         return "escalate"
         
+    VERIFY_OUTCOMES.inc(route="retry")
     return "crew" # Loop back to fix
 
-def build_graph():
+def build_graph(checkpointer=None):
     """
     Compiles the Swarm into an executable structure.
+    With a checkpointer, every completed node is saved per thread_id so interrupted runs can resume.
     """
     workflow = StateGraph(SwarmState)
 
-    # Define nodes
-    workflow.add_node("plan", plan_node)
-    workflow.add_node("crew", crew_node)
-    workflow.add_node("verify", verify_node)
-    workflow.add_node("escalate", escalate_node)
+    # Define nodes (each run is recorded as a span)
+    workflow.add_node("plan", optimizer.traced("node.plan", kind="node")(plan_node))
+    workflow.add_node("crew", optimizer.traced("node.crew", kind="node")(crew_node))
+    workflow.add_node("verify", optimizer.traced("node.verify", kind="node")(verify_node))
+    workflow.add_node("escalate", optimizer.traced("node.escalate", kind="node")(escalate_node))
 
     # Define edges (The loops)
     workflow.add_edge(START, "plan")
@@ -40,4 +55,44 @@ def build_graph():
     
     workflow.add_edge("escalate", END)
 
-    return workflow.compile()
+    return workflow.compile(checkpointer=checkpointer)
+
+
+_graph = None
+_checkpointer = None
+_graph_lock = threading.Lock()
+
+
+def create_checkpointer():
+    """SQLite checkpointer under the cache root, falling back to an in-memory one (or None when disabled)."""
+    if CHECKPOINT_MODE == "off":
+        return None
+    if CHECKPOINT_MODE == "sqlite":
+        try:
+            from langgraph.checkpoint.sqlite import SqliteSaver
+            path = get_cache_root() / "checkpoints.sqlite3"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(path), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            logger.info(f"[Graph] Checkpointing task state to {path}")
+            return SqliteSaver(conn)
+        except ImportError:
+            logger.warning("[Graph] langgraph-checkpoint-sqlite is not installed; task state only survives until the server restarts.")
+    from langgraph.checkpoint.memory import InMemorySaver
+    return InMemorySaver()
+
+
+def get_graph():
+    """The checkpointed graph, compiled once per process and shared by every delegation."""
+    global _graph, _checkpointer
+    with _graph_lock:
+        if _graph is None:
+            _checkpointer = create_checkpointer()
+            _graph = build_graph(_checkpointer)
+        return _graph
+
+
+def clear_checkpoints(thread_id: str):
+    """Drops the saved state of a finished task so the checkpoint database doesn't grow forever."""
+    if _checkpointer is not None:
+        _checkpointer.delete_thread(thread_id)
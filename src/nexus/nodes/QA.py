@@ -1,19 +1,14 @@
+from src.llm.context import ContextPacker
 from src.llm.provider import generate_swarm_response
 from src.nexus.state import SwarmState
 from src.nexus.tools.fs import SandboxedFS
 
-def qa_node(state: SwarmState) -> dict:
+def review_step(step, target_dir: str) -> bool:
     """
-    The Reviewer Agent.
-    Validates what the coder executed.
+    Asks the verifier whether one plan step was completed. The files the step declares are shown
+    alongside the workspace tree; returns True on PASS.
     """
-    plan = state.get("execution_plan", [])
-    current_index = state.get("current_step", 0)
-    
-    if current_index >= len(plan):
-        return {} # Exit condition
-    
-    fs = SandboxedFS(state["target_directory"])
+    fs = SandboxedFS(target_dir)
     files_tree = fs.list_files()
     
     system_prompt = (
@@ -22,11 +17,37 @@ def qa_node(state: SwarmState) -> dict:
         "Respond strictly with 'PASS' or 'FAIL'. Providing any other output causes a crash."
     )
     
-    user_prompt = f"Workspace Tree:\n{files_tree}\n\nTask requirement: {plan[current_index]}"
+    requirement = step.get("description", "") if isinstance(step, dict) else step
+    # The step's own files outrank the workspace tree, which is compacted or dropped on big repos
+    packer = ContextPacker.for_role("verifier")
+    packer.add("tree", files_tree, title="Workspace Tree")
+    packer.add("task", requirement, title="Task requirement", required=True)
+    for path in step.get("files", []) if isinstance(step, dict) else []:
+        try:
+            content = fs.read_file(path)
+        except (PermissionError, UnicodeDecodeError) as e:
+            content = f"Error: {e}"
+        packer.add("file", content, title=f"--- {path} ---", key=f"file:{path}")
+    user_prompt = packer.pack()
     
-    response = generate_swarm_response(system_prompt, user_prompt)
+    response = generate_swarm_response(
+        system_prompt, user_prompt, role="verifier",
+        validate=lambda text: text.strip().upper() in ("PASS", "FAIL")
+    )
+    return "FAIL" not in response.upper()
+
+def qa_node(state: SwarmState) -> dict:
+    """
+    The Reviewer Agent.
+    Validates what the coder executed.
+    """
+    plan = state.get("execution_plan", [])
+    current_index = state.get("current_step", 0)
+    
+    if current_index >= len(plan):
+        return {} # Exit condition
     
-    if "FAIL" in response.upper():
+    if not review_step(plan[current_index], state["target_dir"]):
         return {
             "revision_count": state.get("revision_count", 0) + 1,
             "messages": ["QA failed the execution. Sending back to Coder."]
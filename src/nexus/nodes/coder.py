@@ -1,7 +1,72 @@
+import re
+from contextlib import nullcontext
+from pathlib import PurePosixPath
 from src.llm.provider import generate_swarm_response
 from src.nexus.state import SwarmState
 from src.nexus.tools.fs import SandboxedFS
 
+# FILE: path\nCONTENT:\n...\nEND, repeated once per file the step changes
+_FILE_BLOCK = re.compile(r"FILE: *(.+?)\s*\nCONTENT:\n(.*?)\nEND\b", re.DOTALL)
+
+def normalize_path(path: str) -> str:
+    """Plan paths compared as written by the planner or the coder: forward slashes, no leading "./"."""
+    return str(PurePosixPath(path.replace("\\", "/").removeprefix("./")))
+
+def _describe(step) -> str:
+    if isinstance(step, dict):
+        files = f" (files: {', '.join(step['files'])})" if step.get("files") else ""
+        return f"{step.get('description', '')}{files}"
+    return str(step)
+
+def run_coder_step(step, target_dir: str, feedback: str = "", locks=None, start_tier: int = 0) -> str:
+    """
+    Asks the coder for the files of one plan step and writes them through SandboxedFS.
+    A step that declares its files may only write those: the scheduler keeps steps with common files
+    apart and the reviewer reads exactly those files, so a write elsewhere would escape both.
+    `locks` (a FileLocks) serializes writes to the same file across concurrently running steps;
+    `start_tier` starts the coder route that many model tiers higher.
+    """
+    declared = {normalize_path(f) for f in step.get("files", [])} if isinstance(step, dict) else set()
+    system_prompt = (
+        "You are the Swarm Execution Agent. You have been assigned a coding task. "
+        "Because this is a prototype, output your response as simple proposed file changes in this format, "
+        "one block per file:\n"
+        "FILE: path/to/file.py\nCONTENT:\nprint('hello')\nEND"
+    )
+    
+    user_prompt = f"Task: {_describe(step)}\nPlease provide the code."
+    if declared:
+        user_prompt += " Only write the files listed for this task."
+    if feedback:
+        user_prompt += f"\n\nThe reviewer rejected the previous attempt: {feedback}"
+    
+    response = generate_swarm_response(
+        system_prompt, user_prompt, role="coder",
+        validate=lambda text: "FILE: " in text and "CONTENT:" in text,
+        start_tier=start_tier
+    )
+    
+    blocks = [(path.strip(), content.strip()) for path, content in _FILE_BLOCK.findall(response)]
+    if not blocks and "FILE: " in response and "CONTENT:\n" in response:
+        # Single block with a missing END marker
+        blocks = [(response.split("FILE: ")[1].split("\n")[0].strip(), response.split("CONTENT:\n")[1].strip())]
+    if not blocks:
+        return f"Coder attempted task but failed to parse output: {response[:50]}..."
+    
+    # Execute on the sandboxed file system!
+    fs = SandboxedFS(target_dir)
+    results = []
+    for filepath, content in blocks:
+        if declared and normalize_path(filepath) not in declared:
+            results.append(f"Error: {filepath} is not among the files of this step ({', '.join(sorted(declared))}); not written.")
+            continue
+        try:
+            with locks.hold([filepath]) if locks else nullcontext():
+                results.append(f"Coder modified {filepath}: {fs.write_file(filepath, content)}")
+        except PermissionError as e:
+            results.append(f"Error: {e}")
+    return "\n".join(results)
+
 def coder_node(state: SwarmState) -> dict:
     """
     The Execution Agent. 
@@ -13,32 +78,4 @@ def coder_node(state: SwarmState) -> dict:
     if current_index >= len(plan):
         return {"messages": ["Coder has no more tasks to execute."]}
         
-    active_task = plan[current_index]
-    
-    system_prompt = (
-        "You are the Swarm Execution Agent. You have been assigned a coding task. "
-        "Because this is a prototype, output your response as a simple proposed file change in this format:\n"
-        "FILE: path/to/file.py\nCONTENT:\nprint('hello')\nEND"
-    )
-    
-    user_prompt = f"Task: {active_task}\nPlease provide the code."
-    
-    response = generate_swarm_response(system_prompt, user_prompt)
-    
-    # Very basic parsing for the prototype wrapper
-    try:
-        if "FILE: " in response and "CONTENT:" in response:
-            filepath = response.split("FILE: ")[1].split("\n")[0].strip()
-            content = response.split("CONTENT:\n")[1].split("\nEND")[0].strip()
-            
-            # Execute on the sandboxed file system!
-            fs = SandboxedFS(state["target_directory"])
-            fs_result = fs.write_file(filepath, content)
-            
-            return {
-                "messages": [f"Coder modified {filepath}: {fs_result}"]
-            }
-    except Exception as e:
-        pass
-        
-    return {"messages": [f"Coder attempted task but failed to parse output: {response[:50]}..."]}
+    return {"messages": [run_coder_step(plan[current_index], state["target_dir"])]}
@@ -1,89 +1,444 @@
+import contextvars
 import logging
 import json
-from litellm import completion
+import os
+from concurrent.futures import ThreadPoolExecutor
+from src.llm.async_provider import complete_for_role
+from src.llm.context import budget_for_role, compact, get_tokenizer
 from src.nexus.tools.fs import SandboxedFS
 from src.nexus.tools.bash_safe import SafeBash
 from src.core.lightning_optim import optimizer
-from src.llm.provider import get_llm
+from src.core.task_queue import report_progress, check_cancelled
 
 logger = logging.getLogger(__name__)
 
-def execute_crew(task_description: str, target_dir: str, llm_model: str = "gpt-4o") -> str:
-    """Entrypoint from LangGraph to run the micro-swarm purely via explicit Litellm loops (CrewAI-free)."""
-    fs = SandboxedFS(target_dir)
-    bash = SafeBash(target_dir)
-    llm = get_llm()
-
-    logger.info("Handing off to Native LangGraph Micro-Orchestrator...")
+# Agent loop budget: stop after this many LLM turns or once this many tokens were spent
+MAX_TURNS = int(os.getenv("NEXUS_CREW_MAX_TURNS", "12"))
+TOKEN_BUDGET = int(os.getenv("NEXUS_CREW_TOKEN_BUDGET", "200000"))
+TOOL_WORKERS = 8
+# Tool output fed back to the model is compacted (head and tail kept) to keep the conversation within context
+MAX_TOOL_RESULT_TOKENS = int(os.getenv("NEXUS_TOOL_RESULT_TOKENS", "5000"))
 
-    # Define minimal tools for LiteLLM
-    tools = [
-        {
-            "type": "function",
-            "function": {
-                "name": "write_file",
-                "description": "Writes content explicitly to a file in the sandbox.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "filepath": {"type": "string", "description": "Name of the file, e.g. hello_world.py"},
-                        "content": {"type": "string", "description": "The exact script or text to write"}
-                    },
-                    "required": ["filepath", "content"]
-                }
+# Define minimal tools for LiteLLM
+TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "write_file",
+            "description": "Writes content explicitly to a file in the sandbox.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "filepath": {"type": "string", "description": "Name of the file, e.g. hello_world.py"},
+                    "content": {"type": "string", "description": "The exact script or text to write"}
+                },
+                "required": ["filepath", "content"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "write_files",
+            "description": "Writes several files in one all-or-nothing step (either every file is written or none is). Prefer it over repeated write_file calls for multi-file changes.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "files": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "filepath": {"type": "string", "description": "Path relative to the sandbox root"},
+                                "content": {"type": "string", "description": "The complete new content of the file"}
+                            },
+                            "required": ["filepath", "content"]
+                        }
+                    }
+                },
+                "required": ["files"]
             }
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "run_bash",
-                "description": "Runs a terminal command (like python -m pytest) to verify code compilation and tests.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "command": {"type": "string", "description": "Bash command, like python test.py"}
-                    },
-                    "required": ["command"]
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "read_files",
+            "description": "Reads several whole files in one call. Use read_file_chunk for parts of large files.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "filepaths": {"type": "array", "items": {"type": "string"}, "description": "Paths relative to the sandbox root"}
+                },
+                "required": ["filepaths"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "edit_file_chunks",
+            "description": "Replaces several line ranges of an existing file in one atomic write. Line numbers refer to the file before this call (as shown by read_file_chunk), so hunks don't shift each other. Ranges must not overlap.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "filepath": {"type": "string", "description": "Path relative to the sandbox root"},
+                    "edits": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "start_line": {"type": "integer", "description": "First line to replace (1-indexed)"},
+                                "end_line": {"type": "integer", "description": "Last line to replace (inclusive)"},
+                                "new_content": {"type": "string", "description": "Replacement text for those lines"}
+                            },
+                            "required": ["start_line", "end_line", "new_content"]
+                        }
+                    }
+                },
+                "required": ["filepath", "edits"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "run_bash",
+            "description": "Runs a terminal command (like python -m pytest) to verify code compilation and tests.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "command": {"type": "string", "description": "Bash command, like python test.py"}
+                },
+                "required": ["command"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "list_files",
+            "description": "Lists a directory as a tree, skipping .gitignore'd files and dependency folders. Paginated: pass the returned cursor to get the next page. Use pattern (a glob like *.py) for a flat list of matching files.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "directory": {"type": "string", "description": "Directory relative to the sandbox root. Defaults to the root."},
+                    "max_depth": {"type": "integer", "description": "Levels below the directory to include (1 = direct children)."},
+                    "pattern": {"type": "string", "description": "Glob matched against paths and file names, e.g. *.py or tests/*"},
+                    "cursor": {"type": "string", "description": "Cursor from the previous page"}
                 }
             }
         }
-    ]
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "find_definition",
+            "description": "Finds where a Python class, function or module-level variable is defined. Returns file:line locations to read with read_file_chunk.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "symbol": {"type": "string", "description": "Bare or dotted name, e.g. run or SafeBash.run"}
+                },
+                "required": ["symbol"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "find_references",
+            "description": "Finds every import and usage of a Python symbol across the codebase. Returns file:line locations.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "symbol": {"type": "string", "description": "Name of the symbol, e.g. SandboxedFS"}
+                },
+                "required": ["symbol"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "grep_codebase",
+            "description": "Fast lexical search across all files. Ranks files for identifiers/keywords (BM25), or scans for a regex when regex=true. Returns file:line matches.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {"type": "string", "description": "Identifier, keywords, or a regular expression"},
+                    "regex": {"type": "boolean", "description": "Treat the query as a regular expression. Defaults to false."}
+                },
+                "required": ["query"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "read_file_chunk",
+            "description": "Reads an inclusive, 1-indexed line range of a file. Use it with the locations from find_definition/find_references instead of reading whole files.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "filepath": {"type": "string", "description": "Path relative to the sandbox root"},
+                    "start_line": {"type": "integer", "description": "First line to read (1-indexed)"},
+                    "end_line": {"type": "integer", "description": "Last line to read (inclusive)"}
+                },
+                "required": ["filepath", "start_line", "end_line"]
+            }
+        }
+    }
+]
+
+
+def dispatch_tool(fs: SandboxedFS, bash: SafeBash, fn_name: str, args: dict) -> str:
+    """Routes one tool call to the sandboxed implementation."""
+    if fn_name == "write_file":
+        logger.info(f"[Agent] Executing write_file on {args['filepath']}")
+        return fs.write_file(args['filepath'], args['content'])
+    elif fn_name == "write_files":
+        logger.info(f"[Agent] Executing write_files on {len(args['files'])} files")
+        return fs.write_files(args['files'])
+    elif fn_name == "read_files":
+        logger.info(f"[Agent] Executing read_files on {len(args['filepaths'])} files")
+        return fs.read_files(args['filepaths'])
+    elif fn_name == "edit_file_chunks":
+        logger.info(f"[Agent] Executing edit_file_chunks on {args['filepath']} ({len(args['edits'])} edits)")
+        return fs.edit_file_chunks(args['filepath'], args['edits'])
+    elif fn_name == "run_bash":
+        logger.info(f"[Agent] Executing run_bash on {args['command']}")
+        return bash.run(args['command'])
+    elif fn_name == "list_files":
+        logger.info(f"[Agent] Executing list_files on {args.get('directory', '.')}")
+        max_depth = args.get('max_depth')
+        return fs.list_files(
+            args.get('directory') or ".", max_depth=int(max_depth) if max_depth is not None else None,
+            pattern=args.get('pattern') or None, cursor=args.get('cursor') or None
+        )
+    elif fn_name == "find_definition":
+        logger.info(f"[Agent] Executing find_definition on {args['symbol']}")
+        return fs.find_definition(args['symbol'])
+    elif fn_name == "find_references":
+        logger.info(f"[Agent] Executing find_references on {args['symbol']}")
+        return fs.find_references(args['symbol'])
+    elif fn_name == "grep_codebase":
+        logger.info(f"[Agent] Executing grep_codebase on {args['query']}")
+        return fs.grep_codebase(args['query'], regex=bool(args.get('regex', False)))
+    elif fn_name == "read_file_chunk":
+        logger.info(f"[Agent] Executing read_file_chunk on {args['filepath']}")
+        return fs.read_file_chunk(args['filepath'], int(args['start_line']), int(args['end_line']))
+    return f"Error: Unknown tool '{fn_name}'."
+
+
+# Tools that change files, and read-only tools that look at the whole tree rather than named files
+WRITE_TOOLS = frozenset({"write_file", "write_files", "edit_file_chunks"})
+TREE_READ_TOOLS = frozenset({"grep_codebase", "search_codebase", "find_definition", "find_references", "list_files"})
+
+
+def _write_targets(fn_name: str, args: dict) -> list[str]:
+    """Files a mutating tool call touches (used to order writes per file)."""
+    if not isinstance(args, dict):
+        return []
+    if fn_name in ("write_file", "edit_file_chunks"):
+        return [os.path.normpath(args.get("filepath", ""))]
+    if fn_name == "write_files" and isinstance(args.get("files"), list):
+        return [os.path.normpath(f.get("filepath", "")) for f in args["files"] if isinstance(f, dict)]
+    return []
+
+
+def _read_targets(fn_name: str, args: dict) -> list[str]:
+    """Files a read-only tool call reads whole or in part (ordered after writes to them in the same turn)."""
+    if not isinstance(args, dict):
+        return []
+    if fn_name == "read_file_chunk":
+        return [os.path.normpath(args.get("filepath", ""))]
+    if fn_name == "read_files" and isinstance(args.get("filepaths"), list):
+        return [os.path.normpath(str(p)) for p in args["filepaths"]]
+    return []
+
+
+def execute_tool_calls(fs: SandboxedFS, bash: SafeBash, calls: list[tuple[str, dict]]) -> list[str]:
+    """
+    Executes one turn's tool calls and returns their results in call order.
+    run_bash acts as a barrier (it may observe any file), and tree-wide reads (TREE_READ_TOOLS) are
+    never run alongside a write: each sees every earlier write and none of the later ones. Everything
+    else between barriers runs concurrently: file reads each on their own, writes serialized per file.
+    """
+    results: list = [None] * len(calls)
+    batch: list[int] = []
+    batch_writes = batch_scans = False
+    for idx, (fn_name, args) in enumerate(calls):
+        writes = fn_name in WRITE_TOOLS
+        scans = fn_name in TREE_READ_TOOLS
+        if fn_name == "run_bash" or (scans and batch_writes) or (writes and batch_scans):
+            _run_batch(fs, bash, calls, batch, results)
+            batch = []
+            batch_writes = batch_scans = False
+        if fn_name == "run_bash":
+            results[idx] = _safe_dispatch(fs, bash, *calls[idx])
+            continue
+        batch.append(idx)
+        batch_writes = batch_writes or writes
+        batch_scans = batch_scans or scans
+    _run_batch(fs, bash, calls, batch, results)
+    return results
+
+
+def _run_batch(fs: SandboxedFS, bash: SafeBash, calls: list, indices: list[int], results: list):
+    if not indices:
+        return
+    written = {path for i in indices for path in _write_targets(*calls[i])}
+
+    # Group call indices into chains that must run in order: one chain per written file
+    # (reads of that file join its chain), every other read-only call is its own chain.
+    chains: list[list[int]] = []
+    chain_of_path: dict[str, list[int]] = {}
+    for i in indices:
+        fn_name, args = calls[i]
+        paths = _write_targets(fn_name, args) or [p for p in _read_targets(fn_name, args) if p in written]
+        if not paths:
+            chains.append([i])
+            continue
+        # A call touching files of several chains merges them (multi-file writes and reads)
+        linked = []
+        for path in paths:
+            existing = chain_of_path.get(path)
+            if existing is not None and not any(existing is c for c in linked):
+                linked.append(existing)
+        if not linked:
+            chain = []
+            chains.append(chain)
+        else:
+            chain = linked[0]
+            for other in linked[1:]:
+                chain.extend(other)
+                chains[:] = [c for c in chains if c is not other]
+                for path, owner in chain_of_path.items():
+                    if owner is other:
+                        chain_of_path[path] = chain
+            chain.sort()  # merged chains keep call order
+        chain.append(i)
+        for path in paths:
+            chain_of_path[path] = chain
+
+    def run_chain(chain: list[int]):
+        for i in chain:
+            results[i] = _safe_dispatch(fs, bash, *calls[i])
+
+    if len(chains) == 1:
+        run_chain(chains[0])
+        return
+    with ThreadPoolExecutor(max_workers=min(TOOL_WORKERS, len(chains))) as pool:
+        # Each worker gets a copy of the caller's context (current task, progress reporting)
+        futures = [pool.submit(contextvars.copy_context().run, run_chain, chain) for chain in chains]
+        for future in futures:
+            future.result()
+
+
+def _safe_dispatch(fs: SandboxedFS, bash: SafeBash, fn_name: str, args) -> str:
+    if isinstance(args, str):
+        return args  # argument parsing already failed; report the error to the model
+    with optimizer.span(f"tool.{fn_name}", kind="tool") as span:
+        try:
+            result = str(dispatch_tool(fs, bash, fn_name, args))
+        except KeyError as e:
+            result = f"Error: Missing argument {e} for tool '{fn_name}'."
+        except Exception as e:
+            logger.warning(f"[Agent] Tool {fn_name} failed: {e}")
+            result = f"Error: {e}"
+        span.set(result_chars=len(result), failed=result.startswith("Error"))
+    # Cheap length check first: only outputs that could exceed the budget get tokenized
+    if len(result) > MAX_TOOL_RESULT_TOKENS:
+        result = compact(result, MAX_TOOL_RESULT_TOKENS, get_tokenizer(budget_for_role("coder")[0]))
+    return result
+
+
+def _tool_arguments_valid(response) -> bool:
+    """Router validator: a coder reply whose tool arguments aren't valid JSON escalates to a stronger model."""
+    for tc in getattr(response.choices[0].message, "tool_calls", None) or []:
+        json.loads(tc.function.arguments or "{}")
+    return True
+
+
+def execute_crew(task_description: str, target_dir: str, start_tier: int = 0, temperature: float | None = None) -> str:
+    """
+    Entrypoint from LangGraph to run the micro-swarm purely via explicit Litellm loops (CrewAI-free).
+    Models come from the "coder" route; `start_tier` skips cheaper tiers on retries.
+    """
+    fs = SandboxedFS(target_dir)
+    bash = SafeBash(target_dir)
+
+    logger.info("Handing off to Native LangGraph Micro-Orchestrator...")
 
     messages = [
-        {"role": "system", "content": "You are the Senior Coder Agent. Your job is to analyze the user's task and immediately use the 'write_file' tool to fulfill the request. Be precise. You may then use 'run_bash' to test it."},
+        {"role": "system", "content": "You are the Senior Coder Agent. Your job is to analyze the user's task and immediately use the 'write_file' tool to fulfill the request. Be precise. Use 'find_definition', 'find_references' and 'read_file_chunk' to inspect only the code you need. Change existing files with 'edit_file_chunks' rather than rewriting them, and use 'write_files'/'read_files' to handle several files in one call. You may then use 'run_bash' to test it. Tool results are returned to you, so keep iterating until the task is done, then reply without calling any tool."},
         {"role": "user", "content": task_description}
     ]
 
     # Optimization wrapper for tracking telemetry
     def native_llm_execution():
-        response = completion(
-            model=llm,
-            messages=messages,
-            tools=tools,
-            tool_choice="auto"
-        )
-        
-        message = response.choices[0].message
-        
-        # Actually wire the tool call routing
-        if hasattr(message, 'tool_calls') and message.tool_calls:
-            results = []
-            for tool_call in message.tool_calls:
-                fn_name = tool_call.function.name
-                args = json.loads(tool_call.function.arguments)
-                
-                if fn_name == "write_file":
-                    logger.info(f"[Agent] Executing write_file on {args['filepath']}")
-                    r = fs.write_file(args['filepath'], args['content'])
-                    results.append(r)
-                elif fn_name == "run_bash":
-                    logger.info(f"[Agent] Executing run_bash on {args['command']}")
-                    r = bash.run(args['command'])
-                    results.append(r)
-                    
-            return f"Agent successfully called tools. Results: {'; '.join(results)}"
-        else:
-            return f"Agent responded without making tool calls: {message.content}"
+        tokens_used = 0
+        tool_calls_made = 0
+        last_results: list[str] = []
+
+        # Agent loop: tool results are fed back until the model answers without tool calls
+        for turn in range(1, MAX_TURNS + 1):
+            check_cancelled()
+            response = complete_for_role(
+                "coder",
+                messages,
+                tools=TOOLS,
+                tool_choice="auto",
+                validate=_tool_arguments_valid,
+                start_tier=start_tier,
+                temperature=temperature
+            )
+            usage = getattr(response, "usage", None)
+            tokens_used += getattr(usage, "total_tokens", 0) or 0
+            
+            message = response.choices[0].message
+            tool_calls = getattr(message, 'tool_calls', None) or []
+            
+            if not tool_calls:
+                if tool_calls_made == 0:
+                    return f"Agent responded without making tool calls: {message.content}"
+                return (
+                    f"Agent finished after {turn} turns and {tool_calls_made} tool calls. "
+                    f"Final response: {message.content}\nLast tool results: {'; '.join(last_results)}"
+                )
+
+            messages.append({
+                "role": "assistant",
+                "content": message.content,
+                "tool_calls": [
+                    {"id": tc.id, "type": "function", "function": {"name": tc.function.name, "arguments": tc.function.arguments}}
+                    for tc in tool_calls
+                ]
+            })
+
+            calls = []
+            for tc in tool_calls:
+                try:
+                    calls.append((tc.function.name, json.loads(tc.function.arguments or "{}")))
+                except json.JSONDecodeError as e:
+                    calls.append((tc.function.name, f"Error: Invalid JSON arguments for '{tc.function.name}': {e}"))
+
+            last_results = execute_tool_calls(fs, bash, calls)
+            tool_calls_made += len(calls)
+            for tc, result in zip(tool_calls, last_results):
+                messages.append({"role": "tool", "tool_call_id": tc.id, "name": tc.function.name, "content": result})
+            report_progress(message=f"Crew turn {turn}: ran {', '.join(name for name, _ in calls)}")
+
+            if tokens_used >= TOKEN_BUDGET:
+                logger.warning(f"[Agent] Token budget exhausted after {turn} turns ({tokens_used} tokens)")
+                return (
+                    f"Agent stopped: token budget of {TOKEN_BUDGET} exhausted after {turn} turns. "
+                    f"Last tool results: {'; '.join(last_results)}"
+                )
+
+        logger.warning(f"[Agent] Reached max turns ({MAX_TURNS})")
+        return f"Agent stopped after reaching the maximum of {MAX_TURNS} turns. Last tool results: {'; '.join(last_results)}"
 
     result = optimizer.trace_execution(
         agent_name="Native_Litellm_Agent",
@@ -0,0 +1,202 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+from src.core.lightning_optim import optimizer
+from src.core.task_queue import check_cancelled
+from src.nexus.nodes.coder import normalize_path, run_coder_step
+from src.nexus.nodes.planner import planner_node
+from src.nexus.nodes.QA import review_step
+
+logger = logging.getLogger(__name__)
+
+# "agent" runs the tool-calling crew; "dag" plans steps with their files and schedules them in parallel
+CREW_MODE = os.getenv("NEXUS_CREW_MODE", "agent").lower()
+# Steps (coder + QA) in flight at once
+DAG_MAX_PARALLEL = int(os.getenv("NEXUS_DAG_MAX_PARALLEL", "4"))
+# Coder re-runs per step after a QA rejection before the step (and its dependents) are given up
+DAG_STEP_REVISIONS = int(os.getenv("NEXUS_DAG_STEP_REVISIONS", "2"))
+
+
+class FileLocks:
+    """
+    One lock per file path, taken around each write so two steps writing the same file never
+    interleave. `hold` may take several locks at once; it always acquires them in sorted path order
+    (and releases them in reverse), so two writers can never each wait on a lock the other holds.
+    """
+    def __init__(self):
+        self._locks: dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    @contextmanager
+    def hold(self, paths: list[str]):
+        with self._guard:
+            locks = [self._locks.setdefault(p, threading.Lock()) for p in sorted({normalize_path(p) for p in paths})]
+        for lock in locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+
+class _StepRun:
+    def __init__(self, step: dict):
+        self.step = step
+        self.status = "pending"  # pending | running | passed | failed | skipped
+        self.attempts = 0
+        self.started = 0.0
+        self.finished = 0.0
+        self.messages: list[str] = []
+
+    @property
+    def duration(self) -> float:
+        return max(0.0, self.finished - self.started)
+
+
+class DagScheduler:
+    """
+    Runs plan steps as soon as every step they depend on has passed, up to `max_parallel` at once.
+    Each step is coder then QA (with revisions), so one step's review overlaps other steps' coding.
+    Steps declaring a common file are never in flight together, whatever their dependencies say; a step
+    declaring no files may write any, so it runs alone. A step that exhausts its revisions is failed and everything downstream of it is skipped.
+    """
+    def __init__(self, steps: list[dict], target_dir: str, max_parallel: int = DAG_MAX_PARALLEL,
+                 revisions: int = DAG_STEP_REVISIONS, start_tier: int = 0):
+        self.runs = {step["id"]: _StepRun(step) for step in steps}
+        self.target_dir = target_dir
+        self.max_parallel = max(1, max_parallel)
+        self.revisions = revisions
+        self.start_tier = start_tier
+        self.locks = FileLocks()
+        self.wall_seconds = 0.0
+
+    def _ready(self, limit: int) -> list[_StepRun]:
+        running = [run for run in self.runs.values() if run.status == "running"]
+        if any(not run.step["files"] for run in running):
+            return []
+        busy = {normalize_path(f) for run in running for f in run.step["files"]}
+        ready = []
+        for run in self.runs.values():
+            if len(ready) >= limit:
+                break
+            if run.status != "pending" or not all(self.runs[d].status == "passed" for d in run.step["depends_on"]):
+                continue
+            files = {normalize_path(f) for f in run.step["files"]}
+            if not files:
+                # Unknown files: only start it with nothing else in flight, and start nothing beside it
+                if running or ready:
+                    continue
+                ready.append(run)
+                break
+            if files & busy:
+                continue
+            busy |= files
+            ready.append(run)
+        return ready
+
+    def _skip_dependents(self, failed_id: str):
+        for run in self.runs.values():
+            if run.status == "pending" and failed_id in run.step["depends_on"]:
+                run.status = "skipped"
+                run.messages.append(f"Skipped: depends on {failed_id}")
+                self._skip_dependents(run.step["id"])
+
+    def run(self) -> dict[str, _StepRun]:
+        start = time.perf_counter()
+        with optimizer.span("dag.schedule", kind="scheduler", steps=len(self.runs), max_parallel=self.max_parallel) as span:
+            with ThreadPoolExecutor(max_workers=self.max_parallel, thread_name_prefix="nexus-dag") as pool:
+                in_flight = {}
+                while True:
+                    for run in self._ready(self.max_parallel - len(in_flight)):
+                        run.status = "running"
+                        # Each worker gets a copy of the caller's context (current task, parent span)
+                        in_flight[pool.submit(contextvars.copy_context().run, self._run_step, run)] = run
+                    if not in_flight:
+                        break
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        run = in_flight.pop(future)
+                        try:
+                            future.result()
+                        except Exception as e:
+                            logger.warning(f"[DAG] Step {run.step['id']} crashed: {e}")
+                            run.status = "failed"
+                            run.messages.append(f"Error: {e}")
+                        if run.status == "failed":
+                            self._skip_dependents(run.step["id"])
+                    check_cancelled()
+            self.wall_seconds = time.perf_counter() - start
+            critical_seconds, critical_ids = self.critical_path()
+            span.set(
+                wall_s=round(self.wall_seconds, 3),
+                serial_s=round(sum(r.duration for r in self.runs.values()), 3),
+                critical_path_s=round(critical_seconds, 3),
+                critical_path=critical_ids
+            )
+        return self.runs
+
+    def _run_step(self, run: _StepRun):
+        step = run.step
+        run.started = time.perf_counter()
+        with optimizer.span("dag.step", kind="step", step=step["id"], files=len(step["files"])) as span:
+            feedback = ""
+            for attempt in range(self.revisions + 1):
+                check_cancelled()
+                run.attempts = attempt + 1
+                run.messages.append(run_coder_step(
+                    step, self.target_dir, feedback=feedback, locks=self.locks, start_tier=self.start_tier
+                ))
+                if review_step(step, self.target_dir):
+                    run.status = "passed"
+                    break
+                feedback = "QA marked the step as not done."
+                logger.info(f"[DAG] Step {step['id']} rejected by QA (attempt {attempt + 1})")
+            else:
+                run.status = "failed"
+            span.set(status=run.status, attempts=run.attempts)
+        run.finished = time.perf_counter()
+
+    def critical_path(self) -> tuple[float, list[str]]:
+        """Longest chain of dependent step durations: the lower bound on wall time at any parallelism."""
+        memo: dict[str, tuple[float, list[str]]] = {}
+
+        def longest(step_id: str) -> tuple[float, list[str]]:
+            if step_id not in memo:
+                run = self.runs[step_id]
+                before = max((longest(d) for d in run.step["depends_on"]), default=(0.0, []), key=lambda x: x[0])
+                memo[step_id] = (before[0] + run.duration, before[1] + [step_id])
+            return memo[step_id]
+
+        return max((longest(step_id) for step_id in self.runs), default=(0.0, []), key=lambda x: x[0])
+
+    def report(self) -> str:
+        runs = list(self.runs.values())
+        passed = sum(1 for r in runs if r.status == "passed")
+        critical_seconds, critical_ids = self.critical_path()
+        lines = [
+            f"DAG crew: {passed}/{len(runs)} steps passed in {self.wall_seconds:.1f}s "
+            f"(serial {sum(r.duration for r in runs):.1f}s, critical path {critical_seconds:.1f}s: {' -> '.join(critical_ids)})"
+        ]
+        for run in runs:
+            outcome = "PASS" if run.status == "passed" else run.status.upper().replace("FAILED", "FAIL")
+            lines.append(f"[{run.step['id']}] {outcome} after {run.attempts} attempt(s): {run.step['description']}")
+            lines.extend(f"    {line}" for message in run.messages[-1:] for line in message.splitlines())
+        return "\n".join(lines)
+
+
+def run_dag_crew(task_description: str, target_dir: str, start_tier: int = 0) -> str:
+    """
+    Plans the task as a step DAG and executes it with the DagScheduler; returns the crew report.
+    `start_tier` starts every coder call that many model tiers higher, as the other crew modes do on retries.
+    """
+    plan = planner_node({"task_description": task_description})["execution_plan"]
+    logger.info(f"[DAG] Scheduling {len(plan)} steps with up to {DAG_MAX_PARALLEL} in parallel (coder tier +{start_tier})")
+    scheduler = DagScheduler(plan, target_dir, start_tier=start_tier)
+    scheduler.run()
+    return scheduler.report()
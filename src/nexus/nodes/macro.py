@@ -1,9 +1,13 @@
 import logging
 from typing import Dict
-from litellm import completion
-from src.llm.provider import get_llm
+from src.llm.async_provider import complete_for_role
+from src.llm.context import ContextPacker
 from src.nexus.state import SwarmState
 from src.nexus.nodes.crew_executor import execute_crew
+from src.nexus.nodes.dag import CREW_MODE, run_dag_crew
+from src.nexus.nodes.speculative import SPECULATIVE_ATTEMPTS, run_speculative_crew
+from src.nexus.tools.snapshots import ROLLBACK_ON_RETRY, discard_task_snapshot, get_workspace_snapshots
+from src.nexus.tools.verification import run_affected_tests, format_failures
 
 logger = logging.getLogger(__name__)
 
@@ -18,7 +22,6 @@ def search_external_docs(query: str) -> str:
 
 def plan_node(state: SwarmState) -> Dict:
     logger.info("[Macro Node] Planning and Fetching Web Docs...")
-    model = get_llm()
     
     docs_context = search_external_docs(state.get('task_description', ''))
     
@@ -26,40 +29,80 @@ def plan_node(state: SwarmState) -> Dict:
         f"Create a very brief, high-level approach to solve this task: {state.get('task_description')}\n"
         f"Use the following recently fetched web documentation for accuracy: {docs_context}"
     )
-    # LiteLLM routing
-    response = completion(model=model, messages=[{"role": "user", "content": prompt}])
+    # Routed to the planner tier through the shared async layer (answered from the response cache when enabled)
+    response = complete_for_role(
+        "planner",
+        [{"role": "user", "content": prompt}],
+        validate=lambda r: bool((r.choices[0].message.content or "").strip())
+    )
     plan = response.choices[0].message.content
     return {"plan": plan, "status": "planning_complete"}
 
 def crew_node(state: SwarmState) -> Dict:
     logger.info("[Macro Node] Dispatching Micro-Orchestrator (Crew)...")
-    extended_task = f"Plan: {state.get('plan')}\nTask: {state.get('task_description')}"
+    # One snapshot per task collects the pre-image of every file any attempt writes; a retry restores them first
+    snapshots = get_workspace_snapshots(state.get("target_dir"))
+    snapshot_id = state.get("snapshot_id")
+    if not snapshot_id or not snapshots.exists(snapshot_id):
+        snapshot_id = snapshots.begin()
+    rolled_back = bool(state.get("retries", 0) and ROLLBACK_ON_RETRY)
+    if rolled_back:
+        snapshots.rollback(snapshot_id)
     
+    # Packed to the coder's token budget: task first, then the last failures, then the plan
+    packer = ContextPacker.for_role("coder")
+    packer.add("plan", state.get("plan", ""), title="Plan")
+    packer.add("task", state.get("task_description", ""), title="Task", required=True)
     if state.get("verification_errors"):
-         extended_task += f"\n\nCRITICAL FIX REQUIRED: Previous run failed with:\n{state.get('verification_errors')}"
+        title = "CRITICAL FIX REQUIRED: Previous run failed with"
+        if rolled_back:
+            title = "CRITICAL FIX REQUIRED: Previous run (its changes were reverted, start again from the original files) failed with"
+        packer.add("errors", state.get("verification_errors"), title=title)
+    extended_task = packer.pack()
          
-    # Handoff to CrewAI
-    result = execute_crew(extended_task, state.get("target_dir"), get_llm())
-    return {"crew_result": result, "status": "execution_complete"}
+    # Handoff to CrewAI. Each failed verification starts the coder one model tier higher.
+    with snapshots.recording(snapshot_id):
+        if CREW_MODE == "dag":
+            result = run_dag_crew(extended_task, state.get("target_dir"), start_tier=state.get("retries", 0))
+        elif SPECULATIVE_ATTEMPTS > 1:
+            result = run_speculative_crew(extended_task, state.get("target_dir"), retries=state.get("retries", 0))
+        else:
+            result = execute_crew(extended_task, state.get("target_dir"), start_tier=state.get("retries", 0))
+    return {"crew_result": result, "status": "execution_complete", "snapshot_id": snapshot_id}
 
 def verify_node(state: SwarmState) -> Dict:
     logger.info("[Macro Node] Verifying the Crew's work...")
-    # Mocking standard verification (e.g., test suite).
-    # If the Crew output literally contains "FAIL", we flag it and increment retries.
+    # Runs only the tests affected by the files the crew changed (import-graph test impact selection).
     r_count = state.get("retries", 0)
+    result = run_affected_tests(state.get("target_dir"))
+    
+    if result["status"] == "failed":
+        logger.warning(f"Verification Failed ({result['summary'] or 'test run broke'}). Retry {r_count + 1}")
+        return {
+            "verification_errors": format_failures(result),
+            "verification_failures": result["failures"],
+            "status": "verification_failed",
+            "retries": r_count + 1
+        }
     
-    if "FAIL" in state.get("crew_result", "").upper():
-        logger.warning(f"Verification Failed. Retry {r_count + 1}")
+    # No affected tests: fall back to the crew's own report
+    if result["status"] == "no_tests" and "FAIL" in state.get("crew_result", "").upper():
+        logger.warning(f"Verification Failed (crew reported failure, no affected tests). Retry {r_count + 1}")
         return {
-            "verification_errors": "Crew indicated failure or tests failed.", 
+            "verification_errors": "Crew indicated failure and no tests cover the changed files.", 
+            "verification_failures": [],
             "status": "verification_failed",
             "retries": r_count + 1
         }
     
-    logger.info("Verification Passed.")
-    return {"verification_errors": "", "status": "verification_passed"}
+    logger.info(f"Verification Passed ({result['summary'] or 'no affected tests'}).")
+    # The task is over: its changes stay as they are, and the pre-images are no longer needed
+    discard_task_snapshot(state)
+    return {"verification_errors": "", "verification_failures": [], "status": "verification_passed"}
 
 def escalate_node(state: SwarmState) -> Dict:
     logger.error("[Macro Node] MAX_RETRIES HIT. Escalating to human.")
+    # The last attempt's changes are left in place for the human to review
+    discard_task_snapshot(state)
     final_output = f"Escalation Report: Swarm could not verify changes after {state.get('retries')} attempts.\nLast Result: {state.get('crew_result')}"
     return {"status": "escalated", "crew_result": final_output}
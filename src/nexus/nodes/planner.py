@@ -1,30 +1,82 @@
 import json
+import logging
 from src.llm.provider import generate_swarm_response
 from src.nexus.state import SwarmState
 
+logger = logging.getLogger(__name__)
+
+def _is_json_array(text: str) -> bool:
+    return isinstance(json.loads(text), list)
+
+def normalize_plan(raw) -> list[dict]:
+    """
+    Coerces planner output into DAG steps {id, description, files, depends_on}.
+    Plain strings (the legacy format) become a sequential chain; unknown dependencies are dropped,
+    and a cyclic plan falls back to running its steps in the order given.
+    """
+    items = raw if isinstance(raw, list) else [raw]
+    steps = []
+    for index, item in enumerate(items):
+        if isinstance(item, dict):
+            step_id = str(item.get("id") or f"s{index + 1}")
+            description = str(item.get("description") or item.get("task") or "")
+            files = [str(f) for f in item.get("files") or []]
+            depends_on = [str(d) for d in item.get("depends_on") or []]
+        else:
+            step_id = f"s{index + 1}"
+            description = str(item)
+            files = []
+            depends_on = [f"s{index}"] if index else []
+        if any(step["id"] == step_id for step in steps):
+            step_id = f"{step_id}-{index + 1}"
+        steps.append({"id": step_id, "description": description, "files": files, "depends_on": depends_on})
+
+    ids = {step["id"] for step in steps}
+    for step in steps:
+        step["depends_on"] = [d for d in step["depends_on"] if d in ids and d != step["id"]]
+
+    if _has_cycle(steps):
+        logger.warning("[Planner] Plan has a dependency cycle; running its steps sequentially")
+        for index, step in enumerate(steps):
+            step["depends_on"] = [steps[index - 1]["id"]] if index else []
+    return steps
+
+def _has_cycle(steps: list[dict]) -> bool:
+    remaining = {step["id"]: set(step["depends_on"]) for step in steps}
+    while remaining:
+        ready = [step_id for step_id, deps in remaining.items() if not deps]
+        if not ready:
+            return True
+        for step_id in ready:
+            del remaining[step_id]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+    return False
+
 def planner_node(state: SwarmState) -> dict:
     """
     The Architect Agent.
-    Receives the raw prompt and returns a JSON array of specific filesystem tasks.
+    Receives the raw prompt and returns a dependency graph of steps, each listing the files it touches.
     """
     system_prompt = (
         "You are the Swarm Architect. Your job is to break down the user's objective "
-        "into a series of concrete steps. "
-        "Return ONLY a raw JSON array of strings representing the steps. "
+        "into concrete steps that can run in parallel where they are independent. "
+        "Return ONLY a raw JSON array of objects with the keys "
+        "\"id\" (short string), \"description\" (the step), \"files\" (paths the step creates or edits) "
+        "and \"depends_on\" (ids of steps that must finish first). "
+        "Only add a dependency when a step really needs the other's result. "
         "Do not use markdown blocks. Just the array."
     )
     
-    user_prompt = f"Objective: {state['task_description']}\n\nBreak this down into 1-3 concrete implementation steps."
+    user_prompt = f"Objective: {state['task_description']}\n\nBreak this down into 1-5 concrete implementation steps."
     
-    response = generate_swarm_response(system_prompt, user_prompt)
+    response = generate_swarm_response(system_prompt, user_prompt, role="planner", validate=_is_json_array)
     
     try:
         # Standardize the LLM output into an actual python array
-        plan = json.loads(response)
-        if not isinstance(plan, list):
-            plan = [response]
+        plan = normalize_plan(json.loads(response))
     except json.JSONDecodeError:
-        plan = [response] # fallback if the LLM messes up the JSON
+        plan = normalize_plan([response]) # fallback if the LLM messes up the JSON
         
     return {
         "execution_plan": plan,
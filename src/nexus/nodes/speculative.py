@@ -0,0 +1,152 @@
+import contextvars
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Optional
+
+from src.core.cache_paths import repo_cache_dir
+from src.core.git_sandbox import GitSandbox
+from src.core.lightning_optim import optimizer
+from src.core.task_queue import cancel_scope, check_cancelled, TaskCancelled
+from src.nexus.nodes.crew_executor import execute_crew
+from src.nexus.tools.snapshots import get_workspace_snapshots
+from src.nexus.tools.verification import run_affected_tests
+
+logger = logging.getLogger(__name__)
+
+# 1 disables speculation; N > 1 runs N crew attempts side by side and keeps the first that verifies
+SPECULATIVE_ATTEMPTS = int(os.getenv("NEXUS_SPECULATIVE_ATTEMPTS", "1"))
+# Attempt i samples at TEMPERATURES[i % len]; diversity is what makes parallel attempts worth it
+SPECULATIVE_TEMPERATURES = [
+    float(t) for t in os.getenv("NEXUS_SPECULATIVE_TEMPERATURES", "0.2,0.7,1.0").split(",") if t.strip()
+]
+# Also start attempt i that many model tiers higher (see SWARM_ROUTE_CODER)
+SPREAD_TIERS = os.getenv("NEXUS_SPECULATIVE_SPREAD_TIERS", "").lower() in ("1", "true", "yes")
+
+
+class _Attempt:
+    def __init__(self, index: int, path: Path, temperature: Optional[float], start_tier: int):
+        self.index = index
+        self.path = path
+        self.temperature = temperature
+        self.start_tier = start_tier
+        self.stop = threading.Event()
+        self.crew_result = ""
+        self.verification: dict = {}
+        self.error: Optional[str] = None
+
+    @property
+    def passed(self) -> bool:
+        status = self.verification.get("status")
+        if self.error or status is None:
+            return False
+        # No affected tests: trust the crew's own report, like verify_node does
+        return status == "passed" or (status == "no_tests" and "FAIL" not in self.crew_result.upper())
+
+    @property
+    def label(self) -> str:
+        return f"attempt {self.index + 1} (temperature {self.temperature}, tier +{self.start_tier})"
+
+
+def run_speculative_crew(task_description: str, target_dir: str, retries: int = 0,
+                         attempts: int = SPECULATIVE_ATTEMPTS) -> str:
+    """
+    Runs `attempts` crew attempts concurrently, each in its own detached worktree seeded with the
+    sandbox's current state, and verifies each one as soon as it finishes. The first attempt whose
+    affected tests pass wins: the others are cancelled and the winner's changes are applied to the sandbox.
+    If none passes, the attempt with the fewest failures is applied so the retry loop can build on it.
+    """
+    base_dir = Path(target_dir).resolve()
+    git = GitSandbox(str(base_dir))
+    base_tree = git.snapshot_tree(base_dir)
+
+    run_id = uuid.uuid4().hex[:8]
+    workspace = repo_cache_dir(base_dir, "speculative")
+    candidates = []
+    for index in range(attempts):
+        path = workspace / f"{run_id}-{index}"
+        git.add_detached_worktree(path, base_tree)
+        temperature = SPECULATIVE_TEMPERATURES[index % len(SPECULATIVE_TEMPERATURES)] if SPECULATIVE_TEMPERATURES else None
+        candidates.append(_Attempt(index, path, temperature, retries + (index if SPREAD_TIERS else 0)))
+    logger.info(f"[Speculative] Running {attempts} crew attempts for {base_dir}")
+
+    pool = ThreadPoolExecutor(max_workers=attempts, thread_name_prefix="nexus-speculative")
+    futures = {
+        pool.submit(contextvars.copy_context().run, _run_attempt, attempt, task_description): attempt
+        for attempt in candidates
+    }
+    winner = None
+    finished = []
+    try:
+        for future in as_completed(futures):
+            attempt = futures[future]
+            future.result()
+            finished.append(attempt)
+            if attempt.passed:
+                winner = attempt
+                logger.info(f"[Speculative] {attempt.label} verified first; cancelling the others")
+                break
+            check_cancelled()
+    finally:
+        for attempt in candidates:
+            attempt.stop.set()
+        pool.shutdown(wait=False)
+        # Losers stop at their next cancellation point; their worktrees are removed once they have
+        threading.Thread(
+            target=_cleanup, args=(git, list(futures), candidates), name="nexus-speculative-cleanup", daemon=True
+        ).start()
+
+    check_cancelled()
+    chosen = winner or _least_failing(finished)
+    if chosen is None:
+        return "Speculative crew failed: every attempt errored. " + "; ".join(a.error or "" for a in finished)
+
+    chosen_tree = git.snapshot_tree(chosen.path)
+    patch = git.run_cmd(["git", "diff", "--binary", base_tree, chosen_tree], cwd=base_dir)
+    if patch:
+        # The patch bypasses SandboxedFS, so the files it changes are recorded for a retry's rollback here
+        snapshots = get_workspace_snapshots(base_dir)
+        for name in git.run_cmd(["git", "diff", "--name-only", "-z", base_tree, chosen_tree], cwd=base_dir).split("\0"):
+            if name:
+                snapshots.capture(base_dir / name)
+        git.run_cmd(["git", "apply", "--binary", "--whitespace=nowarn", "-"], cwd=base_dir, input_text=patch + "\n")
+    outcome = "verified" if winner else "best unverified"
+    return f"[Speculative {outcome} {chosen.label} of {attempts}] {chosen.crew_result}"
+
+
+def _run_attempt(attempt: _Attempt, task_description: str):
+    with cancel_scope(attempt.stop), optimizer.span(
+        "speculative.attempt", kind="attempt", index=attempt.index, temperature=attempt.temperature
+    ) as span:
+        try:
+            attempt.crew_result = execute_crew(
+                task_description, str(attempt.path),
+                start_tier=attempt.start_tier, temperature=attempt.temperature
+            )
+            check_cancelled()
+            attempt.verification = run_affected_tests(str(attempt.path))
+        except TaskCancelled as e:
+            attempt.error = f"cancelled: {e}"
+        except Exception as e:
+            logger.warning(f"[Speculative] {attempt.label} failed: {e}")
+            attempt.error = str(e)
+        span.set(passed=attempt.passed)
+
+
+def _least_failing(finished: list[_Attempt]) -> Optional[_Attempt]:
+    usable = [a for a in finished if not a.error]
+    return min(usable, key=lambda a: len(a.verification.get("failures", [])), default=None)
+
+
+def _cleanup(git: GitSandbox, futures: list, candidates: list[_Attempt]):
+    for future in futures:
+        try:
+            future.result()
+        except Exception:
+            pass
+    # Under the repository lock, like every other worktree add/remove (see GitSandbox)
+    git.remove_worktrees([attempt.path for attempt in candidates])
+    logger.info(f"[Speculative] Removed {len(candidates)} attempt worktrees")
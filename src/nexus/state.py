@@ -11,5 +11,8 @@ class SwarmState(TypedDict):
     plan: str
     crew_result: str
     verification_errors: str
+    verification_failures: list
     retries: int
     status: str
+    # Pre-images of the files the crew attempts touched, restored before each retry (see tools/snapshots.py)
+    snapshot_id: str
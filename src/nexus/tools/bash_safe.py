@@ -1,41 +1,186 @@
+import contextvars
+import os
+import signal
 import subprocess
+import threading
+import time
 import logging
+from collections import deque
+
+from src.core.lightning_optim import optimizer
+from src.core.task_queue import report_progress, cancel_requested, TaskCancelled
 
 logger = logging.getLogger(__name__)
 
+HEAD_LINES = 200
+TAIL_LINES = 300
+# Longer lines are cut so a single runaway line can't exhaust memory either
+MAX_LINE_BYTES = 4096
+TRUNCATED_LINE_MARKER = b" ... [LINE TRUNCATED]"
+READ_CHUNK_BYTES = 65536
+# Minimum seconds between two progress notifications carrying command output
+PROGRESS_INTERVAL = 1.0
+# How long to keep draining the pipe after the shell exits (background children may hold it open)
+DRAIN_GRACE_SECONDS = 2.0
+
+
+class _BoundedCapture:
+    """
+    Consumes a process pipe in blocks while it fills, keeping only the first HEAD_LINES
+    lines and a ring buffer of the last TAIL_LINES, so memory stays flat however much is printed.
+    """
+    def __init__(self, label: str):
+        self.label = label
+        self.head: list[bytes] = []
+        self.tail: deque[bytes] = deque(maxlen=TAIL_LINES)
+        self.total = 0
+        self._last_progress = 0.0
+
+    def consume(self, stream):
+        fd = stream.fileno()
+        pending = b""
+        overflow = False
+        while True:
+            block = os.read(fd, READ_CHUNK_BYTES)
+            if not block:
+                break
+            if overflow:
+                # Still inside an over-long line that was already cut: skip to its end
+                nl = block.find(b"\n")
+                if nl == -1:
+                    continue
+                block = block[nl:]
+                overflow = False
+            lines = (pending + block).split(b"\n")
+            pending = lines.pop()
+            if len(pending) > MAX_LINE_BYTES:
+                pending = pending[:MAX_LINE_BYTES] + TRUNCATED_LINE_MARKER
+                overflow = True
+            self._add(lines)
+        if pending:
+            self._add([pending])
+        stream.close()
+
+    def _add(self, lines: list[bytes]):
+        if not lines:
+            return
+        self.total += len(lines)
+        room = HEAD_LINES - len(self.head)
+        if room > 0:
+            self.head.extend(_clip(line) for line in lines[:room])
+            lines = lines[room:]
+        self.tail.extend(_clip(line) for line in lines[-TAIL_LINES:])
+
+        now = time.monotonic()
+        if now - self._last_progress >= PROGRESS_INTERVAL:
+            self._last_progress = now
+            last = (self.tail[-1] if self.tail else self.head[-1])
+            report_progress(message=f"[{self.label}] {_decode(last)[:200]}")
+
+    def render(self) -> str:
+        head = [_decode(line) for line in self.head]
+        tail = [_decode(line) for line in self.tail]
+        omitted = self.total - len(head) - len(tail)
+        if omitted > 0:
+            return "\n".join(head + [f"\n... [TRUNCATED {omitted} LINES - OUTPUT TOO LARGE] ...\n"] + tail)
+        return "\n".join(head + tail)
+
+
+def _clip(line: bytes) -> bytes:
+    if len(line) > MAX_LINE_BYTES + len(TRUNCATED_LINE_MARKER):
+        return line[:MAX_LINE_BYTES] + TRUNCATED_LINE_MARKER
+    return line
+
+
+def _decode(line: bytes) -> str:
+    return line.decode("utf-8", errors="replace").rstrip("\r")
+
+
 class SafeBash:
     def __init__(self, root_dir: str):
         self.root_dir = root_dir
 
-    def run(self, cmd: str, timeout: int = 30) -> str:
+    def run(self, cmd: str, timeout: int = 30, env: dict | None = None) -> str:
         """
         Runs a terminal command in the sandboxed root directory.
-        If the output exceeds 500 lines, it truncates the middle to preserve context window limits.
+        Output is streamed as it is produced: only the first 200 and last 300 lines are kept,
+        and the latest line is forwarded as a progress notification of the running task.
+        On timeout the command's whole process group is killed. `env` adds to the inherited environment.
         """
+        with optimizer.span("subprocess.bash", kind="subprocess", command=cmd[:200], timeout=timeout) as span:
+            return self._run(cmd, timeout, span, env)
+
+    def _run(self, cmd: str, timeout: int, span, env: dict | None = None) -> str:
+        popen_kwargs = {}
+        if os.name == "nt":
+            popen_kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+        else:
+            # Own session => own process group, so children die with the command
+            popen_kwargs["start_new_session"] = True
+
         try:
-            result = subprocess.run(
+            proc = subprocess.Popen(
                 cmd,
                 cwd=self.root_dir,
                 shell=True,
-                check=False,
-                capture_output=True,
-                text=True,
-                timeout=timeout
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                env={**os.environ, **env} if env else None,
+                **popen_kwargs
             )
-            
-            output = result.stdout + "\n" + result.stderr
-            lines = output.splitlines()
-            
-            # Truncation logic to prevent context overwhelm
-            if len(lines) > 500:
-                head = lines[:200]
-                tail = lines[-300:]
-                return "\n".join(head + ["\n... [TRUNCATED 500+ LINES - OUTPUT TOO LARGE] ...\n"] + tail)
-            
-            return "\n".join(lines)
-            
-        except subprocess.TimeoutExpired:
-            return f"Error: Command timed out after {timeout} seconds."
         except Exception as e:
             logger.error(f"Safe Bash failed: {e}")
             return str(e)
+
+        capture = _BoundedCapture(label=cmd[:40])
+        # Copy the context so progress reaches the task that launched the command
+        reader = threading.Thread(
+            target=contextvars.copy_context().run, args=(capture.consume, proc.stdout), daemon=True
+        )
+        reader.start()
+
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                try:
+                    proc.wait(timeout=min(0.5, max(0.0, deadline - time.monotonic())))
+                    break
+                except subprocess.TimeoutExpired:
+                    if cancel_requested():
+                        self._kill_tree(proc)
+                        raise TaskCancelled(f"Command cancelled: {cmd}")
+                    if time.monotonic() >= deadline:
+                        self._kill_tree(proc)
+                        reader.join(DRAIN_GRACE_SECONDS)
+                        partial = capture.render()
+                        span.set(timed_out=True, output_lines=capture.total)
+                        return f"Error: Command timed out after {timeout} seconds." + (f" Partial output:\n{partial}" if partial else "")
+
+            reader.join(DRAIN_GRACE_SECONDS)
+            if reader.is_alive():
+                # The shell exited but a background child still holds the pipe open
+                self._kill_tree(proc)
+                reader.join(DRAIN_GRACE_SECONDS)
+            span.set(exit_code=proc.returncode, output_lines=capture.total)
+            return capture.render()
+        except TaskCancelled:
+            raise
+        except Exception as e:
+            logger.error(f"Safe Bash failed: {e}")
+            self._kill_tree(proc)
+            return str(e)
+
+    @staticmethod
+    def _kill_tree(proc: subprocess.Popen):
+        try:
+            if os.name == "nt":
+                subprocess.run(["taskkill", "/F", "/T", "/PID", str(proc.pid)], capture_output=True)
+            else:
+                os.killpg(proc.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError, OSError):
+            pass
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            logger.warning(f"Process {proc.pid} did not exit after being killed.")
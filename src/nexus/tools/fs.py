@@ -1,6 +1,19 @@
 import os
+import re
 from pathlib import Path
 
+from src.llm.context import ContextPacker, budget_for_role
+from src.nexus.tools.lexical import get_lexical_index
+from src.nexus.tools.line_index import atomic_write_many, line_index
+from src.nexus.tools.listing import PAGE_SIZE, get_repo_lister, render_listing
+from src.nexus.tools.outline import get_outline_engine
+from src.nexus.tools.snapshots import get_workspace_snapshots
+from src.nexus.tools.symbols import format_locations, get_symbol_index
+from src.nexus.tools.vector_index import get_vector_index
+
+# Tokens of code search_codebase returns at most (lower-ranked hits are compacted, then dropped)
+SEARCH_TOKEN_BUDGET = int(os.getenv("NEXUS_SEARCH_TOKENS", "3000"))
+
 class SandboxedFS:
     """
     A file system wrapper that absolutely prevents paths from traversing 
@@ -8,6 +21,8 @@ class SandboxedFS:
     """
     def __init__(self, root_dir: str):
         self.root_dir = Path(root_dir).resolve()
+        # Pre-images of written files are recorded while a crew attempt's snapshot is active
+        self.snapshots = get_workspace_snapshots(self.root_dir)
 
     def _resolve_and_verify(self, filepath: str) -> Path:
         """
@@ -31,156 +46,221 @@ class SandboxedFS:
 
     def write_file(self, filepath: str, content: str) -> str:
         target = self._resolve_and_verify(filepath)
-        # Ensure parent directories exist
-        target.parent.mkdir(parents=True, exist_ok=True)
-        target.write_text(content, encoding="utf-8")
+        self.snapshots.capture(target)
+        # Temp file + rename (parent directories are created): never a half-written file on disk
+        line_index.write_with_index(target, content.encode("utf-8"))
         return f"Successfully wrote to {filepath}"
+
+    def write_files(self, files: list[dict]) -> str:
+        """
+        Writes several files ({filepath, content}) all-or-nothing: every path is verified up front,
+        contents go to temp files, and a single rename pass moves them into place.
+        """
+        if not files:
+            return "Error: No files given."
+        staged = []
+        errors = []
+        seen = set()
+        for item in files:
+            filepath = str(item.get("filepath", "")) if isinstance(item, dict) else ""
+            if not filepath or not isinstance(item.get("content"), str):
+                errors.append(f"Error: Each file needs a filepath and string content (got {str(item)[:80]}).")
+                continue
+            try:
+                target = self._resolve_and_verify(filepath)
+            except PermissionError as e:
+                errors.append(f"Error: {filepath}: {e}")
+                continue
+            if target in seen:
+                errors.append(f"Error: {filepath} is listed more than once.")
+                continue
+            if target.is_dir():
+                errors.append(f"Error: {filepath} is a directory.")
+                continue
+            seen.add(target)
+            staged.append((filepath, target, item["content"].encode("utf-8"), target.exists()))
+        if errors:
+            return "\n".join(["Error: No files were written."] + errors)
+        
+        try:
+            for _, target, _, _ in staged:
+                self.snapshots.capture(target)
+            atomic_write_many([(target, data) for _, target, data, _ in staged])
+        except OSError as e:
+            return f"Error: No files were written ({e})."
+        report = [f"Successfully wrote {len(staged)} files:"]
+        for filepath, target, data, existed in staged:
+            line_index.record(target, data)
+            report.append(f"- {filepath}: {'updated' if existed else 'created'} ({len(data)} bytes)")
+        return "\n".join(report)
+
+    def read_files(self, filepaths: list[str], max_chars_per_file: int = 20_000) -> str:
+        """Reads several files in one call; each file's section reports its own error (missing, outside the sandbox, binary)."""
+        if not filepaths:
+            return "Error: No files given."
+        sections = []
+        for filepath in dict.fromkeys(str(p) for p in filepaths):
+            try:
+                target = self._resolve_and_verify(filepath)
+                if not target.is_file():
+                    body = f"Error: File {filepath} does not exist."
+                else:
+                    body = target.read_text(encoding="utf-8")
+                    if len(body) > max_chars_per_file:
+                        body = body[:max_chars_per_file] + f"\n... [{len(body) - max_chars_per_file} more characters; use read_file_chunk]"
+            except PermissionError as e:
+                body = f"Error: {e}"
+            except UnicodeDecodeError:
+                body = f"Error: {filepath} is not a UTF-8 text file."
+            sections.append(f"--- {filepath} ---\n{body}")
+        return "\n\n".join(sections)
     
-    def list_files(self, directory: str = ".") -> str:
+    def list_files(self, directory: str = ".", max_depth: int | None = None, pattern: str | None = None,
+                   cursor: str | None = None, limit: int | None = None) -> str:
+        """
+        Tree of `directory` (or, with a glob `pattern`, the matching file paths), skipping .gitignore'd
+        paths, hidden directories and dependency/build folders. Paginated: a full page ends with the
+        cursor to pass for the next one. Directory listings are cached and checked against their mtime.
+        """
         target = self._resolve_and_verify(directory)
         if not target.exists() or not target.is_dir():
             return f"Error: Directory {directory} does not exist."
-            
-        tree = []
-        for root, dirs, files in os.walk(target):
-            # Skip hidden git folders
-            dirs[:] = [d for d in dirs if not d.startswith('.')]
-            level = str(root).replace(str(target), '').count(os.sep)
-            indent = ' ' * 4 * (level)
-            tree.append(f"{indent}{os.path.basename(root)}/")
-            subindent = ' ' * 4 * (level + 1)
-            for f in files:
-                tree.append(f"{subindent}{f}")
-        return "\n".join(tree)
-
-    def read_codebase_outline(self, directory: str = ".") -> str:
-        import ast
+        if max_depth is not None and max_depth < 1:
+            return "Error: max_depth must be at least 1."
+        
+        rel_dir = target.relative_to(self.root_dir).as_posix()
+        return render_listing(
+            get_repo_lister(self.root_dir), "" if rel_dir == "." else rel_dir,
+            max_depth=max_depth, pattern=pattern, cursor=cursor, limit=limit or PAGE_SIZE
+        )
+
+    def read_codebase_outline(self, directory: str = ".", signatures: bool = True) -> str:
+        """
+        Outline of the classes (with their methods) and functions of every Python file under `directory`,
+        with line ranges for read_file_chunk. Served from a persistent (path, mtime, size) keyed cache.
+        """
         target = self._resolve_and_verify(directory)
         if not target.exists() or not target.is_dir():
             return f"Error: Directory {directory} does not exist."
         
-        outline = []
-        for root, dirs, files in os.walk(target):
-            dirs[:] = [d for d in dirs if not d.startswith('.')]
-            for f in files:
-                if f.endswith('.py'):
-                    filepath = Path(root) / f
-                    # Algorithm safeguard: skip files larger than 1MB to prevent AST Memory crash
-                    if filepath.stat().st_size > 1_000_000:
-                        rel_path = filepath.relative_to(self.root_dir)
-                        outline.append(f"File: {rel_path} (Skipped: Exceeds 1MB)")
-                        continue
-                    
-                    rel_path = filepath.relative_to(self.root_dir)
-                    try:
-                        parsed = ast.parse(filepath.read_text(encoding="utf-8"))
-                        classes = [n.name for n in parsed.body if isinstance(n, ast.ClassDef)]
-                        funcs = [n.name for n in parsed.body if isinstance(n, ast.FunctionDef)]
-                        if classes or funcs:
-                            outline.append(f"File: {rel_path}")
-                            if classes: outline.append(f"  Classes: {', '.join(classes)}")
-                            if funcs: outline.append(f"  Functions: {', '.join(funcs)}")
-                    except Exception as e:
-                        outline.append(f"File: {rel_path} (Failed to parse: {e})")
-        return "\n".join(outline) if outline else "No python files found or parsed."
+        return get_outline_engine(self.root_dir).render(target, signatures=signatures)
+
+    def find_definition(self, symbol: str) -> str:
+        """Locates where a class, function or module-level variable is defined (bare or dotted name)."""
+        hits = get_symbol_index(self.root_dir).find_definition(symbol)
+        return format_locations(self.root_dir, f"--- Definitions of '{symbol}' ---", hits)
+
+    def find_references(self, symbol: str) -> str:
+        """Locates every import and usage of a symbol across the codebase's Python files."""
+        hits = get_symbol_index(self.root_dir).find_references(symbol)
+        return format_locations(self.root_dir, f"--- References to '{symbol}' ---", hits)
 
     def read_file_chunk(self, filepath: str, start_line: int, end_line: int) -> str:
+        """Inclusive, 1-indexed line range, read through a cached line-offset index instead of the whole file."""
         target = self._resolve_and_verify(filepath)
         if not target.exists():
             return f"Error: File {filepath} does not exist."
         
-        lines = target.read_text(encoding="utf-8").splitlines(keepends=True)
-        # Convert 1-indexed to 0-indexed slice
-        chunk = lines[max(0, start_line - 1):end_line]
-        return "".join([f"{i + start_line}: {line}" for i, line in enumerate(chunk)])
+        first, chunk = line_index.read_lines(target, start_line, end_line)
+        return "".join([f"{i + first}: {line}" for i, line in enumerate(chunk)])
 
     def edit_file_chunk(self, filepath: str, start_line: int, end_line: int, new_content: str) -> str:
+        result = self.edit_file_chunks(filepath, [{"start_line": start_line, "end_line": end_line, "new_content": new_content}])
+        if result.startswith("Error"):
+            return result
+        return f"Successfully updated {filepath} from lines {start_line} to {end_line}"
+
+    def edit_file_chunks(self, filepath: str, edits: list[dict]) -> str:
+        """
+        Replaces several non-overlapping line ranges ({start_line, end_line, new_content}) in one atomic
+        write (temp file + rename). Line numbers all refer to the file as it is before the call, so
+        earlier hunks never shift later ones. Unchanged bytes are copied from the original as-is.
+        """
         target = self._resolve_and_verify(filepath)
         if not target.exists():
             return f"Error: File {filepath} does not exist. Use write_file for new files."
-            
-        lines = target.read_text(encoding="utf-8").splitlines(keepends=True)
+        if not edits:
+            return "Error: No edits given."
+        try:
+            hunks = sorted((int(e["start_line"]), int(e["end_line"]), str(e["new_content"])) for e in edits)
+        except (KeyError, TypeError, ValueError) as e:
+            return f"Error: Each edit needs integer start_line/end_line and new_content ({e})."
         
-        if start_line < 1 or end_line > len(lines) + 1 or start_line > end_line:
-             return "Error: Invalid line range specified."
-
-        prefix = lines[:start_line - 1]
-        suffix = lines[end_line:]
+        with open(target, "rb") as f:
+            st = os.fstat(f.fileno())
+            data = f.read()
+        entry = line_index.entry(target, data, st)
+        line_count = len(entry.starts)
+        for i, (start_line, end_line, _) in enumerate(hunks):
+            if start_line < 1 or end_line > line_count + 1 or start_line > end_line:
+                return f"Error: Invalid line range {start_line}-{end_line} specified."
+            if i and start_line <= hunks[i - 1][1]:
+                return f"Error: Edits {hunks[i - 1][0]}-{hunks[i - 1][1]} and {start_line}-{end_line} overlap."
         
-        # Ensure new content has proper newlines for joining
-        new_lines = [line + '\n' for line in new_content.splitlines()]
-        if new_content and not new_content.endswith('\n'):
-            new_lines[-1] = new_lines[-1].rstrip('\n')  # Preserve if strict missing EOF newline
-            
-        new_file_content = "".join(prefix + new_lines + suffix)
-        target.write_text(new_file_content, encoding="utf-8")
-        return f"Successfully updated {filepath} from lines {start_line} to {end_line}"
+        pieces = []
+        position = 0
+        for start_line, end_line, new_content in hunks:
+            begin, end = entry.span(start_line, min(end_line, line_count)) if start_line <= line_count else (len(data), len(data))
+            pieces.append(data[position:begin])
+            if begin == len(data) and data and not data.endswith(b'\n'):
+                pieces.append(b'\n')  # appending after a last line without newline
+            # Ensure new content has proper newlines for joining
+            new_lines = [line + '\n' for line in new_content.splitlines()]
+            if new_content and not new_content.endswith('\n') and end == len(data) and not data.endswith(b'\n'):
+                new_lines[-1] = new_lines[-1].rstrip('\n')  # Preserve a strict missing EOF newline
+            pieces.append("".join(new_lines).encode("utf-8"))
+            position = end
+        pieces.append(data[position:])
+        
+        self.snapshots.capture(target, data)
+        line_index.write_with_index(target, b"".join(pieces))
+        ranges = ", ".join(f"{s}-{e}" for s, e, _ in hunks)
+        return f"Successfully applied {len(hunks)} edits to {filepath} (lines {ranges})"
+
+    def grep_codebase(self, query: str, regex: bool = False, top_k: int = 10) -> str:
+        """
+        Fast lexical search without any optional dependency.
+        Identifier/keyword queries are ranked with BM25 over an in-memory inverted index;
+        regex=True scans every text file for the pattern instead.
+        """
+        index = get_lexical_index(self.root_dir)
+        if regex:
+            try:
+                matches = index.grep(query)
+            except re.error as e:
+                return f"Error: Invalid regex '{query}': {e}"
+            if not matches:
+                return f"No matches for regex '{query}'."
+            out = [f"--- Regex Matches for '{query}' ---"]
+            out.extend(f"{rel}:{line}: {text}" for rel, line, text in matches)
+            return "\n".join(out)
+
+        ranked = index.search(query, top_k=top_k)
+        if not ranked:
+            return f"No lexical matches for '{query}'."
+        out = [f"--- Lexical Search Results for '{query}' ---"]
+        for rel, score, lines in ranked:
+            out.append(f"\nFile: {rel} (score {score:.2f})")
+            out.extend(f"  {line}: {text}" for line, text in lines)
+        return "\n".join(out)
 
     def search_codebase(self, query: str, top_k: int = 5) -> str:
         """
-        Semantic RAG search over the entire codebase to find relevant snippets. 
+        Semantic RAG search over the entire codebase to find relevant snippets.
+        Backed by a persistent per-repository index that only re-embeds files changed since the last query.
         """
         try:
-            import chromadb
-            # For MVP, we do ephemeral on-the-fly indexing 
-            # In production, this connects to a persistent Vector DB service
-            client = chromadb.Client()
-            collection = client.get_or_create_collection(name="codebase_rag")
-            
-            # Very basic on-the-fly index check (if empty, we index)
-            if collection.count() == 0:
-                docs = []
-                metadatas = []
-                ids = []
-                doc_id = 0
-                for root, dirs, files in os.walk(self.root_dir):
-                    dirs[:] = [d for d in dirs if not d.startswith('.')]
-                    for f in files:
-                        if f.endswith(('.py', '.md', '.ts', '.js', '.txt')):
-                            filepath = Path(root) / f
-                            # Safeguard against parsing massive non-code binaries or mega-logs
-                            if filepath.stat().st_size > 5_000_000:
-                                continue
-                                
-                            content = filepath.read_text(encoding="utf-8", errors='ignore')
-                            
-                            # Algorithmic Improvement: Semantic Chunking O(N) split instead of arbitrary slicing
-                            paragraphs = content.split('\n\n')
-                            chunks = []
-                            current_chunk = []
-                            current_length = 0
-                            
-                            for p in paragraphs:
-                                p_len = len(p)
-                                if current_length + p_len > 1000 and current_chunk:
-                                    chunks.append("\n\n".join(current_chunk))
-                                    current_chunk = [p]
-                                    current_length = p_len
-                                else:
-                                    current_chunk.append(p)
-                                    current_length += p_len
-                            if current_chunk:
-                                chunks.append("\n\n".join(current_chunk))
-                            
-                            for i, chunk in enumerate(chunks):
-                                docs.append(chunk)
-                                metadatas.append({"file": str(filepath.relative_to(self.root_dir)), "chunk": i})
-                                ids.append(f"doc_{doc_id}")
-                                doc_id += 1
-                if docs:
-                    collection.add(documents=docs, metadatas=metadatas, ids=ids)
+            hits = get_vector_index(self.root_dir).query(query, top_k=top_k)
             
-            if collection.count() == 0:
+            if not hits:
                 return "No indexable code found."
                 
-            results = collection.query(query_texts=[query], n_results=top_k)
-            
-            out = [f"--- Semantic Search Results for '{query}' ---"]
-            for i, doc in enumerate(results['documents'][0]):
-                meta = results['metadatas'][0][i]
-                out.append(f"\nFile: {meta['file']} (Chunk {meta['chunk']}):\n{doc}\n")
-            return "\n".join(out)
+            # Best hits first within the token budget; identical chunks (license headers, generated code) once
+            packer = ContextPacker(budget_for_role("coder")[0], SEARCH_TOKEN_BUDGET)
+            for rank, (file, chunk, doc) in enumerate(hits):
+                packer.add("search", doc, title=f"File: {file} (Chunk {chunk})", priority=len(hits) - rank)
+            return f"--- Semantic Search Results for '{query}' ---\n\n" + packer.pack()
         except ImportError:
-            return "Error: chromadb not installed. Semantic RAG disabled."
+            return "Note: chromadb not installed, falling back to lexical search.\n" + self.grep_codebase(query, top_k=top_k)
         except Exception as e:
             return f"Error during semantic search: {e}"
@@ -0,0 +1,234 @@
+import hashlib
+import logging
+import math
+import mmap
+import os
+import re
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from src.core.cache_paths import RootRegistry
+from src.core.git_session import cache_owner
+from src.nexus.tools.listing import get_repo_lister
+
+logger = logging.getLogger(__name__)
+
+# Files above this size are scanned for regex queries but not tokenized into the BM25 index
+MAX_INDEX_BYTES = 2_000_000
+MAX_SCAN_BYTES = 50_000_000
+# Files above this size are memory-mapped instead of read into memory
+MMAP_THRESHOLD = 1_000_000
+MAX_MATCHES = 100
+SCAN_WORKERS = min(8, (os.cpu_count() or 1) * 2)
+
+# BM25 tuning constants
+K1 = 1.5
+B = 0.75
+
+_IDENTIFIER = re.compile(rb"[A-Za-z_][A-Za-z0-9_]*")
+_CAMEL_PART = re.compile(rb"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+
+
+def tokenize(data: bytes) -> Counter:
+    """
+    Identifier tokens of a text, lowercased. Compound identifiers also contribute their
+    snake_case / camelCase parts, so "read_file_chunk" matches a query for "chunk".
+    """
+    counts = Counter()
+    # Split each distinct identifier once, however often it occurs
+    for ident, n in Counter(_IDENTIFIER.findall(data)).items():
+        counts[ident.lower()] += n
+        parts = [p for piece in ident.split(b"_") for p in _CAMEL_PART.findall(piece)]
+        if len(parts) > 1:
+            for part in parts:
+                counts[part.lower()] += n
+    return counts
+
+
+def _is_binary(data: bytes) -> bool:
+    return b"\0" in data[:8192]
+
+
+class TokenStore:
+    """
+    Latest token counts per file path of one repository, keyed by content hash and shared by its main
+    checkout and its worktrees (see cache_owner), so a new task worktree does not re-tokenize files
+    it shares with them. Holds one version per path.
+    """
+    def __init__(self, owner: Path):
+        self._counts: dict[str, tuple[str, Counter]] = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, rel: str, sha: str) -> Counter | None:
+        with self._lock:
+            known = self._counts.get(rel)
+        return known[1] if known is not None and known[0] == sha else None
+
+    def store(self, rel: str, sha: str, counts: Counter):
+        with self._lock:
+            self._counts[rel] = (sha, counts)
+
+
+_token_stores: RootRegistry[TokenStore] = RootRegistry(TokenStore)
+
+
+class LexicalIndex:
+    """
+    In-memory inverted index with BM25 ranking over every text file list_files shows (see RepoLister.stat_files).
+    Built lazily on the first query and kept current by re-tokenizing only files whose
+    (mtime, size) changed, and only if their content is not already in the repository's TokenStore.
+    Regex queries bypass the index and scan files in parallel.
+    """
+    def __init__(self, root_dir: Path):
+        self.root_dir = Path(root_dir).resolve()
+        self.tokens = _token_stores.get(cache_owner(self.root_dir))
+        self._files: dict[str, dict] = {}
+        # token -> {file -> term frequency}
+        self._postings: dict[bytes, dict[str, int]] = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def _scan(self) -> dict[str, os.stat_result]:
+        files = get_repo_lister(self.root_dir).stat_files()
+        return {rel: st for rel, st in files.items() if st.st_size <= MAX_SCAN_BYTES}
+
+    def refresh(self) -> dict[str, os.stat_result]:
+        with self._lock:
+            current = self._scan()
+            for rel in [rel for rel in self._files if rel not in current]:
+                self._remove(rel)
+
+            changed = [
+                rel for rel, st in current.items()
+                if st.st_size <= MAX_INDEX_BYTES and (
+                    rel not in self._files
+                    or self._files[rel]["mtime_ns"] != st.st_mtime_ns
+                    or self._files[rel]["size"] != st.st_size
+                )
+            ]
+            with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as pool:
+                tokenized = list(pool.map(self._tokenize_file, changed))
+
+            for rel, counts in zip(changed, tokenized):
+                self._remove(rel)
+                st = current[rel]
+                self._files[rel] = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "length": sum(counts.values()), "tokens": list(counts)}
+                self._total_length += self._files[rel]["length"]
+                for token, tf in counts.items():
+                    self._postings.setdefault(token, {})[rel] = tf
+
+            if changed:
+                logger.info(f"[Lexical Index] Tokenized {len(changed)} files in {self.root_dir}")
+            return current
+
+    def _tokenize_file(self, rel: str) -> Counter:
+        try:
+            data = (self.root_dir / rel).read_bytes()
+        except OSError:
+            return Counter()
+        sha = hashlib.sha1(data).hexdigest()
+        counts = self.tokens.lookup(rel, sha)
+        if counts is None:
+            counts = Counter() if _is_binary(data) else tokenize(data)
+            self.tokens.store(rel, sha, counts)
+        return counts
+
+    def _remove(self, rel: str):
+        entry = self._files.pop(rel, None)
+        if not entry:
+            return
+        self._total_length -= entry["length"]
+        for token in entry["tokens"]:
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(rel, None)
+                if not postings:
+                    del self._postings[token]
+
+    def search(self, query: str, top_k: int = 10) -> list[tuple[str, float, list[tuple[int, str]]]]:
+        """BM25-ranked files for an identifier / keyword query, each with its best matching lines."""
+        self.refresh()
+        terms = list(tokenize(query.encode("utf-8")))
+        with self._lock:
+            n_docs = max(1, len([f for f in self._files.values() if f["length"]]))
+            avg_len = max(1.0, self._total_length / n_docs)
+            scores: Counter = Counter()
+            for term in terms:
+                postings = self._postings.get(term, {})
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for rel, tf in postings.items():
+                    doc_len = self._files[rel]["length"]
+                    scores[rel] += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * doc_len / avg_len))
+
+        line_pattern = re.compile(b"|".join(re.escape(t) for t in terms), re.IGNORECASE) if terms else None
+        results = []
+        for rel, score in scores.most_common(top_k):
+            results.append((rel, score, self._matching_lines(rel, line_pattern, limit=3)))
+        return results
+
+    def grep(self, pattern: str, ignore_case: bool = False, max_matches: int = MAX_MATCHES) -> list[tuple[str, int, str]]:
+        """Regex search over every text file, scanned in parallel. Returns (file, line, text) tuples."""
+        current = self.refresh()
+        regex = re.compile(pattern.encode("utf-8"), re.MULTILINE | (re.IGNORECASE if ignore_case else 0))
+        files = sorted(current)
+        pool = ThreadPoolExecutor(max_workers=SCAN_WORKERS)
+        try:
+            matches = []
+            for rel, hits in zip(files, pool.map(lambda rel: self._matching_lines(rel, regex, limit=max_matches), files)):
+                matches.extend((rel, line, text) for line, text in hits)
+                if len(matches) >= max_matches:
+                    break
+        finally:
+            # Once enough matches are collected, files not yet scanned are skipped
+            pool.shutdown(wait=True, cancel_futures=True)
+        return matches[:max_matches]
+
+    def _matching_lines(self, rel: str, regex, limit: int) -> list[tuple[int, str]]:
+        if regex is None:
+            return []
+        path = self.root_dir / rel
+        try:
+            with open(path, "rb") as fh:
+                size = os.fstat(fh.fileno()).st_size
+                if size == 0:
+                    return []
+                # Large files are memory-mapped so they are paged in lazily instead of copied
+                data = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) if size > MMAP_THRESHOLD else fh.read()
+                try:
+                    if _is_binary(data[:8192]):
+                        return []
+                    return _collect_lines(data, regex, limit)
+                finally:
+                    if isinstance(data, mmap.mmap):
+                        data.close()
+        except (OSError, ValueError):
+            return []
+
+
+def _collect_lines(data, regex, limit: int) -> list[tuple[int, str]]:
+    hits = []
+    line_no, last_pos, last_line_start = 1, 0, -1
+    for m in regex.finditer(data):
+        line_no += data.count(b"\n", last_pos, m.start())
+        last_pos = m.start()
+        start = data.rfind(b"\n", 0, m.start()) + 1
+        if start == last_line_start:
+            continue
+        last_line_start = start
+        end = data.find(b"\n", m.start())
+        text = data[start:end if end != -1 else len(data)]
+        hits.append((line_no, text[:300].decode("utf-8", errors="replace").strip()))
+        if len(hits) >= limit:
+            break
+    return hits
+
+
+_indexes: RootRegistry[LexicalIndex] = RootRegistry(LexicalIndex)
+
+
+def get_lexical_index(root_dir: Path) -> LexicalIndex:
+    return _indexes.get(root_dir)
@@ -0,0 +1,229 @@
+import logging
+import mmap
+import os
+import re
+import shutil
+import tempfile
+import threading
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+
+from src.core.cache_paths import on_repo_released
+
+logger = logging.getLogger(__name__)
+
+# Files whose line offsets stay cached (least recently used are evicted)
+MAX_INDEXED_FILES = int(os.getenv("NEXUS_LINE_INDEX_FILES", "256"))
+
+_NEWLINE = re.compile(rb"\n")
+
+
+def line_starts(data) -> array:
+    """Byte offset of the start of every line (bytes or mmap). A trailing newline does not start a new line."""
+    starts = array("Q", [0])
+    starts.extend(match.end() for match in _NEWLINE.finditer(data))
+    if len(data) == 0 or starts[-1] == len(data):
+        starts.pop()
+    return starts
+
+
+def atomic_write(target: Path, data: bytes):
+    """
+    Replaces `target` with `data` through a temp file in the same directory and os.replace, so readers
+    see either the old or the new content, never a partial write. Keeps the file's permission bits.
+    """
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        try:
+            os.chmod(tmp, target.stat().st_mode & 0o7777)
+        except FileNotFoundError:
+            os.chmod(tmp, 0o666 & ~_UMASK)
+        os.replace(tmp, target)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write_many(files: list[tuple[Path, bytes]]):
+    """
+    Two-phase commit of several files: every new content is written to a temp file first (nothing
+    is touched if any of those writes fails), then one rename pass moves them into place. Should a
+    rename fail, the files already replaced are restored from hard-link backups and new ones removed.
+    """
+    staged = []
+    created_dirs = []
+    try:
+        for target, data in files:
+            missing = [d for d in [target.parent, *target.parent.parents] if not d.exists()]
+            target.parent.mkdir(parents=True, exist_ok=True)
+            created_dirs.extend(missing)
+            fd, tmp = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.", suffix=".tmp")
+            staged.append((target, tmp, None))
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            if target.exists():
+                os.chmod(tmp, target.stat().st_mode & 0o7777)
+                backup = f"{tmp}.orig"
+                try:
+                    os.link(target, backup)
+                except OSError:
+                    shutil.copy2(target, backup)
+                staged[-1] = (target, tmp, backup)
+            else:
+                os.chmod(tmp, 0o666 & ~_UMASK)
+    except BaseException:
+        _discard(staged, created_dirs)
+        raise
+
+    replaced = []
+    try:
+        for target, tmp, backup in staged:
+            os.replace(tmp, target)
+            replaced.append((target, backup))
+    except BaseException:
+        for target, backup in reversed(replaced):
+            try:
+                if backup:
+                    os.replace(backup, target)
+                else:
+                    os.unlink(target)
+            except OSError as e:
+                logger.error(f"[FS] Could not roll back {target}: {e}")
+        _discard(staged, created_dirs)
+        raise
+    _discard([(target, None, backup) for target, _tmp, backup in staged])
+
+
+def _discard(staged: list, created_dirs: list = ()):
+    for _target, tmp, backup in staged:
+        for path in (tmp, backup):
+            if path:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+    # Deepest first, so a failed batch leaves no directories it created behind
+    for directory in sorted(set(created_dirs), key=lambda d: len(d.parts), reverse=True):
+        try:
+            directory.rmdir()
+        except OSError:
+            pass
+
+
+def _read_umask() -> int:
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+# Read once at import: os.umask can only be queried by setting it, which is not thread-safe
+_UMASK = _read_umask()
+
+
+class _Entry:
+    __slots__ = ("mtime_ns", "size", "starts")
+
+    def __init__(self, mtime_ns: int, size: int, starts: array):
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.starts = starts
+
+    def span(self, first: int, last: int) -> tuple[int, int]:
+        """Byte range of the 1-indexed inclusive line range first..last (already clipped to the file)."""
+        end = self.starts[last] if last < len(self.starts) else self.size
+        return self.starts[first - 1], end
+
+
+class LineIndex:
+    """
+    Per-file line-start offsets, validated against (mtime, size), so line-range reads seek straight
+    to their bytes through mmap instead of decoding and splitting the whole file. Files written
+    through write_with_index are re-indexed from the written bytes without re-reading them.
+    """
+    def __init__(self, max_files: int = MAX_INDEXED_FILES):
+        self.max_files = max_files
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, key: str, st: os.stat_result):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry.mtime_ns == st.st_mtime_ns and entry.size == st.st_size:
+                self._entries.move_to_end(key)
+                return entry
+        return None
+
+    def _store(self, key: str, entry: _Entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_files:
+                self._entries.popitem(last=False)
+
+    def entry(self, path: Path, mm=None, st: os.stat_result = None) -> _Entry:
+        """Line offsets of `path`; pass the open file's mmap and fstat to index exactly the bytes being read."""
+        key = str(path)
+        st = st or path.stat()
+        entry = self._lookup(key, st)
+        if entry is None:
+            if mm is not None:
+                starts = line_starts(mm)
+            elif st.st_size:
+                with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    starts = line_starts(data)
+            else:
+                starts = array("Q")
+            entry = _Entry(st.st_mtime_ns, st.st_size, starts)
+            self._store(key, entry)
+        return entry
+
+    def read_lines(self, path: Path, start_line: int, end_line: int) -> tuple[int, list[str]]:
+        """(first line number, lines with their newlines) for the inclusive range, clipped to the file."""
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            if st.st_size == 0:
+                return max(1, start_line), []
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                entry = self.entry(path, mm, st)
+                first = max(1, start_line)
+                last = min(end_line, len(entry.starts))
+                if first > last:
+                    return first, []
+                begin, end = entry.span(first, last)
+                text = mm[begin:end].decode("utf-8", errors="replace")
+        # Split on "\n" only, like the offsets (str.splitlines would also break on \r, \x0c, ...)
+        lines = [line + "\n" for line in text.split("\n")]
+        lines[-1] = lines[-1][:-1]
+        return first, lines if lines[-1] else lines[:-1]
+
+    def write_with_index(self, path: Path, data: bytes):
+        """Atomically writes `data` and indexes it from memory."""
+        atomic_write(path, data)
+        self.record(path, data)
+
+    def forget_under(self, root_dir: Path):
+        """Drops the entries of every file below `root_dir`."""
+        prefix = str(root_dir).rstrip(os.sep) + os.sep
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+    def record(self, path: Path, data: bytes):
+        """Indexes `data` as the current content of `path` (just written by us)."""
+        st = path.stat()
+        self._store(str(path), _Entry(st.st_mtime_ns, st.st_size, line_starts(data)))
+
+
+line_index = LineIndex()
+
+
+@on_repo_released
+def _release(root_dir: Path):
+    line_index.forget_under(root_dir)
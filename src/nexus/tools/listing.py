@@ -0,0 +1,278 @@
+import fnmatch
+import logging
+import os
+import re
+import stat
+import threading
+from pathlib import Path
+from typing import Iterator, Optional
+
+from src.core.cache_paths import RootRegistry
+from src.core.git_session import get_git_session
+
+logger = logging.getLogger(__name__)
+
+# Entries per list_files page; the reply ends with the cursor of the next page
+PAGE_SIZE = int(os.getenv("NEXUS_LIST_PAGE_SIZE", "500"))
+# Skipped in addition to .gitignore (and to hidden directories, which are always skipped)
+DEFAULT_EXCLUDES = tuple(
+    name.strip() for name in os.getenv("NEXUS_LIST_EXCLUDE", "node_modules,__pycache__,venv,dist,build").split(",")
+    if name.strip()
+)
+# Cached directory listings kept per repository before the oldest are evicted
+MAX_CACHED_DIRS = 50_000
+
+
+def _glob_to_regex(pattern: str) -> str:
+    """Translates one gitignore glob (already stripped of "!", leading and trailing "/") to a regex."""
+    out = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("/**", i) and i + 3 == len(pattern):
+            out.append("/.*")
+            i += 3
+        elif pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            out.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            out.append("[^/]")
+            i += 1
+        elif pattern[i] == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                out.append(re.escape(pattern[i]))
+                i += 1
+            else:
+                body = pattern[i + 1:end]
+                out.append("[" + ("^" + body[1:] if body.startswith("!") else body).replace("\\", "\\\\") + "]")
+                i = end + 1
+        elif pattern[i] == "\\" and i + 1 < len(pattern):
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(out)
+
+
+def parse_gitignore(text: str) -> list[tuple[re.Pattern, bool, bool]]:
+    """Rules of one .gitignore as (regex over the path relative to its directory, negated, directories only)."""
+    rules = []
+    for line in text.splitlines():
+        line = line.rstrip()
+        if not line or line.startswith("#"):
+            continue
+        negated = line.startswith("!")
+        if negated:
+            line = line[1:]
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line:
+            continue
+        # A slash anywhere but at the end anchors the pattern to the .gitignore's directory
+        anchored = "/" in line
+        body = _glob_to_regex(line.lstrip("/"))
+        rules.append((re.compile(("" if anchored else "(?:.*/)?") + body + "$"), negated, dir_only))
+    return rules
+
+
+class RepoLister:
+    """
+    Lists a repository with os.scandir, honouring every .gitignore on the way down (plus
+    .git/info/exclude and DEFAULT_EXCLUDES). Directory listings and parsed .gitignore files are
+    cached and re-read only when the directory's mtime changes, so repeated listings only stat directories.
+    """
+    def __init__(self, root_dir: Path):
+        self.root_dir = Path(root_dir).resolve()
+        # directory path -> (mtime_ns, [(name, is_dir)] sorted by name)
+        self._dirs: dict[str, tuple[int, list[tuple[str, bool]]]] = {}
+        # .gitignore path -> (mtime_ns, rules)
+        self._ignores: dict[str, tuple[int, list]] = {}
+        self._lock = threading.Lock()
+        self._exclude_path: Optional[str] = None
+
+    def _entries(self, path: str) -> list[tuple[str, bool]]:
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return []
+        with self._lock:
+            cached = self._dirs.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        entries = []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        # Symlinked directories are listed but not followed
+                        entries.append((entry.name, entry.is_dir(follow_symlinks=False)))
+                    except OSError:
+                        continue
+        except OSError:
+            return []
+        entries.sort()
+        with self._lock:
+            if len(self._dirs) >= MAX_CACHED_DIRS:
+                self._dirs.pop(next(iter(self._dirs)))
+            self._dirs[path] = (mtime, entries)
+        return entries
+
+    def _rules(self, path: str) -> list:
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return []
+        with self._lock:
+            cached = self._ignores.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        try:
+            rules = parse_gitignore(Path(path).read_text(encoding="utf-8", errors="ignore"))
+        except OSError:
+            rules = []
+        with self._lock:
+            self._ignores[path] = (mtime, rules)
+        return rules
+
+    def _info_exclude(self) -> str:
+        """info/exclude lives in the common git dir, which a linked worktree's .git file points to."""
+        if self._exclude_path is None:
+            try:
+                self._exclude_path = str(get_git_session(self.root_dir).common_dir / "info" / "exclude")
+            except (OSError, RuntimeError):
+                self._exclude_path = ""  # not a git repository: no exclude file
+        return self._exclude_path
+
+    def _root_rules(self) -> list[tuple[str, list]]:
+        exclude = self._info_exclude()
+        rules = self._rules(exclude) if exclude else []
+        return [("", rules)] if rules else []
+
+    @staticmethod
+    def _ignored(rel: str, is_dir: bool, scopes: list[tuple[str, list]]) -> bool:
+        """Last matching rule wins, deeper .gitignore files after shallower ones (git semantics)."""
+        ignored = False
+        for base, rules in scopes:
+            if base and not rel.startswith(base + "/"):
+                continue
+            local = rel[len(base) + 1:] if base else rel
+            for regex, negated, dir_only in rules:
+                if (is_dir or not dir_only) and regex.match(local):
+                    ignored = not negated
+        return ignored
+
+    def _scopes_for(self, rel_dir: str) -> list[tuple[str, list]]:
+        """Ignore scopes inherited by `rel_dir`: every .gitignore from the root down to its parent."""
+        scopes = self._root_rules()
+        parts = [p for p in rel_dir.split("/") if p]
+        for depth in range(len(parts) if parts else 1):
+            base = "/".join(parts[:depth])
+            gitignore = str(self.root_dir / base / ".gitignore") if base else str(self.root_dir / ".gitignore")
+            rules = self._rules(gitignore)
+            if rules:
+                scopes.append((base, rules))
+        return scopes
+
+    def walk(self, rel_dir: str = "", max_depth: Optional[int] = None,
+             after: Optional[str] = None) -> Iterator[tuple[str, int, bool]]:
+        """
+        Yields (relative path, depth, is_dir) in sorted depth-first order, starting after the path `after`.
+        Whole subtrees that sort before `after` are skipped without being listed.
+        """
+        after_parts = tuple(after.split("/")) if after else None
+        scopes = self._scopes_for(rel_dir)
+
+        def visit(rel: str, depth: int, scopes: list) -> Iterator[tuple[str, int, bool]]:
+            abs_dir = str(self.root_dir / rel) if rel else str(self.root_dir)
+            entries = self._entries(abs_dir)
+            if rel and (".gitignore", False) in entries:
+                rules = self._rules(os.path.join(abs_dir, ".gitignore"))
+                if rules:
+                    scopes = scopes + [(rel, rules)]
+            for name, is_dir in entries:
+                child = f"{rel}/{name}" if rel else name
+                if is_dir and (name.startswith(".") or name in DEFAULT_EXCLUDES):
+                    continue
+                if name == ".git":
+                    continue  # a linked worktree's .git is a file pointing at the real git dir
+                if scopes and self._ignored(child, is_dir, scopes):
+                    continue
+                if after_parts is None:
+                    yield child, depth, is_dir
+                else:
+                    parts = tuple(child.split("/"))
+                    inside_cursor = after_parts[:len(parts)] == parts
+                    if parts <= after_parts and not (is_dir and inside_cursor):
+                        continue
+                    if not inside_cursor:
+                        yield child, depth, is_dir
+                if is_dir and (max_depth is None or depth < max_depth):
+                    yield from visit(child, depth + 1, scopes)
+
+        yield from visit(rel_dir, 1, scopes)
+
+    def stat_files(self, rel_dir: str = "", suffixes: tuple[str, ...] = ()) -> dict[str, os.stat_result]:
+        """
+        {relative path: stat} of every regular file `walk` lists under `rel_dir` (only those ending in
+        `suffixes`, if given). This is the file set every search index scans, so search tools never
+        see a file list_files hides (ignored, dependency or build folders).
+        """
+        found = {}
+        for rel, _, is_dir in self.walk(rel_dir):
+            if is_dir or (suffixes and not rel.endswith(suffixes)):
+                continue
+            try:
+                st = os.stat(self.root_dir / rel)
+            except OSError:
+                continue
+            if stat.S_ISREG(st.st_mode):
+                found[rel] = st
+        return found
+
+
+def render_listing(lister: RepoLister, rel_dir: str, max_depth: Optional[int] = None, pattern: Optional[str] = None,
+                   cursor: Optional[str] = None, limit: int = PAGE_SIZE) -> str:
+    """
+    One page of a listing. Without `pattern` it is an indented tree; with a glob `pattern` (matched
+    against the relative path and the file name) it is a flat list of matching files.
+    """
+    limit = max(1, limit)
+    lines = []
+    last = None
+    more = False
+    for rel, depth, is_dir in lister.walk(rel_dir, max_depth=max_depth, after=cursor):
+        if pattern:
+            if is_dir or not (fnmatch.fnmatch(rel, pattern) or fnmatch.fnmatch(rel.rsplit("/", 1)[-1], pattern)):
+                continue
+        if len(lines) >= limit:
+            more = True
+            break
+        if pattern:
+            lines.append(rel)
+        else:
+            lines.append(" " * 4 * depth + rel.rsplit("/", 1)[-1] + ("/" if is_dir else ""))
+        last = rel
+    header = f"{os.path.basename(rel_dir) or lister.root_dir.name}/"
+    if pattern:
+        header += f" (files matching {pattern})"
+    if cursor:
+        header += f" (continued after {cursor})"
+    if not lines:
+        return header + "\n(no entries)"
+    if more:
+        lines.append(f"... more entries. Call list_files again with cursor=\"{last}\" for the next page.")
+    return "\n".join([header] + lines)
+
+
+_listers: RootRegistry[RepoLister] = RootRegistry(RepoLister)
+
+
+def get_repo_lister(root_dir: Path) -> RepoLister:
+    return _listers.get(root_dir)
@@ -0,0 +1,311 @@
+import ast
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Optional
+
+from src.core.cache_paths import RootRegistry, repo_cache_dir
+from src.core.git_session import cache_owner
+from src.nexus.tools.listing import get_repo_lister
+
+logger = logging.getLogger(__name__)
+
+# Algorithm safeguard: skip files larger than 1MB to prevent AST Memory crash
+MAX_PARSE_BYTES = 1_000_000
+# Below this many cache misses, spawning worker processes costs more than it saves
+PARALLEL_PARSE_THRESHOLD = 16
+CACHE_VERSION = 4
+
+
+def _signature(node: ast.AST) -> str:
+    if isinstance(node, ast.ClassDef):
+        bases = [ast.unparse(b) for b in node.bases] + [ast.unparse(k) for k in node.keywords]
+        return f"class {node.name}({', '.join(bases)})" if bases else f"class {node.name}"
+    prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+    returns = f" -> {ast.unparse(node.returns)}" if node.returns else ""
+    return f"{prefix} {node.name}({ast.unparse(node.args)}){returns}"
+
+
+def _outline_nodes(body: list[ast.stmt]) -> list[dict]:
+    """Classes and functions of one scope. Class bodies are descended into; function bodies are not."""
+    entries = []
+    for node in body:
+        if isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+            entries.append({
+                "kind": "class" if isinstance(node, ast.ClassDef) else "function",
+                "name": node.name,
+                "signature": _signature(node),
+                "line": node.lineno,
+                "end_line": node.end_lineno,
+                "children": _outline_nodes(node.body) if isinstance(node, ast.ClassDef) else []
+            })
+    return entries
+
+
+def _collect_symbols(tree: ast.Module) -> dict:
+    """
+    Definitions (with qualified names), imports and name references of one module,
+    as compact [name, line, ...] lists for the cross-file SymbolIndex.
+    """
+    definitions = []
+    imports = []
+    references = set()
+
+    def visit_scope(body: list[ast.stmt], qualifier: str):
+        for node in body:
+            if isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+                qualname = f"{qualifier}{node.name}"
+                kind = "class" if isinstance(node, ast.ClassDef) else "function"
+                definitions.append([node.name, node.lineno, kind, qualname])
+                visit_scope(node.body, f"{qualname}.")
+            elif isinstance(node, (ast.Assign, ast.AnnAssign)) and not qualifier:
+                targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+                for t in targets:
+                    if isinstance(t, ast.Name):
+                        definitions.append([t.id, node.lineno, "variable", t.id])
+            elif isinstance(node, (ast.If, ast.Try, ast.With)):
+                # Conditional definitions (e.g. try/except ImportError fallbacks) stay in the same scope
+                for child in ("body", "orelse", "finalbody"):
+                    visit_scope(getattr(node, child, []), qualifier)
+                for handler in getattr(node, "handlers", []):
+                    visit_scope(handler.body, qualifier)
+
+    visit_scope(tree.body, "")
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                imports.append([alias.asname or alias.name.split(".")[0], node.lineno, alias.name])
+        elif isinstance(node, ast.ImportFrom):
+            prefix = "." * node.level
+            for alias in node.names:
+                # "from . import helpers" names the sibling module itself: ".helpers", not "..helpers"
+                target = f"{prefix}{node.module}.{alias.name}" if node.module else prefix + alias.name
+                imports.append([alias.asname or alias.name, node.lineno, target])
+        elif isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Store):
+            references.add((node.id, node.lineno))
+        elif isinstance(node, ast.Attribute):
+            references.add((node.attr, getattr(node, "end_lineno", None) or node.lineno))
+
+    return {
+        "definitions": definitions,
+        "imports": imports,
+        "references": sorted([name, line] for name, line in references)
+    }
+
+
+def parse_python_file(path: str) -> dict:
+    """
+    Parses one file into its outline and symbol table. Module-level so it can run in a worker process.
+    Returns {"outline": [...], "symbols": {...}} or {"error": "..."}.
+    """
+    try:
+        if os.path.getsize(path) > MAX_PARSE_BYTES:
+            return {"error": "Skipped: Exceeds 1MB"}
+        with open(path, "rb") as fh:
+            parsed = ast.parse(fh.read(), filename=path)
+        return {"outline": _outline_nodes(parsed.body), "symbols": _collect_symbols(parsed)}
+    except Exception as e:
+        return {"error": f"Failed to parse: {e}"}
+
+
+def _content_hash(path: Path) -> Optional[str]:
+    try:
+        return hashlib.sha1(path.read_bytes()).hexdigest()
+    except OSError:
+        return None
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _parse_pool() -> ProcessPoolExecutor:
+    """
+    One parse pool for the whole process, started on first use. Workers come from a forkserver (spawn
+    where there is none): forking this multithreaded server could copy a lock another thread holds.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, 8), mp_context=multiprocessing.get_context(method))
+        return _pool
+
+
+def warm_parse_pool() -> threading.Thread:
+    """
+    Starts the parse pool's workers in the background. A forkserver first imports the main module
+    (the whole server, seconds), which would otherwise delay the first large outline refresh.
+    """
+    def warm():
+        try:
+            _parse_pool().submit(os.getpid).result()
+        except Exception as e:
+            logger.warning(f"[Outline Engine] Could not start the parse pool: {e}")
+    thread = threading.Thread(target=warm, name="nexus-parse-pool-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def _reset_pool(pool: ProcessPoolExecutor):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+class OutlineStore:
+    """
+    Persisted parse results of one repository, shared by its main checkout and every linked worktree
+    of it (see cache_owner). Each entry carries the file's content hash: a fresh task worktree, whose
+    checkout gave every file a new mtime, reuses the entries whose content it still has.
+    """
+    def __init__(self, owner: Path):
+        self.cache_path = repo_cache_dir(owner, "outline") / "outline_cache.json"
+        self.entries: dict[str, dict] = self._load()
+        self._lock = threading.Lock()
+
+    def _load(self) -> dict:
+        try:
+            data = json.loads(self.cache_path.read_text(encoding="utf-8"))
+            if data.get("version") == CACHE_VERSION:
+                return data["files"]
+        except (OSError, ValueError, KeyError):
+            pass
+        return {}
+
+    def snapshot(self) -> dict[str, dict]:
+        with self._lock:
+            return dict(self.entries)
+
+    def lookup(self, rel: str, sha: Optional[str]) -> Optional[dict]:
+        entry = self.entries.get(rel)
+        return entry if sha is not None and entry is not None and entry.get("sha") == sha else None
+
+    def update(self, entries: dict[str, dict], removed: list[str] = ()):
+        with self._lock:
+            self.entries.update(entries)
+            for rel in removed:
+                self.entries.pop(rel, None)
+            tmp = self.cache_path.with_suffix(f".{threading.get_ident()}.tmp")
+            tmp.write_text(json.dumps({"version": CACHE_VERSION, "files": self.entries}), encoding="utf-8")
+            os.replace(tmp, self.cache_path)
+
+
+_stores: RootRegistry[OutlineStore] = RootRegistry(OutlineStore)
+
+
+class OutlineEngine:
+    """
+    Cached AST outline of every Python file in a working directory.
+    Entries are keyed by relative path and validated against (mtime, size), then against the content
+    hash; parse results live in the repository's OutlineStore, persisted in the Nexus cache directory
+    and shared with its worktrees, so later runs and new worktrees only re-parse files that changed.
+    Cache misses are parsed in a process pool when there are enough of them.
+    """
+    def __init__(self, root_dir: Path):
+        self.root_dir = Path(root_dir).resolve()
+        owner = cache_owner(self.root_dir)
+        self.store = _stores.get(owner)
+        # The main checkout trusts the stored stats; a worktree hashes each file once to match them
+        self.is_owner = owner == self.root_dir
+        self.entries: dict[str, dict] = self.store.snapshot() if self.is_owner else {}
+        self._lock = threading.Lock()
+
+    def _scan(self, target: Path) -> dict[str, os.stat_result]:
+        rel_dir = "" if target == self.root_dir else target.relative_to(self.root_dir).as_posix()
+        return get_repo_lister(self.root_dir).stat_files(rel_dir, suffixes=(".py",))
+
+    def refresh(self, directory: Optional[Path] = None) -> dict[str, dict]:
+        """
+        Re-validates the cache for every .py file under `directory` (default: the whole repo),
+        parses the misses and returns {relative path: entry} for that directory.
+        """
+        target = Path(directory).resolve() if directory else self.root_dir
+        prefix = "" if target == self.root_dir else target.relative_to(self.root_dir).as_posix() + "/"
+
+        with self._lock:
+            current = self._scan(target)
+            stale = [rel for rel in self.entries if rel.startswith(prefix) and rel not in current]
+            misses = [
+                rel for rel, st in current.items()
+                if rel not in self.entries
+                or self.entries[rel]["mtime_ns"] != st.st_mtime_ns
+                or self.entries[rel]["size"] != st.st_size
+            ]
+
+            for rel in stale:
+                del self.entries[rel]
+            # A stat miss whose content is unchanged (touched file, fresh worktree checkout) is not re-parsed
+            to_parse, reused = [], 0
+            for rel in misses:
+                st = current[rel]
+                sha = _content_hash(self.root_dir / rel)
+                known = self.store.lookup(rel, sha)
+                if known is None and sha is not None and self.entries.get(rel, {}).get("sha") == sha:
+                    known = self.entries[rel]
+                if known is None:
+                    to_parse.append((rel, sha))
+                    continue
+                self.entries[rel] = {**known, "mtime_ns": st.st_mtime_ns, "size": st.st_size}
+                reused += 1
+            for (rel, sha), data in zip(to_parse, self._parse_many([rel for rel, _ in to_parse])):
+                st = current[rel]
+                self.entries[rel] = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "sha": sha, **data}
+
+            # Worktrees contribute new content only; the main checkout also keeps its stats and deletions current
+            shared = {rel: self.entries[rel] for rel, _ in to_parse}
+            if self.is_owner:
+                shared.update((rel, self.entries[rel]) for rel in misses)
+            if shared or (stale and self.is_owner):
+                self.store.update(shared, removed=stale if self.is_owner else ())
+            if stale or misses:
+                logger.info(f"[Outline Engine] Parsed {len(to_parse)} changed files, reused {reused}, dropped {len(stale)} in {target}")
+            return {rel: self.entries[rel] for rel in sorted(current)}
+
+    def _parse_many(self, rel_paths: list[str]) -> list[dict]:
+        paths = [str(self.root_dir / rel) for rel in rel_paths]
+        if len(paths) >= PARALLEL_PARSE_THRESHOLD:
+            pool = None
+            try:
+                pool = _parse_pool()
+                return list(pool.map(parse_python_file, paths, chunksize=max(1, len(paths) // 32)))
+            except (BrokenProcessPool, OSError, RuntimeError) as e:
+                # A dead worker breaks the pool for good: the next call starts a new one
+                if pool is not None:
+                    _reset_pool(pool)
+                logger.warning(f"[Outline Engine] Process pool unavailable ({e}); parsing inline.")
+        return [parse_python_file(p) for p in paths]
+
+    def render(self, directory: Optional[Path] = None, signatures: bool = True) -> str:
+        outline = []
+        for rel, entry in self.refresh(directory).items():
+            if "error" in entry:
+                outline.append(f"File: {rel} ({entry['error']})")
+            elif entry["outline"]:
+                outline.append(f"File: {rel}")
+                _render_entries(entry["outline"], outline, 1, signatures)
+        return "\n".join(outline) if outline else "No python files found or parsed."
+
+
+def _render_entries(entries: list[dict], out: list[str], depth: int, signatures: bool):
+    for e in entries:
+        label = e["signature"] if signatures else f"{e['kind']} {e['name']}"
+        out.append(f"{'  ' * depth}{label}  [L{e['line']}-{e['end_line']}]")
+        _render_entries(e["children"], out, depth + 1, signatures)
+
+
+_engines: RootRegistry[OutlineEngine] = RootRegistry(OutlineEngine)
+
+
+def get_outline_engine(root_dir: Path) -> OutlineEngine:
+    """One in-memory engine per repository root, shared across SandboxedFS instances."""
+    return _engines.get(root_dir)
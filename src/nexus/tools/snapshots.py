@@ -0,0 +1,202 @@
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+from src.core.cache_paths import RootRegistry, repo_cache_dir
+from src.core.lightning_optim import optimizer
+from src.nexus.tools.line_index import atomic_write, line_index
+
+logger = logging.getLogger(__name__)
+
+# Restore the files a failed crew attempt touched before the next attempt starts
+ROLLBACK_ON_RETRY = os.getenv("NEXUS_RETRY_ROLLBACK", "true").lower() in ("1", "true", "yes")
+# Snapshots untouched for this long belong to tasks that were never resumed and are deleted
+RETENTION_HOURS = float(os.getenv("NEXUS_SNAPSHOT_RETENTION_HOURS", "168"))
+
+# Root directory -> snapshot recording in this context (task thread and the workers it copies its context to)
+_recording: contextvars.ContextVar[dict[str, str]] = contextvars.ContextVar("snapshot_recording", default={})
+
+
+class WorkspaceSnapshots:
+    """
+    Pre-images of the files written under one root while a snapshot is recording. The first write to
+    a path stores its bytes once as a content-addressed blob (or notes that the file did not exist);
+    later writes to that path cost a set lookup. Rolling back restores only those files, so it takes
+    time proportional to what the attempt touched, not to the size of the repository. Manifests are
+    append-only JSON lines in the cache directory, so a snapshot id kept in the task state still
+    rolls back after a restart. Which snapshot records is per context, so two tasks editing the
+    same root each capture into their own.
+
+    Only writes made through `capture` callers (the SandboxedFS file tools and speculative patches) are
+    recorded: files a `run_bash` command creates or edits are not, and survive a rollback.
+    """
+    def __init__(self, root_dir: Path):
+        self.root_dir = Path(root_dir).resolve()
+        self._store_dir: Optional[Path] = None
+        # snapshot id -> relative paths whose pre-image is recorded
+        self._captured: dict[str, set[str]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def store_dir(self) -> Path:
+        if self._store_dir is None:
+            self._store_dir = repo_cache_dir(self.root_dir, "snapshots")
+        return self._store_dir
+
+    def _manifest(self, snapshot_id: str) -> Path:
+        return self.store_dir / f"{snapshot_id}.jsonl"
+
+    def _blob(self, digest: str) -> Path:
+        return self.store_dir / "blobs" / digest[:2] / digest
+
+    def _entries(self, snapshot_id: str) -> list[dict]:
+        manifest = self._manifest(snapshot_id)
+        if not manifest.exists():
+            raise ValueError(f"Unknown snapshot {snapshot_id} for {self.root_dir}")
+        with open(manifest, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    @property
+    def active(self) -> Optional[str]:
+        """Snapshot recording writes under this root in the current context."""
+        return _recording.get().get(str(self.root_dir))
+
+    def exists(self, snapshot_id: str) -> bool:
+        return self._manifest(snapshot_id).exists()
+
+    def begin(self) -> str:
+        """Creates an empty snapshot and returns its id (recording starts with `recording`)."""
+        self._sweep()
+        snapshot_id = uuid.uuid4().hex[:12]
+        self._manifest(snapshot_id).touch()
+        with self._lock:
+            self._captured[snapshot_id] = set()
+        return snapshot_id
+
+    def _sweep(self):
+        """Discards snapshots of tasks that ended without discarding theirs (crashed and never resumed)."""
+        cutoff = time.time() - RETENTION_HOURS * 3600
+        for manifest in self.store_dir.glob("*.jsonl"):
+            try:
+                stale = manifest.stat().st_mtime < cutoff
+            except OSError:
+                continue
+            if stale:
+                logger.info(f"[Snapshot] Discarding snapshot {manifest.stem} of {self.root_dir} (unused for {RETENTION_HOURS:g}h)")
+                self.discard(manifest.stem)
+
+    @contextmanager
+    def recording(self, snapshot_id: str):
+        """Records pre-images into `snapshot_id` for every write under the root made inside the block."""
+        with self._lock:
+            if snapshot_id not in self._captured:
+                self._captured[snapshot_id] = {entry["path"] for entry in self._entries(snapshot_id)}
+        token = _recording.set({**_recording.get(), str(self.root_dir): snapshot_id})
+        try:
+            yield
+        finally:
+            _recording.reset(token)
+
+    def capture(self, target: Path, data: Optional[bytes] = None):
+        """
+        Records the current content of `target` (pass `data` if it is already in memory) before it is
+        overwritten, unless no snapshot is recording or this path was captured already.
+        """
+        snapshot_id = self.active
+        if snapshot_id is None:
+            return
+        rel = target.relative_to(self.root_dir).as_posix()
+        with self._lock:
+            captured = self._captured.setdefault(snapshot_id, set())
+            if rel in captured:
+                return
+            captured.add(rel)
+        try:
+            entry = {"path": rel, "blob": None, "mode": None, "dirs": []}
+            if target.is_file():
+                if data is None:
+                    data = target.read_bytes()
+                digest = hashlib.sha256(data).hexdigest()
+                blob = self._blob(digest)
+                if not blob.exists():
+                    atomic_write(blob, data)
+                entry.update(blob=digest, mode=target.stat().st_mode & 0o7777)
+            elif not target.exists():
+                # Directories the write is about to create are removed again on rollback (deepest first)
+                entry["dirs"] = [d.relative_to(self.root_dir).as_posix() for d in target.parents
+                                 if d != self.root_dir and d.is_relative_to(self.root_dir) and not d.exists()]
+            else:
+                return
+            with self._lock, open(self._manifest(snapshot_id), "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+        except BaseException:
+            with self._lock:
+                captured.discard(rel)
+            raise
+
+    def rollback(self, snapshot_id: str) -> list[str]:
+        """Puts every captured file back to its pre-image and deletes files that did not exist; returns the paths changed."""
+        with optimizer.span("snapshot.rollback", kind="fs", snapshot=snapshot_id) as span:
+            entries = self._entries(snapshot_id)
+            changed = []
+            for entry in entries:
+                target = self.root_dir / entry["path"]
+                if entry["blob"] is None:
+                    if target.is_file() or target.is_symlink():
+                        target.unlink()
+                        changed.append(entry["path"])
+                    for rel_dir in entry["dirs"]:
+                        try:
+                            (self.root_dir / rel_dir).rmdir()
+                        except OSError:
+                            pass
+                    continue
+                data = self._blob(entry["blob"]).read_bytes()
+                try:
+                    if target.is_file() and target.stat().st_size == len(data) and target.read_bytes() == data:
+                        continue
+                except OSError:
+                    pass
+                line_index.write_with_index(target, data)
+                os.chmod(target, entry["mode"])
+                changed.append(entry["path"])
+            span.set(files=len(entries), restored=len(changed))
+        logger.info(f"[Snapshot] Rolled back {len(changed)} of {len(entries)} touched files in {self.root_dir}")
+        return changed
+
+    def discard(self, snapshot_id: str):
+        """Deletes a snapshot and the blobs no other snapshot of this root still refers to."""
+        with self._lock:
+            self._captured.pop(snapshot_id, None)
+        try:
+            entries = self._entries(snapshot_id)
+        except ValueError:
+            return
+        self._manifest(snapshot_id).unlink(missing_ok=True)
+        kept = set()
+        for manifest in self.store_dir.glob("*.jsonl"):
+            kept.update(entry["blob"] for entry in self._entries(manifest.stem))
+        for digest in {entry["blob"] for entry in entries if entry["blob"]} - kept:
+            self._blob(digest).unlink(missing_ok=True)
+
+
+_stores: RootRegistry[WorkspaceSnapshots] = RootRegistry(WorkspaceSnapshots)
+
+
+def get_workspace_snapshots(root_dir: str | Path) -> WorkspaceSnapshots:
+    return _stores.get(root_dir)
+
+
+def discard_task_snapshot(state: dict):
+    """Discards the snapshot named in a task's graph state (its target_dir and snapshot_id), if any."""
+    if state.get("snapshot_id") and state.get("target_dir"):
+        get_workspace_snapshots(state["target_dir"]).discard(state["snapshot_id"])
+
@@ -0,0 +1,129 @@
+import logging
+import threading
+from collections import defaultdict
+from pathlib import Path
+
+from src.core.cache_paths import RootRegistry
+from src.nexus.tools.outline import get_outline_engine
+
+logger = logging.getLogger(__name__)
+
+MAX_RESULTS = 50
+
+
+class SymbolIndex:
+    """
+    Cross-file map of definitions, imports and references to (file, line).
+    Built from the symbol tables the OutlineEngine already extracts during its AST pass;
+    only files whose (mtime, size) changed since the last lookup are re-indexed.
+    """
+    def __init__(self, root_dir: Path):
+        self.root_dir = Path(root_dir).resolve()
+        self.engine = get_outline_engine(self.root_dir)
+        self._versions: dict[str, tuple[int, int]] = {}
+        # name -> {file -> [(line, kind, qualname)]}
+        self._definitions: dict[str, dict[str, list]] = defaultdict(dict)
+        # name -> {file -> [(line, kind)]}, kind being "import" or "reference"
+        self._references: dict[str, dict[str, list]] = defaultdict(dict)
+        # file -> names it contributed, so a changed file is removed without scanning every name
+        self._file_names: dict[str, tuple[set, set]] = {}
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        entries = self.engine.refresh()
+        with self._lock:
+            for rel in [rel for rel in self._versions if rel not in entries]:
+                self._remove_file(rel)
+            changed = 0
+            for rel, entry in entries.items():
+                version = (entry["mtime_ns"], entry["size"])
+                if self._versions.get(rel) == version:
+                    continue
+                self._remove_file(rel)
+                self._add_file(rel, entry.get("symbols"))
+                self._versions[rel] = version
+                changed += 1
+            if changed:
+                logger.info(f"[Symbol Index] Re-indexed {changed} files in {self.root_dir}")
+
+    def _remove_file(self, rel: str):
+        def_names, ref_names = self._file_names.pop(rel, (set(), set()))
+        for table, names in ((self._definitions, def_names), (self._references, ref_names)):
+            for name in names:
+                table[name].pop(rel, None)
+                if not table[name]:
+                    del table[name]
+        self._versions.pop(rel, None)
+
+    def _add_file(self, rel: str, symbols: dict | None):
+        if not symbols:
+            return
+        def_names, ref_names = set(), set()
+        for name, line, kind, qualname in symbols["definitions"]:
+            self._definitions[name].setdefault(rel, []).append((line, kind, qualname))
+            def_names.add(name)
+        for bound, line, target in symbols["imports"]:
+            # Aliased imports are findable under both the local and the original name
+            for name in {bound, target.split(".")[-1]}:
+                self._references[name].setdefault(rel, []).append((line, "import"))
+                ref_names.add(name)
+        for name, line in symbols["references"]:
+            self._references[name].setdefault(rel, []).append((line, "reference"))
+            ref_names.add(name)
+        self._file_names[rel] = (def_names, ref_names)
+
+    def find_definition(self, symbol: str) -> list[tuple[str, int, str, str]]:
+        """
+        Definitions of `symbol`, given either as a bare name ("run") or dotted ("SafeBash.run").
+        Returns (file, line, kind, qualified name) tuples.
+        """
+        self.refresh()
+        name = symbol.split(".")[-1]
+        with self._lock:
+            hits = [
+                (rel, line, kind, qualname)
+                for rel, defs in self._definitions.get(name, {}).items()
+                for line, kind, qualname in defs
+                if "." not in symbol or qualname == symbol or qualname.endswith(f".{symbol}")
+            ]
+        return sorted(hits)
+
+    def find_references(self, symbol: str) -> list[tuple[str, int, str]]:
+        """Import and usage sites of the last component of `symbol`, as (file, line, kind) tuples."""
+        self.refresh()
+        name = symbol.split(".")[-1]
+        with self._lock:
+            hits = [
+                (rel, line, kind)
+                for rel, refs in self._references.get(name, {}).items()
+                for line, kind in refs
+            ]
+        return sorted(set(hits))
+
+
+_indexes: RootRegistry[SymbolIndex] = RootRegistry(SymbolIndex)
+
+
+def get_symbol_index(root_dir: Path) -> SymbolIndex:
+    return _indexes.get(root_dir)
+
+
+def format_locations(root_dir: Path, header: str, hits: list[tuple]) -> str:
+    """Renders hits as `file:line [kind] source line`, reading each file at most once."""
+    if not hits:
+        return f"{header}\nNo matches found."
+    out = [header]
+    cache: dict[str, list[str]] = {}
+    for rel, line, kind, *rest in hits[:MAX_RESULTS]:
+        if rel not in cache:
+            try:
+                cache[rel] = (root_dir / rel).read_text(encoding="utf-8", errors="ignore").split("\n")
+            except OSError:
+                cache[rel] = []
+        lines = cache[rel]
+        source = lines[line - 1].strip() if 0 < line <= len(lines) else ""
+        label = f"{kind} {rest[0]}" if rest else kind
+        out.append(f"{rel}:{line} [{label}] {source[:160]}")
+    if len(hits) > MAX_RESULTS:
+        out.append(f"... {len(hits) - MAX_RESULTS} more matches truncated.")
+    return "\n".join(out)
@@ -0,0 +1,207 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+from src.core.cache_paths import RootRegistry, repo_cache_dir
+from src.core.git_session import cache_owner
+from src.nexus.tools.listing import get_repo_lister
+
+logger = logging.getLogger(__name__)
+
+INDEXED_EXTENSIONS = ('.py', '.md', '.ts', '.js', '.txt')
+MAX_FILE_BYTES = 5_000_000
+CHUNK_CHARS = 1000
+# Number of chunks handed to the embedding function per upsert call
+EMBED_BATCH_SIZE = int(os.getenv("NEXUS_EMBED_BATCH_SIZE", "128"))
+MANIFEST_VERSION = 1
+
+
+def chunk_text(content: str) -> list[str]:
+    """Semantic Chunking: O(N) paragraph split instead of arbitrary slicing."""
+    paragraphs = content.split('\n\n')
+    chunks = []
+    current_chunk = []
+    current_length = 0
+
+    for p in paragraphs:
+        p_len = len(p)
+        if current_length + p_len > CHUNK_CHARS and current_chunk:
+            chunks.append("\n\n".join(current_chunk))
+            current_chunk = [p]
+            current_length = p_len
+        else:
+            current_chunk.append(p)
+            current_length += p_len
+    if current_chunk:
+        chunks.append("\n\n".join(current_chunk))
+    return chunks
+
+
+class VectorStore:
+    """
+    Persistent chromadb collection of one repository, shared by its main checkout and every linked
+    worktree of it (see cache_owner). It holds one version of each file, the content of whichever
+    checkout synced last, recorded in a manifest of (mtime, size, sha256, chunk count) per file.
+    Checkouts that differ in a few files re-embed only those when they take turns.
+    """
+    def __init__(self, owner: Path):
+        import chromadb
+
+        self.index_dir = repo_cache_dir(owner, "vector_index")
+        self.manifest_path = self.index_dir / "manifest.json"
+        self.client = chromadb.PersistentClient(path=str(self.index_dir / "chroma"))
+        self.collection = self.client.get_or_create_collection(name="codebase_rag")
+        self.manifest = self._load_manifest()
+        self.lock = threading.Lock()
+
+    def _load_manifest(self) -> dict:
+        try:
+            data = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+            if data.get("version") == MANIFEST_VERSION:
+                return data["files"]
+        except (OSError, ValueError, KeyError):
+            pass
+        # No usable manifest: whatever is in the collection can't be trusted to be current
+        if self.collection.count():
+            self.client.delete_collection("codebase_rag")
+            self.collection = self.client.get_or_create_collection(name="codebase_rag")
+        return {}
+
+    def save_manifest(self):
+        tmp = self.manifest_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"version": MANIFEST_VERSION, "files": self.manifest}), encoding="utf-8")
+        os.replace(tmp, self.manifest_path)
+
+
+_stores: RootRegistry[VectorStore] = RootRegistry(VectorStore)
+
+
+class CodebaseVectorIndex:
+    """
+    Semantic index of one working directory, backed by its repository's VectorStore.
+    Each sync brings the collection in line with this directory: files whose content hash matches
+    the manifest are kept, changed or added ones are re-embedded and deleted ones dropped. Content
+    hashes are remembered per (mtime, size), so a file is read again only when it changes.
+    """
+    def __init__(self, root_dir: Path):
+        self.root_dir = Path(root_dir).resolve()
+        owner = cache_owner(self.root_dir)
+        self.store = _stores.get(owner)
+        # Only the main checkout's own stats are trusted from the manifest without hashing
+        self.is_owner = owner == self.root_dir
+        self._hashes: dict[str, tuple[int, int, str]] = {}
+
+    def _scan(self) -> dict[str, os.stat_result]:
+        files = get_repo_lister(self.root_dir).stat_files(suffixes=INDEXED_EXTENSIONS)
+        # Safeguard against parsing massive non-code binaries or mega-logs
+        return {rel: st for rel, st in files.items() if st.st_size <= MAX_FILE_BYTES}
+
+    def sync(self) -> dict[str, int]:
+        """Brings the collection in line with this working directory. Returns per-kind change counts."""
+        with self.store.lock:
+            return self._sync()
+
+    def _sync(self) -> dict[str, int]:
+        manifest = self.store.manifest
+        current = self._scan()
+        removed = [rel for rel in manifest if rel not in current]
+        pending_docs, pending_meta, pending_ids = [], [], []
+        # Manifest entries are only committed once their chunks are stored, so a failed
+        # embedding call leaves those files marked as stale for the next sync.
+        pending_entries = {}
+        stats = {"added": 0, "changed": 0, "removed": len(removed), "unchanged": 0}
+        dirty = bool(removed)
+
+        for rel in removed:
+            self._delete_file(rel)
+            del manifest[rel]
+        for rel in [rel for rel in self._hashes if rel not in current]:
+            del self._hashes[rel]
+
+        for rel, st in current.items():
+            entry = manifest.get(rel)
+            stat = (st.st_mtime_ns, st.st_size)
+            # Cheap path: identical stat means identical content
+            known = self._hashes.get(rel)
+            raw = None
+            if known and known[:2] == stat:
+                digest = known[2]
+            elif self.is_owner and entry and (entry["mtime_ns"], entry["size"]) == stat:
+                digest = entry["sha256"]
+            else:
+                raw = (self.root_dir / rel).read_bytes()
+                digest = hashlib.sha256(raw).hexdigest()
+            self._hashes[rel] = (*stat, digest)
+
+            if entry and entry["sha256"] == digest:
+                if self.is_owner and (entry["mtime_ns"], entry["size"]) != stat:
+                    entry.update(mtime_ns=st.st_mtime_ns, size=st.st_size)
+                    dirty = True
+                stats["unchanged"] += 1
+                continue
+
+            if entry:
+                self._delete_file(rel)
+                stats["changed"] += 1
+            else:
+                stats["added"] += 1
+
+            if raw is None:
+                raw = (self.root_dir / rel).read_bytes()
+                digest = hashlib.sha256(raw).hexdigest()
+                self._hashes[rel] = (*stat, digest)
+            chunks = chunk_text(raw.decode("utf-8", errors="ignore"))
+            for i, chunk in enumerate(chunks):
+                pending_docs.append(chunk)
+                pending_meta.append({"file": rel, "chunk": i, "sha256": digest})
+                pending_ids.append(f"{rel}::{digest[:16]}::{i}")
+            pending_entries[rel] = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "sha256": digest, "chunks": len(chunks)}
+            dirty = True
+
+            if len(pending_docs) >= EMBED_BATCH_SIZE:
+                self._flush(pending_docs, pending_meta, pending_ids, pending_entries)
+
+        self._flush(pending_docs, pending_meta, pending_ids, pending_entries)
+        if dirty:
+            self.store.save_manifest()
+            logger.info(f"[Vector Index] Synced {self.root_dir}: {stats}")
+        return stats
+
+    def _flush(self, docs: list, metas: list, ids: list, entries: dict):
+        """Embeds and stores the pending chunks in EMBED_BATCH_SIZE batches, then commits their manifest entries."""
+        for start in range(0, len(docs), EMBED_BATCH_SIZE):
+            end = start + EMBED_BATCH_SIZE
+            self.store.collection.upsert(documents=docs[start:end], metadatas=metas[start:end], ids=ids[start:end])
+        self.store.manifest.update(entries)
+        docs.clear()
+        metas.clear()
+        ids.clear()
+        entries.clear()
+
+    def _delete_file(self, rel: str):
+        self.store.collection.delete(where={"file": rel})
+
+    def query(self, query: str, top_k: int = 5) -> list[tuple[str, int, str]]:
+        """Returns (file, chunk index, document) tuples, most relevant first."""
+        # Synced and queried under one lock, so the hits reflect this directory's files
+        with self.store.lock:
+            self._sync()
+            count = self.store.collection.count()
+            if count == 0:
+                return []
+            results = self.store.collection.query(query_texts=[query], n_results=min(top_k, count))
+        return [
+            (meta["file"], meta["chunk"], doc)
+            for doc, meta in zip(results['documents'][0], results['metadatas'][0])
+        ]
+
+
+_indexes: RootRegistry[CodebaseVectorIndex] = RootRegistry(CodebaseVectorIndex)
+
+
+def get_vector_index(root_dir: Path) -> CodebaseVectorIndex:
+    """One index per working directory; the chromadb client and collection are shared per repository."""
+    return _indexes.get(root_dir)
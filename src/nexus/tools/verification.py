@@ -0,0 +1,205 @@
+import fnmatch
+import logging
+import os
+import re
+import shlex
+import subprocess
+from collections import defaultdict, deque
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+from src.core.git_sandbox import GitSandbox
+from src.nexus.tools.bash_safe import SafeBash
+from src.nexus.tools.outline import get_outline_engine
+
+logger = logging.getLogger(__name__)
+
+# Command the selected test files are appended to
+TEST_COMMAND = os.getenv("NEXUS_TEST_COMMAND", "python -m pytest -q -rfE -p no:cacheprovider")
+TEST_TIMEOUT = int(os.getenv("NEXUS_TEST_TIMEOUT", "300"))
+TEST_FILE_PATTERNS = ("test_*.py", "*_test.py")
+# Changing any of these can affect every test, so the whole suite runs
+GLOBAL_TEST_INPUTS = ("conftest.py", "pytest.ini", "pyproject.toml", "setup.cfg", "tox.ini", "setup.py")
+MAX_FAILURES_REPORTED = 20
+MAX_FAILURE_MESSAGE_CHARS = 500
+
+# "FAILED tests/test_x.py::test_y - AssertionError: ..." / "ERROR tests/test_x.py - ImportError ..."
+_SUMMARY_LINE = re.compile(r"^(FAILED|ERROR) (\S+)(?: - (.*))?$")
+# "==== 1 failed, 3 passed in 0.12s ====" (the "=" borders are dropped with -q)
+_COUNTS_LINE = re.compile(r"^=*\s*((?:\S.*\b)?(?:passed|failed|errors?|skipped|deselected|xfailed|xpassed|no tests ran)\b.*?) in [\d.]+s\b.*$")
+
+
+def is_test_file(rel_path: str) -> bool:
+    name = rel_path.rsplit("/", 1)[-1]
+    return any(fnmatch.fnmatch(name, pattern) for pattern in TEST_FILE_PATTERNS)
+
+
+@lru_cache(maxsize=16)
+def _pytest_importable(interpreter: str) -> bool:
+    """Whether `interpreter` can import pytest (find_spec, without importing it), checked once per interpreter."""
+    probe = "import importlib.util, sys; sys.exit(importlib.util.find_spec('pytest') is None)"
+    try:
+        out = subprocess.run([interpreter, "-c", probe], capture_output=True, timeout=60)
+    except (OSError, subprocess.TimeoutExpired):
+        return True  # unknown: the test command reports the problem itself
+    return out.returncode == 0
+
+
+def _missing_pytest(work_dir: str) -> bool:
+    """True when TEST_COMMAND runs `<python> -m pytest` and that interpreter has no pytest."""
+    argv = shlex.split(TEST_COMMAND)
+    if argv[1:3] != ["-m", "pytest"]:
+        return False  # custom runner: a broken one shows up as a missing pytest summary
+    interpreter = argv[0]
+    if os.sep in interpreter and not os.path.isabs(interpreter):
+        interpreter = str(Path(work_dir).resolve() / interpreter)  # e.g. .venv/bin/python of the sandbox
+    return not _pytest_importable(interpreter)
+
+
+def changed_files(work_dir: str) -> list[str]:
+    """Files the crew touched in the sandbox: modified/deleted vs. HEAD plus new untracked files."""
+    git = GitSandbox(work_dir)
+    tracked = git.run_cmd(["git", "diff", "--name-only", "HEAD"], cwd=Path(work_dir))
+    untracked = git.run_cmd(["git", "ls-files", "--others", "--exclude-standard"], cwd=Path(work_dir))
+    return sorted({line.strip() for line in (tracked + "\n" + untracked).splitlines() if line.strip()})
+
+
+class ImportGraph:
+    """
+    Reverse import graph of a repository's Python files, built from the import tables the
+    OutlineEngine already caches, used to find which test files (transitively) import a changed file.
+    """
+    def __init__(self, root_dir: str, deleted: tuple = ()):
+        self.root_dir = Path(root_dir).resolve()
+        self.entries = get_outline_engine(self.root_dir).refresh()
+        # Deleted modules stay resolvable so the tests still importing them get selected
+        self.modules = self._module_map([*self.entries, *(p for p in deleted if p.endswith(".py"))])
+        self.importers: dict[str, set[str]] = defaultdict(set)
+        for rel, entry in self.entries.items():
+            for _bound, _line, target in (entry.get("symbols") or {}).get("imports", []):
+                imported = self._resolve(rel, target)
+                if imported and imported != rel:
+                    self.importers[imported].add(rel)
+
+    @staticmethod
+    def _module_map(paths: list[str]) -> dict[str, str]:
+        modules = {}
+        for rel in paths:
+            parts = rel[:-3].split("/")
+            if parts[-1] == "__init__":
+                parts = parts[:-1]
+            if not parts:
+                continue
+            modules[".".join(parts)] = rel
+            if parts[0] == "src" and len(parts) > 1:
+                # src-layout projects import their package without the "src." prefix
+                modules.setdefault(".".join(parts[1:]), rel)
+        return modules
+
+    def _resolve(self, importer: str, target: str) -> Optional[str]:
+        """Maps an import target ("pkg.mod.Name", ".sibling.Name") to the repository file that defines it."""
+        level = len(target) - len(target.lstrip("."))
+        name = target[level:]
+        if level:
+            package = importer.split("/")[:-1]
+            if level > 1:
+                package = package[:len(package) - (level - 1)]
+            name = ".".join(package + ([name] if name else []))
+        parts = name.split(".")
+        # Longest prefix that is a module: "pkg.mod.Name" -> pkg/mod.py
+        for end in range(len(parts), 0, -1):
+            rel = self.modules.get(".".join(parts[:end]))
+            if rel:
+                return rel
+        return None
+
+    def affected_tests(self, changed: list[str]) -> Optional[list[str]]:
+        """
+        Test files that are, or transitively import, one of the changed files.
+        Returns None when a change (conftest, pytest/packaging config) can affect every test.
+        """
+        if any(path.rsplit("/", 1)[-1] in GLOBAL_TEST_INPUTS for path in changed):
+            return None
+        seen = set()
+        queue = deque(path for path in changed if path.endswith(".py"))
+        while queue:
+            rel = queue.popleft()
+            if rel in seen:
+                continue
+            seen.add(rel)
+            queue.extend(self.importers.get(rel, ()))
+        return sorted(rel for rel in seen if is_test_file(rel) and rel in self.entries)
+
+    def all_tests(self) -> list[str]:
+        return sorted(rel for rel in self.entries if is_test_file(rel))
+
+
+def parse_pytest_output(output: str) -> dict:
+    """
+    Extracts pytest's short test summary into structured failures:
+    {"failures": [{"kind", "test", "message"}], "summary": "1 failed, 3 passed"}.
+    """
+    failures = []
+    summary = ""
+    for line in output.splitlines():
+        line = line.rstrip()
+        match = _SUMMARY_LINE.match(line)
+        if match:
+            kind, test, message = match.groups()
+            failures.append({"kind": kind, "test": test, "message": (message or "")[:MAX_FAILURE_MESSAGE_CHARS]})
+            continue
+        counts = _COUNTS_LINE.match(line)
+        if counts:
+            summary = counts.group(1)
+    return {"failures": failures, "summary": summary}
+
+
+def run_affected_tests(work_dir: str) -> dict:
+    """
+    Runs the tests affected by the sandbox's changes through SafeBash.
+    Returns {"status": "passed" | "failed" | "no_tests", "selected": [...], "changed": [...],
+    "failures": [...], "summary": str, "output": str}.
+    """
+    changed = changed_files(work_dir)
+    graph = ImportGraph(work_dir, deleted=tuple(p for p in changed if not (Path(work_dir) / p).exists()))
+    selected = graph.affected_tests(changed)
+    if selected is None:
+        selected = graph.all_tests()
+        logger.info(f"[Verifier] Global test input changed; running all {len(selected)} test files")
+    result = {"status": "no_tests", "selected": selected, "changed": changed, "failures": [], "summary": "", "output": ""}
+    if not selected:
+        logger.info(f"[Verifier] No tests affected by {len(changed)} changed files")
+        return result
+
+    if _missing_pytest(work_dir):
+        logger.warning(f"[Verifier] pytest is not installed in {work_dir}; skipping test verification")
+        return result
+
+    logger.info(f"[Verifier] Running {len(selected)} affected test files for {len(changed)} changed files")
+    command = f"{TEST_COMMAND} {' '.join(shlex.quote(path) for path in selected)}"
+    # Keep .pyc files out of the sandbox, they would otherwise end up in the handoff commit
+    output = SafeBash(work_dir).run(command, timeout=TEST_TIMEOUT, env={"PYTHONDONTWRITEBYTECODE": "1"})
+    parsed = parse_pytest_output(output)
+    result.update(parsed, output=output)
+
+    if parsed["failures"] or re.search(r"\b\d+ (failed|errors?)\b", parsed["summary"]):
+        result["status"] = "failed"
+    elif not parsed["summary"] or output.startswith("Error: Command timed out"):
+        # No pytest summary at all: the runner itself broke (timeout, crash, broken custom command)
+        result["status"] = "failed"
+        result["failures"] = [{"kind": "ERROR", "test": command, "message": output[-MAX_FAILURE_MESSAGE_CHARS:]}]
+    else:
+        result["status"] = "passed"
+    return result
+
+
+def format_failures(result: dict) -> str:
+    """Human/LLM-readable verification_errors text for the next crew attempt."""
+    lines = [f"Tests failed ({result['summary'] or 'no summary'}) in: {', '.join(result['selected'])}"]
+    for failure in result["failures"][:MAX_FAILURES_REPORTED]:
+        lines.append(f"- {failure['kind']} {failure['test']}" + (f": {failure['message']}" if failure["message"] else ""))
+    hidden = len(result["failures"]) - MAX_FAILURES_REPORTED
+    if hidden > 0:
+        lines.append(f"- ... and {hidden} more")
+    return "\n".join(lines)
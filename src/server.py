@@ -1,39 +1,216 @@
+import asyncio
+import json
+import os
 from mcp.server import Server
+from mcp.server.lowlevel.helper_types import ReadResourceContents
 import mcp.types as types
-from typing import Any
+from typing import Any, Optional
 
-from src.core.git_sandbox import GitSandbox
-from src.nexus.graph import build_graph
+from src.core.git_sandbox import GitSandbox, ISOLATION_MODES
+from src.core.handoff import Handoff, handoffs, summarize_handoff, URI_PREFIX as HANDOFF_URI_PREFIX, MIME_TYPE as DIFF_MIME_TYPE
+from src.core.lightning_optim import optimizer
+from src.core.metrics import render_metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from src.core.task_queue import task_queue, TaskJob
+from src.core.cache_paths import repo_key
+from src.nexus.graph import get_graph, clear_checkpoints
+from src.nexus.tools.snapshots import discard_task_snapshot, get_workspace_snapshots
 
 import logging
 logger = logging.getLogger(__name__)
 
 server = Server("nexus-mcp")
 
+# Longest a single get_task_result call may block waiting for a job to finish.
+MAX_RESULT_WAIT_SECONDS = 300
+
 @server.list_tools()
 async def list_tools() -> list[types.Tool]:
     return [
         types.Tool(
             name="delegate_to_nexus",
-            description="DELEGATE TASK: Use this tool to send a complex coding task to an autonomous agent nexus. By default, it isolates changes to a safe Git branch. Set 'isolate=False' to apply changes directly to the current branch/main.",
+            description="DELEGATE TASK: Use this tool to send a complex coding task to an autonomous agent nexus. By default, it isolates changes to a safe Git branch. Set 'isolate=False' to apply changes directly to the current branch/main. Returns a job_id immediately; poll it with 'get_task_status' and collect the outcome with 'get_task_result'.",
             inputSchema={
                 "type": "object",
                 "properties": {
                     "task": {"type": "string", "description": "The complex task description."},
                     "target_dir": {"type": "string", "description": "Absolute path to the project root."},
                     "task_id": {"type": "string", "description": "Unique slug for the task."},
-                    "isolate": {"type": "boolean", "description": "Defaults to True. If False, modifications happen directly on the active branch without stashing.", "default": True}
+                    "isolate": {"type": "boolean", "description": "Defaults to True. If False, modifications happen directly on the active branch without stashing.", "default": True},
+                    "resume": {"type": "boolean", "description": "Defaults to True. If an earlier run of this task_id was interrupted (server restart, cancellation), continue from its last completed step instead of re-planning. A checkpoint whose task text differs from this call is discarded.", "default": True},
+                    "isolation_mode": {"type": "string", "enum": list(ISOLATION_MODES), "description": "How isolate=True is enforced. 'worktree' (default) gives the task its own git worktree so parallel tasks and the IDE checkout never collide; 'branch' stashes and checks out a feature branch in place."}
                 },
                 "required": ["task", "target_dir", "task_id"]
             }
+        ),
+        types.Tool(
+            name="get_task_status",
+            description="Returns the status (queued/running/completed/failed/cancelled) and latest progress message of a delegated job.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "job_id": {"type": "string", "description": "The job_id returned by delegate_to_nexus."}
+                },
+                "required": ["job_id"]
+            }
+        ),
+        types.Tool(
+            name="get_task_result",
+            description="Returns the final report of a delegated job. Optionally waits up to 'wait_seconds' for it to finish, streaming progress notifications meanwhile.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "job_id": {"type": "string", "description": "The job_id returned by delegate_to_nexus."},
+                    "wait_seconds": {"type": "number", "description": f"Seconds to wait for completion (max {MAX_RESULT_WAIT_SECONDS}). Defaults to 0.", "default": 0}
+                },
+                "required": ["job_id"]
+            }
+        ),
+        types.Tool(
+            name="cancel_task",
+            description="Cancels a queued or running delegated job. Running jobs stop after their current graph step.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "job_id": {"type": "string", "description": "The job_id returned by delegate_to_nexus."}
+                },
+                "required": ["job_id"]
+            }
         )
     ]
 
 @server.call_tool()
 async def call_tool(name: str, arguments: dict[str, Any]) -> list[types.TextContent]:
-    if name != "delegate_to_nexus":
-        raise ValueError(f"Tool {name} not found")
+    if name == "delegate_to_nexus":
+        return delegate_to_nexus(arguments)
+    if name == "get_task_status":
+        job = _get_job(arguments["job_id"])
+        return [types.TextContent(type="text", text=json.dumps(job.to_dict(), indent=2))]
+    if name == "get_task_result":
+        return await get_task_result(arguments)
+    if name == "cancel_task":
+        cancelled = task_queue.cancel(arguments["job_id"])
+        job = _get_job(arguments["job_id"])
+        text = f"Cancellation requested for job {job.job_id}." if cancelled else f"Job {job.job_id} is already {job.status}."
+        return [types.TextContent(type="text", text=text)]
+    raise ValueError(f"Tool {name} not found")
+
+METRICS_URI = "nexus://metrics"
+
+@server.list_resources()
+async def list_resources() -> list[types.Resource]:
+    resources = [
+        types.Resource(
+            uri=METRICS_URI,
+            name="metrics",
+            description="Server metrics in Prometheus text format: delegations per status, queue depth, node/LLM/tool latency histograms, LLM tokens and cost per model, verify retries and escalations.",
+            mimeType="text/plain"
+        )
+    ]
+    for handoff in handoffs.list():
+        resources.append(types.Resource(
+            uri=handoff.uri,
+            name=f"handoff {handoff.handoff_id}",
+            description=f"Diff summary of job {handoff.handoff_id} ({len(handoff.files)} files) with links to its paginated full and per-file diffs.",
+            mimeType="text/plain"
+        ))
+    return resources
+
+@server.list_resource_templates()
+async def list_resource_templates() -> list[types.ResourceTemplate]:
+    return [
+        types.ResourceTemplate(
+            uriTemplate=HANDOFF_URI_PREFIX + "{job_id}/diff{?page}",
+            name="handoff diff",
+            description="Full diff of a finished delegation, one page at a time (each page names the next).",
+            mimeType=DIFF_MIME_TYPE
+        ),
+        types.ResourceTemplate(
+            uriTemplate=HANDOFF_URI_PREFIX + "{job_id}/file/{path}{?page}",
+            name="handoff file diff",
+            description="Diff of one changed file (URL-encoded path) of a finished delegation, paginated.",
+            mimeType=DIFF_MIME_TYPE
+        )
+    ]
+
+@server.read_resource()
+async def read_resource(uri) -> list[ReadResourceContents]:
+    uri = str(uri)
+    if uri == METRICS_URI:
+        return [ReadResourceContents(content=render_metrics(), mime_type=METRICS_CONTENT_TYPE)]
+    if uri.startswith(HANDOFF_URI_PREFIX):
+        # Diff pages are streamed from git; keep that off the event loop
+        text = await asyncio.to_thread(handoffs.read, uri)
+        is_index = "/" not in uri[len(HANDOFF_URI_PREFIX):].split("?")[0]
+        return [ReadResourceContents(content=text, mime_type="text/plain" if is_index else DIFF_MIME_TYPE)]
+    raise ValueError(f"Resource {uri} not found")
+
+def _get_job(job_id: str) -> TaskJob:
+    job = task_queue.get(job_id)
+    if job is None:
+        raise ValueError(f"Unknown job_id: {job_id}")
+    return job
+
+def delegate_to_nexus(arguments: dict[str, Any]) -> list[types.TextContent]:
+    """Submits the delegation to the background worker pool and returns its job id right away."""
+    task_id = arguments["task_id"]
+    job = task_queue.submit(task_id, arguments["task"], lambda job: traced_delegation(job, arguments))
+    message = (
+        f"Task '{task_id}' accepted as job_id: {job.job_id}\n"
+        f"Poll it with 'get_task_status' and collect the final diff with 'get_task_result' "
+        f"(pass 'wait_seconds' to block until it finishes)."
+    )
+    return [types.TextContent(type="text", text=message)]
+
+async def get_task_result(arguments: dict[str, Any]) -> list[types.TextContent]:
+    job = _get_job(arguments["job_id"])
+    wait_seconds = min(float(arguments.get("wait_seconds", 0) or 0), MAX_RESULT_WAIT_SECONDS)
+
+    if not job.done and wait_seconds > 0:
+        listener = _progress_listener()
+        if listener:
+            job.subscribe(listener)
+        try:
+            await asyncio.to_thread(job.wait, wait_seconds)
+        finally:
+            if listener:
+                job.unsubscribe(listener)
 
+    if job.status == "completed":
+        return [types.TextContent(type="text", text=job.result)]
+    if job.done:
+        return [types.TextContent(type="text", text=f"Job {job.job_id} {job.status}: {job.error}")]
+    return [types.TextContent(type="text", text=f"Job {job.job_id} is still {job.status}. Latest progress: {job.message}")]
+
+def _progress_listener() -> Optional[Any]:
+    """
+    Builds a listener that relays job progress as MCP progress notifications
+    for the current request, if the client asked for them with a progressToken.
+    """
+    try:
+        ctx = server.request_context
+    except LookupError:
+        return None
+    token = ctx.meta.progressToken if ctx.meta else None
+    if token is None:
+        return None
+
+    loop = asyncio.get_running_loop()
+    session = ctx.session
+
+    def listener(job: TaskJob):
+        asyncio.run_coroutine_threadsafe(
+            session.send_progress_notification(token, job.progress, job.total, job.message),
+            loop
+        )
+    return listener
+
+def traced_delegation(job: TaskJob, arguments: dict[str, Any]) -> str:
+    """Runs the delegation as the root span of its trace."""
+    with optimizer.span("delegation", kind="task", task_id=arguments["task_id"], job_id=job.job_id):
+        return run_delegation(job, arguments)
+
+def run_delegation(job: TaskJob, arguments: dict[str, Any]) -> str:
+    """Runs a full delegation on a worker thread. Returns the report sent back to the IDE."""
     task = arguments["task"]
     target_dir = arguments["target_dir"]
     task_id = arguments["task_id"]
@@ -42,33 +219,75 @@ async def call_tool(name: str, arguments: dict[str, Any]) -> list[types.TextCont
     logger.info(f"Received Delegation for Task: {task_id} (Isolate: {isolate})")
     
     # 1. Absolute Isolation (Optional)
-    sandbox = GitSandbox(target_dir)
+    sandbox = GitSandbox(target_dir, isolation_mode=arguments.get("isolation_mode"))
     branch = sandbox.enter_sandbox(task_id, isolate=isolate)
+    job.report_progress(message=f"Sandbox ready on branch '{branch}' in {sandbox.work_dir}.")
     
-    # 2. Multi-Orchestrator Invocation
-    graph = build_graph()
+    # 2. Multi-Orchestrator Invocation (checkpointed per repository + task_id)
+    graph = get_graph()
+    thread_id = f"{repo_key(target_dir)}:{task_id}"
+    config = {"configurable": {"thread_id": thread_id}}
     initial_state = {
         "task_description": task,
-        "target_dir": target_dir,
+        "target_dir": str(sandbox.work_dir),
         "retries": 0,
         "status": "started",
         "plan": "",
         "crew_result": "",
-        "verification_errors": ""
+        "verification_errors": "",
+        "verification_failures": [],
+        "snapshot_id": ""
     }
     
-    logger.info("Executing Macro-Orchestrator...")
-    final_state = graph.invoke(initial_state)
+    snapshot = graph.get_state(config) if graph.checkpointer else None
+    snapshots = get_workspace_snapshots(sandbox.work_dir)
+    resumable = bool(snapshot and snapshot.next and arguments.get("resume", True))
+    if resumable and snapshot.values.get("task_description") != task:
+        # The task_id was reused for different work: continuing would silently run the old task
+        logger.info(f"Task text for {task_id} differs from its checkpoint; discarding it and starting fresh")
+        job.report_progress(message="Checkpoint belongs to a different task description; starting fresh.")
+        resumable = False
+    if resumable:
+        # An earlier run of this task was interrupted (crash, cancel, restart): continue after its last completed node
+        graph_input = None
+        final_state = dict(snapshot.values)
+        if final_state.get("target_dir") != str(sandbox.work_dir):
+            graph.update_state(config, {"target_dir": str(sandbox.work_dir)})
+            final_state["target_dir"] = str(sandbox.work_dir)
+        logger.info(f"Resuming Macro-Orchestrator for {task_id} at node(s) {', '.join(snapshot.next)} (retries: {final_state.get('retries', 0)})")
+        job.report_progress(message=f"Resuming from checkpoint at node '{snapshot.next[0]}'.")
+    else:
+        if snapshot and snapshot.values:
+            clear_checkpoints(thread_id)
+            discard_task_snapshot(snapshot.values)
+        # Created up front so the first checkpoint already carries it (a resumed task rolls back into the same one)
+        initial_state["snapshot_id"] = snapshots.begin()
+        graph_input = initial_state
+        final_state = dict(initial_state)
+        logger.info("Executing Macro-Orchestrator...")
+    
+    # Stream node by node so progress can be reported and cancellation honoured between steps
+    try:
+        for step in graph.stream(graph_input, config):
+            for node_name, update in step.items():
+                final_state.update(update or {})
+                job.report_progress(message=f"Node '{node_name}' finished with status: {final_state.get('status')}")
+            job.check_cancelled()
+    except BaseException:
+        # Without a checkpoint the task cannot be resumed, so nothing will ever roll back into its snapshot
+        if not graph.checkpointer:
+            discard_task_snapshot(final_state)
+        raise
     logger.info(f"Macro-Orchestrator finished with status: {final_state.get('status')}")
     
     # 3. Pull Handoff
     try:
-        diff = sandbox.prepare_pr_handoff()
-        if not diff:
-            diff = "No codebase changes detected upon verification."
+        # Only a --stat summary and a capped excerpt go into the reply; the full diff is served as paginated resources
+        base, head = sandbox.commit_handoff()
+        handoff = handoffs.register(Handoff(job.job_id, sandbox.target_dir, base, head))
+        diff = summarize_handoff(handoff)
             
         pr_link = "No GITHUB_TOKEN or GITHUB_REPO env var found. Skipped Auto-PR."
-        import os
         github_token = os.getenv("GITHUB_TOKEN")
         repo_name = os.getenv("GITHUB_REPO")
         if github_token and repo_name:
@@ -89,10 +308,16 @@ async def call_tool(name: str, arguments: dict[str, Any]) -> list[types.TextCont
                 pr_link = f"✅ Draft Pull Request Created Automatically! {pr.html_url}"
             except Exception as e:
                 pr_link = f"Attempted to create PR but failed: {e}"
-                
     except Exception as e:
         diff = f"Failed to retrieve git diff: {e}"
         pr_link = "Skipped PR creation due to diff failure."
+    else:
+        # The work is committed to the task branch now, so the worktree and the saved graph state can go
+        for cleanup in (sandbox.cleanup_sandbox, lambda: clear_checkpoints(thread_id)):
+            try:
+                cleanup()
+            except Exception as e:
+                logger.warning(f"Cleanup after the handoff of {task_id} failed (the diff is unaffected): {e}")
         
     final_status = final_state.get('status')
     escalation_notes = final_state.get('verification_errors', '')
@@ -102,8 +327,8 @@ async def call_tool(name: str, arguments: dict[str, Any]) -> list[types.TextCont
         f"Final Architecture Status: {final_status}\n"
         f"Escalation Notes / Errors: {escalation_notes}\n\n"
         f"--- GitHub DevOps Automation ---\n{pr_link}\n\n"
-        f"--- Resulting Git Diff ---\n{diff}\n"
+        f"--- Resulting Git Diff (summary) ---\n{diff}\n"
         f"\n(Please review the diff. Then, run `git merge {branch}` if satisfied.)"
     )
     
-    return [types.TextContent(type="text", text=message)]
+    return message